@@ -14,3 +14,16 @@ if str(project_root) not in sys.path:
 backend_path = Path(__file__).resolve().parent
 if str(backend_path) not in sys.path:
     sys.path.insert(0, str(backend_path))
+
+# Modules holding process-wide state (analyzer cache, SQLite stores, Redis
+# clients). Siblings import them by bare name; each registers itself under the
+# "back_end." name too, and this hook resolves package attribute access to
+# that same object, so Celery ("back_end.tasks") and Flask share one copy.
+_SHARED_MODULES = ("analyzer_factory", "analysis_store", "cache")
+
+
+def __getattr__(name):
+    if name in _SHARED_MODULES:
+        import importlib
+        return importlib.import_module(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,620 @@
+"""SQLite storage layer for the room analyzer (property_analyses / analysis_results).
+
+* The DB path comes from ``ANALYSIS_DB_PATH`` (default: ``back_end/real_estate_analysis.db``).
+* Each thread keeps one long-lived connection instead of connecting per call.
+  sqlite3 connections are not shareable across threads by default, and the
+  Flask / Celery workers already run each request on its own thread.
+* Connections run in WAL mode, so readers (web UI) no longer block the writer
+  (scraper / analyzer). ``busy_timeout`` absorbs the remaining writer-vs-writer
+  contention instead of failing with "database is locked".
+* SQL text is kept in module constants. sqlite3 caches prepared statements per
+  connection keyed by SQL text, so reusing the same strings on a persistent
+  connection skips re-parsing.
+* Tables are created by ``migrations.py`` at boot, not here.
+* Wide JSON payloads (raw Gemini response, result dicts, feature lists) live
+  compressed in ``analysis_payloads`` and are only read when asked for, so
+  scans of ``analysis_results`` touch compact typed columns only. A rewrite
+  replaces the whole set, and deleting a result deletes its payloads
+  (trigger).
+* Every scrape write that carries the Otodom id also records a price/status
+  observation. History is keyed by that numeric id everywhere (scrape rows,
+  ``HistorySink``, ``touch_listings``), never by the detail URL. History rows
+  are appended only when something changed; ``listing_latest`` (trigger
+  maintained) answers current-price and recent-drop queries. Scheduled
+  crawls record through ``scrape_sinks.HistorySink``, which also marks
+  listings that stopped appearing as ``removed``.
+* ``geo_gazetteer`` holds street-level coordinates for the geocoding stage
+  (``geocoding.py``); lookups are primary-key probes.
+"""
+from __future__ import annotations
+
+import logging
+import math
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import zstandard as _zstd  # optional, better ratio and faster than zlib
+except ImportError:  # pragma: no cover - depends on environment
+    _zstd = None
+
+logger = logging.getLogger(__name__)
+
+# One module object whether imported as "analysis_store" or "back_end.analysis_store", so
+# routes and tasks share the process-wide state held here.
+sys.modules.setdefault("analysis_store", sys.modules[__name__])
+sys.modules.setdefault("back_end.analysis_store", sys.modules[__name__])
+
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "real_estate_analysis.db")
+
+
+def default_db_path() -> str:
+    return os.getenv("ANALYSIS_DB_PATH") or DEFAULT_DB_PATH
+
+
+def sqlalchemy_uri(path: Optional[str] = None) -> str:
+    """SQLAlchemy URI pointing at the same file the analyzer writes to."""
+    return f"sqlite:///{os.path.abspath(path or default_db_path())}"
+
+
+# ----------------- Statements -----------------
+UPSERT_SCRAPE_SQL = """
+    INSERT INTO property_analyses (
+        listing_id, scraped_title, scraped_street_address, scraped_price,
+        scraped_area, scraped_latitude, scraped_longitude, otodom_id, analysis_timestamp
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(listing_id) DO UPDATE SET
+        scraped_title = excluded.scraped_title,
+        scraped_street_address = excluded.scraped_street_address,
+        scraped_price = excluded.scraped_price,
+        scraped_area = excluded.scraped_area,
+        scraped_latitude = excluded.scraped_latitude,
+        scraped_longitude = excluded.scraped_longitude,
+        otodom_id = COALESCE(excluded.otodom_id, property_analyses.otodom_id),
+        analysis_timestamp = excluded.analysis_timestamp
+"""
+
+HISTORY_ID_SQL = "SELECT otodom_id FROM property_analyses WHERE listing_id = ?"
+
+# History written under the detail URL before migration 9 is folded into the
+# Otodom id the first time a scrape write carries both.
+FOLD_HISTORY_SQL = "UPDATE OR IGNORE listing_price_history SET listing_id = ?2 WHERE listing_id = ?1"
+
+FOLD_LATEST_SQL = """
+    INSERT INTO listing_latest (
+        listing_id, price, previous_price, status, first_seen, last_seen, changed_at, price_changed_at
+    )
+    SELECT ?2, price, previous_price, status, first_seen, last_seen, changed_at, price_changed_at
+    FROM listing_latest WHERE listing_id = ?1
+    ON CONFLICT(listing_id) DO UPDATE SET
+        first_seen = MIN(listing_latest.first_seen, excluded.first_seen),
+        last_seen = MAX(listing_latest.last_seen, excluded.last_seen)
+"""
+
+DROP_URL_HISTORY_SQL = [
+    "DELETE FROM listing_price_history WHERE listing_id = ?",
+    "DELETE FROM listing_latest WHERE listing_id = ?",
+]
+
+# Append only when price or status differs from the latest state; an
+# unchanged re-scrape just bumps last_seen.
+RECORD_OBSERVATION_SQL = """
+    INSERT OR IGNORE INTO listing_price_history (listing_id, observed_at, price, status)
+    SELECT ?1, ?2, ?3, ?4
+    WHERE NOT EXISTS (
+        SELECT 1 FROM listing_latest WHERE listing_id = ?1 AND price IS ?3 AND status IS ?4
+    )
+"""
+
+TOUCH_LATEST_SQL = "UPDATE listing_latest SET last_seen = MAX(last_seen, ?2) WHERE listing_id = ?1"
+
+# Active listings not seen since a cut-off (candidates for status 'removed').
+# URL-keyed rows left from before migration 9 are never touched by unchanged
+# re-sightings (those carry the Otodom id), so they are not judged here.
+STALE_ACTIVE_SQL = """
+    SELECT listing_id, price, last_seen FROM listing_latest
+    WHERE status = 'active' AND last_seen < ? AND listing_id NOT LIKE 'http%'
+"""
+
+RESTORE_LAST_SEEN_SQL = "UPDATE listing_latest SET last_seen = ?2 WHERE listing_id = ?1"
+
+LATEST_FIELDS = ("listing_id", "price", "previous_price", "status", "first_seen", "last_seen",
+                 "changed_at", "price_changed_at")
+
+PRICE_DROPS_SQL = """
+    SELECT listing_id, price, previous_price, price_changed_at
+    FROM listing_latest INDEXED BY idx_listing_latest_price_change
+    WHERE price_changed_at >= ? AND price < previous_price
+    ORDER BY price_changed_at DESC
+    LIMIT ? OFFSET ?
+"""
+
+PRICE_HISTORY_SQL = """
+    SELECT observed_at, price, status FROM listing_price_history
+    WHERE listing_id = ? ORDER BY observed_at
+"""
+
+# Running mean, so repeated observations of a street converge on its centroid.
+LEARN_GAZETTEER_SQL = """
+    INSERT INTO geo_gazetteer (address_key, latitude, longitude, samples, updated_at)
+    VALUES (?1, ?2, ?3, 1, ?4)
+    ON CONFLICT(address_key) DO UPDATE SET
+        latitude = (latitude * samples + excluded.latitude) / (samples + 1),
+        longitude = (longitude * samples + excluded.longitude) / (samples + 1),
+        samples = samples + 1,
+        updated_at = excluded.updated_at
+"""
+
+
+def utc_timestamp(when: Optional[datetime] = None) -> str:
+    """UTC time in SQLite's ``CURRENT_TIMESTAMP`` format (sorts lexically)."""
+    return (when or datetime.now(timezone.utc)).astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+ANALYSIS_RESULT_COLUMNS = (
+    "analysis_id", "listing_id", "total_images", "successfully_classified",
+    "unique_rooms_detected", "duplicate_images_found", "execution_time", "batch_mode_used",
+    "status", "progress", "message", "created_at",
+    "room_summary", "avg_impression_score", "dominant_clutter_level", "max_renovation_need",
+    "property_summary_text", "key_features_text", "visible_issues_text", "raw_gemini_response",
+    "overall_condition", "dominant_style", "overall_lighting", "numeric_visual_features_json",
+    "overall_impression_score_avg", "overall_impression_score_median", "clutter_level_mode",
+    "estimated_renovation_need_mode", "habitable_room_ratio", "duplicate_ratio", "total_unique_rooms",
+)
+
+SAVE_ANALYSIS_SQL = (
+    f"INSERT OR REPLACE INTO analysis_results ({', '.join(ANALYSIS_RESULT_COLUMNS)}) "
+    f"VALUES ({', '.join('?' for _ in ANALYSIS_RESULT_COLUMNS)})"
+)
+
+# ----------------- Compressed payloads -----------------
+# analysis_results columns whose content is stored in analysis_payloads instead (kind = column name).
+PAYLOAD_COLUMNS = (
+    "raw_gemini_response",
+    "room_summary",
+    "key_features_text",
+    "visible_issues_text",
+    "numeric_visual_features_json",
+)
+
+PUT_PAYLOAD_SQL = """
+    INSERT OR REPLACE INTO analysis_payloads (analysis_id, kind, codec, raw_size, data)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+GET_PAYLOAD_SQL = "SELECT codec, data FROM analysis_payloads WHERE analysis_id = ? AND kind = ?"
+
+DELETE_PAYLOAD_SQL = "DELETE FROM analysis_payloads WHERE analysis_id = ? AND kind = ?"
+
+DELETE_PAYLOADS_SQL = "DELETE FROM analysis_payloads WHERE analysis_id = ?"
+
+
+def encode_payload(text: str) -> Tuple[str, bytes]:
+    """Compress ``text``; returns ``(codec, blob)``."""
+    raw = text.encode("utf-8")
+    if _zstd is not None:
+        return "zstd", _zstd.ZstdCompressor(level=6).compress(raw)
+    return "zlib", zlib.compress(raw, 6)
+
+
+def decode_payload(codec: str, blob: bytes) -> str:
+    if codec == "zlib":
+        return zlib.decompress(blob).decode("utf-8")
+    if codec == "zstd":
+        if _zstd is None:
+            raise RuntimeError("Payload is zstd-compressed but the 'zstandard' package is not installed")
+        return _zstd.ZstdDecompressor().decompress(blob).decode("utf-8")
+    if codec == "none":
+        return bytes(blob).decode("utf-8")
+    raise ValueError(f"Unknown payload codec: {codec}")
+
+
+def iter_payloads(conn: sqlite3.Connection, kind: str) -> Iterator[Tuple[str, str]]:
+    """Yield ``(analysis_id, text)`` for one payload kind from any DB file.
+
+    Also yields values still inline in ``analysis_results`` so scripts work
+    against databases that have not been migrated yet.
+    """
+    if kind not in PAYLOAD_COLUMNS:
+        raise ValueError(f"Unknown payload kind: {kind}")
+    try:
+        for analysis_id, codec, data in conn.execute(
+            "SELECT analysis_id, codec, data FROM analysis_payloads WHERE kind = ?", (kind,)
+        ):
+            yield analysis_id, decode_payload(codec, data)
+    except sqlite3.OperationalError:
+        pass  # no analysis_payloads table (pre-migration DB)
+    yield from conn.execute(
+        f"SELECT analysis_id, {kind} FROM analysis_results WHERE {kind} IS NOT NULL"
+    )
+
+
+MAP_LISTINGS_SQL = """
+    SELECT listing_id, scraped_title, scraped_street_address, scraped_price,
+           scraped_area, scraped_latitude, scraped_longitude
+    FROM property_analyses
+    WHERE scraped_latitude IS NOT NULL AND scraped_longitude IS NOT NULL
+"""
+
+# API field name -> property_analyses column, for projection in spatial queries.
+LISTING_FIELDS = {
+    "id": "p.listing_id",
+    "title": "p.scraped_title",
+    "address": "p.scraped_street_address",
+    "price": "p.scraped_price",
+    "area": "p.scraped_area",
+    "latitude": "p.scraped_latitude",
+    "longitude": "p.scraped_longitude",
+    "detail_url": "p.listing_id",
+    "analysis_timestamp": "p.analysis_timestamp",
+}
+MAP_FIELDS = ("id", "title", "address", "price", "area", "latitude", "longitude", "detail_url")
+MAX_PAGE_SIZE = 2000
+
+# The R*Tree (migration 3) narrows candidates; the exact BETWEEN re-check
+# drops the float32 rounding slack of rtree coordinates.
+BBOX_SQL = """
+    SELECT {columns}
+    FROM property_geo g JOIN property_analyses p ON p.rowid = g.id
+    WHERE g.max_lat >= ? AND g.min_lat <= ? AND g.max_lon >= ? AND g.min_lon <= ?
+      AND p.scraped_latitude BETWEEN ? AND ? AND p.scraped_longitude BETWEEN ? AND ?
+    ORDER BY p.rowid
+    LIMIT ? OFFSET ?
+"""
+
+TILE_POINTS_SQL = """
+    SELECT p.listing_id, p.scraped_latitude, p.scraped_longitude, p.scraped_price, p.scraped_area, p.scraped_title
+    FROM property_geo g JOIN property_analyses p ON p.rowid = g.id
+    WHERE g.max_lat >= ? AND g.min_lat <= ? AND g.max_lon >= ? AND g.min_lon <= ?
+      AND p.scraped_latitude >= ? AND p.scraped_latitude < ?
+      AND p.scraped_longitude >= ? AND p.scraped_longitude < ?
+"""
+
+NEARBY_SQL = """
+    SELECT {columns}, distance_m FROM (
+        SELECT p.*, haversine_m(?, ?, p.scraped_latitude, p.scraped_longitude) AS distance_m
+        FROM property_geo g JOIN property_analyses p ON p.rowid = g.id
+        WHERE g.max_lat >= ? AND g.min_lat <= ? AND g.max_lon >= ? AND g.min_lon <= ?
+    ) AS p
+    WHERE distance_m <= ?
+    ORDER BY distance_m
+    LIMIT ? OFFSET ?
+"""
+
+_EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat1: float, lon1: float, lat2: float, lon2: float) -> Optional[float]:
+    """Great-circle distance in metres (registered as an SQL function)."""
+    if None in (lat1, lon1, lat2, lon2):
+        return None
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * _EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _projection(fields: Optional[Iterable[str]]) -> List[str]:
+    selected = list(dict.fromkeys(fields)) if fields else list(MAP_FIELDS)
+    unknown = [f for f in selected if f not in LISTING_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+
+def _page(limit: int, offset: int) -> tuple:
+    return max(1, min(int(limit), MAX_PAGE_SIZE)), max(0, int(offset))
+
+
+class AnalysisStore:
+    def __init__(self, path: Optional[str] = None, *, busy_timeout_ms: int = 5000,
+                 cache_size_kib: int = 16384, mmap_size: int = 256 * 1024 * 1024,
+                 cached_statements: int = 128) -> None:
+        self.path = path or default_db_path()
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+
+    # ----------------- Connections -----------------
+    def _connect(self) -> sqlite3.Connection:
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            cached_statements=self.cached_statements,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable across application crashes in WAL mode; only an OS
+        # crash can lose the last transactions, which a re-scrape recovers.
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kib)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute("PRAGMA foreign_keys=OFF")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.create_function("haversine_m", 4, haversine_m, deterministic=True)
+        return conn
+
+    def connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            logger.debug("Opened SQLite connection to %s (thread %s)", self.path, threading.get_ident())
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Commit on success, roll back on error."""
+        conn = self.connection()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def close(self) -> None:
+        """Close the calling thread's connection (if any)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ----------------- Writes -----------------
+    def upsert_listing_scrape(self, listing_id: str, title: Optional[str], street_address: Optional[str],
+                              price: Optional[float], area: Optional[float],
+                              latitude: Optional[float], longitude: Optional[float],
+                              otodom_id: Optional[str] = None) -> None:
+        self.upsert_listing_scrapes([(listing_id, title, street_address, price, area, latitude, longitude, otodom_id)])
+
+    def upsert_listing_scrapes(self, rows: Sequence[Sequence]) -> int:
+        """Upsert many ``(listing_id, title, street_address, price, area, lat, lon[, otodom_id])`` rows in one transaction.
+
+        ``listing_id`` is the detail URL. Price history is keyed by the numeric
+        ``otodom_id``, like ``HistorySink`` and ``touch_listings``; rows without
+        one update property_analyses only.
+        """
+        if not rows:
+            return 0
+        rows = [tuple(r) + (None,) * (8 - len(r)) for r in rows]
+        with self.transaction() as conn:
+            conn.executemany(UPSERT_SCRAPE_SQL, rows)
+            keyed = [r for r in rows if r[7] is not None]
+            self._fold_url_history(conn, [(r[0], str(r[7])) for r in keyed])
+            self._record_observations(conn, [(str(r[7]), r[3], "active") for r in keyed], utc_timestamp())
+        return len(rows)
+
+    @staticmethod
+    def _fold_url_history(conn: sqlite3.Connection, keyed: Sequence[Tuple[str, str]]) -> None:
+        if not keyed:
+            return
+        placeholders = ", ".join("?" * len(keyed))
+        legacy = {row[0] for row in conn.execute(
+            f"SELECT listing_id FROM listing_latest WHERE listing_id IN ({placeholders})",
+            tuple(url for url, _ in keyed),
+        )}
+        pairs = [(url, otodom_id) for url, otodom_id in keyed if url in legacy]
+        if not pairs:
+            return
+        conn.executemany(FOLD_HISTORY_SQL, pairs)
+        conn.executemany(FOLD_LATEST_SQL, pairs)
+        for statement in DROP_URL_HISTORY_SQL:
+            conn.executemany(statement, [(url,) for url, _ in pairs])
+        logger.info("Folded URL-keyed price history of %d listings into their Otodom ids", len(pairs))
+
+    def record_observations(self, rows: Sequence[Sequence], observed_at: Optional[str] = None) -> None:
+        """Record ``(listing_id, price, status)`` observations, e.g. ``status='removed'`` for delisted ids."""
+        with self.transaction() as conn:
+            self._record_observations(conn, rows, observed_at or utc_timestamp())
+
+    def touch_listings(self, listing_ids: Sequence[str], seen_at: Optional[str] = None) -> int:
+        """Bump ``last_seen`` of listings re-seen unchanged (one UPDATE, no history row)."""
+        if not listing_ids:
+            return 0
+        placeholders = ", ".join("?" * len(listing_ids))
+        with self.transaction() as conn:
+            return conn.execute(
+                f"UPDATE listing_latest SET last_seen = MAX(last_seen, ?) WHERE listing_id IN ({placeholders})",
+                (seen_at or utc_timestamp(), *listing_ids),
+            ).rowcount
+
+    def mark_removed(self, not_seen_since: str, observed_at: Optional[str] = None) -> int:
+        """Record ``status='removed'`` for active listings last seen before ``not_seen_since``.
+
+        The observation keeps the listing's last price. ``last_seen`` stays at the
+        last sighting, so ``first_seen``..``last_seen`` is the time on market.
+        """
+        observed_at = observed_at or utc_timestamp()
+        with self.transaction() as conn:
+            stale = conn.execute(STALE_ACTIVE_SQL, (not_seen_since,)).fetchall()
+            conn.executemany(RECORD_OBSERVATION_SQL, [(i, observed_at, price, "removed") for i, price, _ in stale])
+            conn.executemany(RESTORE_LAST_SEEN_SQL, [(i, last_seen) for i, _, last_seen in stale])
+        return len(stale)
+
+    @staticmethod
+    def _record_observations(conn: sqlite3.Connection, rows: Sequence[Sequence], observed_at: str) -> None:
+        # An active listing without a price says nothing about its price: only bump last_seen.
+        params = [(listing_id, observed_at, price, status) for listing_id, price, status in rows
+                  if price is not None or status != "active"]
+        conn.executemany(RECORD_OBSERVATION_SQL, params)
+        conn.executemany(TOUCH_LATEST_SQL, [(row[0], observed_at) for row in rows])
+
+    def learn_gazetteer(self, rows: Sequence[Sequence]) -> None:
+        """Fold ``(address_key, lat, lon)`` observations into ``geo_gazetteer``."""
+        if not rows:
+            return
+        now = utc_timestamp()
+        with self.transaction() as conn:
+            conn.executemany(LEARN_GAZETTEER_SQL, [(key, lat, lon, now) for key, lat, lon in rows])
+
+    def save_analysis(self, row: Sequence, payloads: Optional[Dict[str, Optional[str]]] = None) -> None:
+        """Insert/replace one analysis_results row, values in ``ANALYSIS_RESULT_COLUMNS`` order.
+
+        ``payloads`` (kind -> JSON text, kinds from ``PAYLOAD_COLUMNS``) are
+        compressed into analysis_payloads in the same transaction. They replace
+        every payload stored for the previous version of the row: kinds that
+        are missing or ``None`` are deleted.
+        """
+        if len(row) != len(ANALYSIS_RESULT_COLUMNS):
+            raise ValueError(f"Expected {len(ANALYSIS_RESULT_COLUMNS)} values, got {len(row)}")
+        with self.transaction() as conn:
+            conn.execute(SAVE_ANALYSIS_SQL, tuple(row))
+            conn.execute(DELETE_PAYLOADS_SQL, (row[0],))
+            self._put_payloads(conn, row[0], payloads or {})
+
+    def put_payloads(self, analysis_id: str, payloads: Dict[str, Optional[str]]) -> None:
+        """Write the given kinds only; a ``None`` value deletes that kind."""
+        with self.transaction() as conn:
+            self._put_payloads(conn, analysis_id, payloads)
+
+    @staticmethod
+    def _put_payloads(conn: sqlite3.Connection, analysis_id: str, payloads: Dict[str, Optional[str]]) -> None:
+        rows, removed = [], []
+        for kind, text in payloads.items():
+            if kind not in PAYLOAD_COLUMNS:
+                raise ValueError(f"Unknown payload kind: {kind}")
+            if text is None:
+                removed.append((analysis_id, kind))
+                continue
+            codec, blob = encode_payload(text)
+            rows.append((analysis_id, kind, codec, len(text), blob))
+        if removed:
+            conn.executemany(DELETE_PAYLOAD_SQL, removed)
+        if rows:
+            conn.executemany(PUT_PAYLOAD_SQL, rows)
+
+    def get_payload(self, analysis_id: str, kind: str) -> Optional[str]:
+        """Decompress one stored payload on demand (``None`` if absent)."""
+        row = self.connection().execute(GET_PAYLOAD_SQL, (analysis_id, kind)).fetchone()
+        return decode_payload(*row) if row else None
+
+    # ----------------- Reads -----------------
+    def fetch_map_listings(self) -> List[Dict]:
+        rows = self.connection().execute(MAP_LISTINGS_SQL).fetchall()
+        return [
+            {
+                "id": row[0],  # listing_id doubles as the map id and detail URL
+                "title": row[1],
+                "address": row[2],
+                "price": row[3],
+                "area": row[4],
+                "latitude": row[5],
+                "longitude": row[6],
+                "detail_url": row[0],
+            }
+            for row in rows
+        ]
+
+
+    def fetch_listings_in_bbox(self, south: float, west: float, north: float, east: float,
+                               limit: int = 500, offset: int = 0,
+                               fields: Optional[Iterable[str]] = None) -> List[Dict]:
+        """Listings inside a lat/lon box, one page at a time, with only ``fields`` selected."""
+        selected = _projection(fields)
+        limit, offset = _page(limit, offset)
+        sql = BBOX_SQL.format(columns=", ".join(LISTING_FIELDS[f] for f in selected))
+        rows = self.connection().execute(
+            sql, (south, north, west, east, south, north, west, east, limit, offset)
+        ).fetchall()
+        return [dict(zip(selected, row)) for row in rows]
+
+    def fetch_listings_nearby(self, lat: float, lon: float, radius_m: float,
+                              limit: int = 100, offset: int = 0,
+                              fields: Optional[Iterable[str]] = None) -> List[Dict]:
+        """Listings within ``radius_m`` of a point, nearest first, with ``distance_m`` added."""
+        selected = _projection(fields)
+        limit, offset = _page(limit, offset)
+        dlat = radius_m / 111320.0
+        dlon = radius_m / (111320.0 * max(math.cos(math.radians(lat)), 1e-6))
+        sql = NEARBY_SQL.format(columns=", ".join(LISTING_FIELDS[f] for f in selected))
+        rows = self.connection().execute(
+            sql, (lat, lon, lat - dlat, lat + dlat, lon - dlon, lon + dlon, radius_m, limit, offset)
+        ).fetchall()
+        return [dict(zip(selected + ["distance_m"], row)) for row in rows]
+
+
+    def fetch_latest(self, listing_ids: Sequence[str]) -> List[Dict]:
+        """Current price/status and first/last seen for ``listing_ids`` (primary-key lookups)."""
+        if not listing_ids:
+            return []
+        placeholders = ", ".join("?" * len(listing_ids))
+        rows = self.connection().execute(
+            f"SELECT {', '.join(LATEST_FIELDS)} FROM listing_latest WHERE listing_id IN ({placeholders})",
+            tuple(listing_ids),
+        ).fetchall()
+        return [dict(zip(LATEST_FIELDS, row)) for row in rows]
+
+    def fetch_price_drops(self, days: float = 7, limit: int = 500, offset: int = 0) -> List[Dict]:
+        """Listings whose latest price change in the last ``days`` was a drop, newest first."""
+        limit, offset = _page(limit, offset)
+        since = utc_timestamp(datetime.now(timezone.utc) - timedelta(days=days))
+        rows = self.connection().execute(PRICE_DROPS_SQL, (since, limit, offset)).fetchall()
+        return [
+            {"listing_id": r[0], "price": r[1], "previous_price": r[2], "price_changed_at": r[3]}
+            for r in rows
+        ]
+
+    def history_id(self, listing_id: str) -> str:
+        """Price-history key for ``listing_id``: a detail URL maps to its Otodom id once one is known."""
+        row = self.connection().execute(HISTORY_ID_SQL, (listing_id,)).fetchone()
+        return row[0] if row and row[0] else listing_id
+
+    def fetch_price_history(self, listing_id: str) -> List[Dict]:
+        rows = self.connection().execute(PRICE_HISTORY_SQL, (listing_id,)).fetchall()
+        return [{"observed_at": r[0], "price": r[1], "status": r[2]} for r in rows]
+
+    def fetch_scraped_coordinates(self, listing_ids: Sequence[str]) -> Dict[str, Tuple[float, float]]:
+        """``{listing_id: (lat, lon)}`` currently stored in property_analyses (to invalidate old map tiles)."""
+        if not listing_ids:
+            return {}
+        placeholders = ", ".join("?" * len(listing_ids))
+        rows = self.connection().execute(
+            "SELECT listing_id, scraped_latitude, scraped_longitude FROM property_analyses "
+            f"WHERE listing_id IN ({placeholders})",
+            tuple(listing_ids),
+        ).fetchall()
+        return {r[0]: (r[1], r[2]) for r in rows}
+
+    def lookup_gazetteer(self, address_keys: Sequence[str]) -> Dict[str, Tuple[float, float]]:
+        """``{address_key: (lat, lon)}`` for the keys the gazetteer knows (primary-key lookups)."""
+        if not address_keys:
+            return {}
+        placeholders = ", ".join("?" * len(address_keys))
+        rows = self.connection().execute(
+            f"SELECT address_key, latitude, longitude FROM geo_gazetteer WHERE address_key IN ({placeholders})",
+            tuple(address_keys),
+        ).fetchall()
+        return {r[0]: (r[1], r[2]) for r in rows}
+
+    def iter_tile_points(self, south: float, west: float, north: float, east: float) -> Iterator[tuple]:
+        """Stream ``(listing_id, lat, lon, price, area, title)`` for a half-open box (tile aggregation)."""
+        yield from self.connection().execute(
+            TILE_POINTS_SQL, (south, north, west, east, south, north, west, east)
+        )
+
+
+_stores: Dict[str, AnalysisStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path: Optional[str] = None) -> AnalysisStore:
+    """Return the process-wide store for ``path`` (default: ``ANALYSIS_DB_PATH``)."""
+    key = os.path.abspath(path or default_db_path())
+    store = _stores.get(key)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(key)
+            if store is None:
+                store = _stores[key] = AnalysisStore(key)
+    return store
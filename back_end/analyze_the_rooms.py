@@ -8,67 +8,136 @@ import time
 import random
 from typing import List, Dict, Optional, Tuple
 import re
-from back_end.scraper_otodom import get_listing_details
+from scraper_otodom import get_listing_details
 import sqlite3
 from collections import Counter
 import datetime
 import logging
 import uuid
 import statistics
+import hashlib
+import threading
+from cache import get_cached, set_cached
+from room_types import get_registry
+from analysis_store import get_store
+from map_tiles import invalidate_points
+from analyzer_logging import get_analyzer_logger, CappedJson, CappedText, PayloadSize
+
+SUMMARY_CACHE_NAMESPACE = "summary"
+SUMMARY_CACHE_TTL = int(os.getenv("SUMMARY_CACHE_TTL", str(86400 * 30)))
+SUMMARY_MODES = ("gemini", "template")
 
 class RoomAnalyzer:
-    def __init__(self, gemini_api_key: str, enable_duplicate_detection: bool = True, api_delay: float = 0.5, batch_mode: bool = True):
+    def __init__(self, gemini_api_key: str, enable_duplicate_detection: bool = True, api_delay: float = 0.5, batch_mode: bool = True,
+                 local_classifier_path: Optional[str] = None, local_confidence_threshold: float = 0.85,
+                 summary_mode: Optional[str] = None, db_path: Optional[str] = None):
+        # Level is controlled by ANALYZER_DEBUG (see analyzer_logging.py); handlers are attached once per process.
+        self.logger = get_analyzer_logger(self.__class__.__name__)
+
         if not gemini_api_key or len(gemini_api_key) < 10:
-            print("⚠️ UYARI: Geçersiz API anahtarı formatı. API anahtarı en az 10 karakter olmalıdır.")
+            self.logger.warning("⚠️ UYARI: Geçersiz API anahtarı formatı. API anahtarı en az 10 karakter olmalıdır.")
         
        
         # Use the API key as provided, without 'Alza' to 'AIza' correction.
         corrected_key = gemini_api_key 
-        # self.logger.debug(f"Using API key as provided (no 'Alza' correction): {str(corrected_key)[:10]}...") # Log a portion for confirmation
-        # Ensure logger is available if we want to use it here, or use print
-        print(f"[DEBUG] Using API key as provided (no 'Alza' correction): {str(corrected_key)[:10]}...")
-        
         self.gemini_api_key = corrected_key
         
         self.gemini_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash-preview-05-20:generateContent?key={corrected_key}"
-        print(f"[DEBUG] API anahtarı uzunluğu: {len(corrected_key) if corrected_key else 0} karakter")
-        print(f"[DEBUG] API URL: {self.gemini_url[:60]}...")
+        self.logger.debug("API anahtarı uzunluğu: %d karakter", len(corrected_key) if corrected_key else 0)
         
        
         if corrected_key and not (corrected_key.startswith('AIza') and len(corrected_key) > 30):
-            print("⚠️ UYARI: API anahtarı 'AIza' ile başlamıyor veya çok kısa. Doğru formatta olmayabilir.")
-        print(f"[DEBUG] Using Gemini API URL: {self.gemini_url}")
+            self.logger.warning("⚠️ UYARI: API anahtarı 'AIza' ile başlamıyor veya çok kısa. Doğru formatta olmayabilir.")
         self.enable_duplicate_detection = enable_duplicate_detection
         self.api_delay = api_delay
         self.batch_mode = batch_mode
+        # "gemini": cached Gemini text summary; "template": local template, no API call (bulk runs)
+        self.summary_mode = (summary_mode or os.getenv("SUMMARY_MODE", "gemini")).lower()
+        if self.summary_mode not in SUMMARY_MODES:
+            self.logger.warning("⚠️ UYARI: Bilinmeyen summary_mode '%s', 'gemini' kullanılıyor.", self.summary_mode)
+            self.summary_mode = "gemini"
 
-        
-        self.logger = logging.getLogger(f"{__name__}.{self.__class__.__name__}")
-        self.logger.setLevel(logging.DEBUG)
-        if not self.logger.handlers:
-            ch = logging.StreamHandler()
-            ch.setLevel(logging.DEBUG)
-            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-            ch.setFormatter(formatter)
-            self.logger.addHandler(ch)
         self.last_api_call = 0
-        self.db_path = '/Users/kadirhan/Desktop/ev/real_estate_agent_v2/back_end/real_estate_analysis.db'
-        self._init_db()
+        self._rate_lock = threading.Lock()
+        # One pooled HTTP session for Gemini calls and image downloads (shared across threads).
+        self.http = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.http.mount("https://", adapter)
+        self.http.mount("http://", adapter)
+        self.room_type_registry = get_registry()
+        # Shared per-path store: one WAL connection per thread, reused across calls.
+        self.store = get_store(db_path)
+        self.db_path = self.store.path  # schema is managed by migrations.py at boot
         
         # Pre-load feature/issue vocabulary (may be empty)
         self._feature_issue_vocab = self._load_feature_issue_vocab()
-        
-    def _load_room_types(self) -> List[Dict]:
-        file_path = os.path.join(os.path.dirname(__file__), 'room_type_classes.json')
+
+        # Optional distilled room-type classifier (see ml/room_type_classifier.py)
+        self.local_confidence_threshold = local_confidence_threshold
+        self.local_classifier = self._load_local_classifier(
+            local_classifier_path or os.getenv("LOCAL_ROOM_CLASSIFIER_PATH")
+        )
+
+    def _load_local_classifier(self, path: Optional[str]):
+        """Load the distilled room-type classifier if a model path is configured."""
+        if not path:
+            return None
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            self.logger.error(f"room_type_classes.json bulunamadı: {file_path}")
-            return []
-        except json.JSONDecodeError:
-            self.logger.error("room_type_classes.json geçersiz JSON içeriyor.")
-            return []
+            from ml.room_type_classifier import LocalRoomClassifier
+            classifier = LocalRoomClassifier.load(path)
+            self.logger.info("Local room classifier loaded from %s (%d classes)", path, len(classifier.classes))
+            return classifier
+        except Exception as e:
+            self.logger.warning("Local room classifier unavailable (%s): %s. Every image goes to Gemini.", path, e)
+            return None
+
+    def _gemini_required_room_types(self) -> set:
+        """Room types that always need Gemini's full condition assessment.
+
+        Habitable rooms drive condition/renovation metrics, so they are never
+        labelled locally; floor plans, exteriors, corridors etc. can be.
+        """
+        return self.room_type_registry.habitable_ids
+
+    def _classify_locally(self, images_data: List[Tuple[int, str, str]]) -> Tuple[List[Dict], List[Tuple[int, str, str]]]:
+        """Split images into locally classified entries and those still needing Gemini."""
+        if not self.local_classifier or not images_data:
+            return [], images_data
+
+        gemini_types = self._gemini_required_room_types()
+        local_entries: List[Dict] = []
+        remaining: List[Tuple[int, str, str]] = []
+        for image_index, image_url, image_base64 in images_data:
+            try:
+                room_type, confidence = self.local_classifier.predict_base64(image_base64)
+            except Exception as e:
+                self.logger.warning("Local classification failed for %s: %s", image_url, e)
+                remaining.append((image_index, image_url, image_base64))
+                continue
+
+            room_details = self.get_room_type_by_id(room_type)
+            if confidence < self.local_confidence_threshold or room_type in gemini_types or not room_details:
+                remaining.append((image_index, image_url, image_base64))
+                continue
+
+            local_entries.append({
+                'image_index': image_index,
+                'image_url': image_url,
+                'room_type': room_type,
+                'room_type_id': room_type,
+                'room_type_details': room_details,
+                'is_habitable': room_details.get('is_habitable'),
+                'confidence_score': round(confidence, 3),
+                'same_room_as': [],
+                'is_duplicate': False,
+                'classified_locally': True
+            })
+
+        self.logger.info("Local classifier labelled %d/%d images; %d sent to Gemini.", len(local_entries), len(images_data), len(remaining))
+        return local_entries, remaining
+
+    def _load_room_types(self) -> List[Dict]:
+        return self.room_type_registry.room_types
     
     def _load_feature_issue_vocab(self) -> Dict[str, List[str]]:
         """Load characteristic / issue vocabulary from generated JSON file."""
@@ -89,185 +158,98 @@ class RoomAnalyzer:
             return {"characteristics": [], "visible_issues": []}
     
     def _create_room_types_prompt(self) -> str:
-        """Generate a textual prompt section describing available room type IDs.
+        """Return the prompt section describing available room type IDs.
 
         Gemini can use this information to map its free-text understanding to the
-        discrete IDs we maintain locally (and later in the DB). If the JSON file
-        is missing, we still return a short placeholder to avoid breaking the
-        calling code.
+        discrete IDs we maintain locally (and later in the DB). The text is
+        pre-rendered by the registry; if the JSON file is missing, a short
+        placeholder is returned to avoid breaking the calling code.
         """
-        room_types = self._load_room_types()
-
-        if not room_types:
-            self.logger.warning("_create_room_types_prompt: No room types available; returning placeholder text.")
-            return "Known room types are currently unavailable."
-
-        lines = ["Here is the list of valid room_type_id values you MUST use in JSON responses:"]
-        for rt in room_types:
-            rt_id = rt.get("id") or rt.get("room_type_id") or rt.get("identified_room_type_id") or "unknown"
-            rt_name = rt.get("name") or rt_id.replace("_", " ").title()
-            lines.append(f"- {rt_id}: {rt_name}")
-
-        return "\n".join(lines)
+        return self.room_type_registry.prompt_section
     
-    def _init_db(self):
-        conn = None
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # Create property_analyses table (based on save_listing_scrape_data)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS property_analyses (
-                    listing_id TEXT UNIQUE NOT NULL,
-                    scraped_title TEXT,
-                    scraped_street_address TEXT,
-                    scraped_price REAL,
-                    scraped_area REAL,
-                    scraped_latitude REAL,
-                    scraped_longitude REAL,
-                    analysis_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    PRIMARY KEY (listing_id)
-                )
-            ''')
-            self.logger.debug("Ensured property_analyses table exists.")
-
-            # Create analysis_results table (based on _save_analysis_to_db)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS analysis_results (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    listing_id TEXT,
-                    analysis_id TEXT UNIQUE,
-                    total_images INTEGER,
-                    successfully_classified INTEGER,
-                    unique_rooms_detected INTEGER,
-                    duplicate_images_found INTEGER,
-                    execution_time REAL,
-                    batch_mode_used BOOLEAN,
-                    status TEXT,
-                    progress REAL,
-                    message TEXT,
-                    created_at TEXT,
-                    room_summary TEXT,
-                    avg_impression_score REAL,
-                    dominant_clutter_level TEXT,
-                    max_renovation_need TEXT,
-                    property_summary_text TEXT,
-                    key_features_text TEXT,
-                    visible_issues_text TEXT,
-                    numeric_visual_features_json TEXT,
-                    raw_gemini_response TEXT,
-                    overall_condition TEXT,
-                    dominant_style TEXT,
-                    overall_lighting TEXT,
-                    overall_impression_score_avg REAL,
-                    overall_impression_score_median REAL,
-                    clutter_level_mode TEXT,
-                    estimated_renovation_need_mode TEXT,
-                    habitable_room_ratio REAL,
-                    duplicate_ratio REAL,
-                    total_unique_rooms INTEGER,
-                    FOREIGN KEY (listing_id) REFERENCES property_analyses (listing_id)
-                )
-            ''')
-            self.logger.debug("Ensured analysis_results table exists.")
-
-            # --- NEW: Ensure numeric_visual_features_json column exists (for older schemas) ---
-            cursor.execute("PRAGMA table_info(analysis_results)")
-            existing_cols = [row[1] for row in cursor.fetchall()]
-            if 'numeric_visual_features_json' not in existing_cols:
-                self.logger.info("Adding missing column 'numeric_visual_features_json' to analysis_results table...")
-                cursor.execute("ALTER TABLE analysis_results ADD COLUMN numeric_visual_features_json TEXT")
-                self.logger.info("Column 'numeric_visual_features_json' added successfully.")
-
-            # --- NEW: Ensure frequently queried numeric columns exist ---
-            common_cols_types = {
-                "overall_impression_score_avg": "REAL",
-                "overall_impression_score_median": "REAL",
-                "clutter_level_mode": "TEXT",
-                "estimated_renovation_need_mode": "TEXT",
-                "habitable_room_ratio": "REAL",
-                "duplicate_ratio": "REAL",
-                "total_unique_rooms": "INTEGER"
-            }
-
-            for col, col_type in common_cols_types.items():
-                if col not in existing_cols:
-                    self.logger.info(f"Adding missing column '{col}' to analysis_results table...")
-                    cursor.execute(f"ALTER TABLE analysis_results ADD COLUMN {col} {col_type}")
-            conn.commit()
-            self.logger.info(f"Database initialized/verified at {self.db_path}")
-        except sqlite3.Error as e:
-            self.logger.error(f"Database error during _init_db: {e}")
-            if conn:
-                conn.rollback()
-        except Exception as e:
-            self.logger.error(f"General error during _init_db: {e}")
-            if conn:
-                conn.rollback()
-        finally:
-            if conn:
-                conn.close()
-
     def save_listing_scrape_data(self, listing_id: str, title: Optional[str], street_address: Optional[str], 
                                  price: Optional[float], area: Optional[float], 
-                                 latitude: Optional[float], longitude: Optional[float]):
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+                                 latitude: Optional[float], longitude: Optional[float],
+                                 otodom_id: Optional[str] = None):
         try:
-            self.logger.debug(f"Attempting to save/update scrape data for listing_id: {listing_id}")
+            self.logger.debug("Attempting to save/update scrape data for listing_id: %s", listing_id)
             
-            # Convert to float or None, handling empty strings for numeric types
-            db_price = float(price) if price is not None and str(price).strip() != '' else None
-            db_area = float(area) if area is not None and str(area).strip() != '' else None
-            db_latitude = float(latitude) if latitude is not None and str(latitude).strip() != '' else None
-            db_longitude = float(longitude) if longitude is not None and str(longitude).strip() != '' else None
-
-            cursor.execute("""
-                INSERT INTO property_analyses (
-                    listing_id, 
-                    scraped_title, 
-                    scraped_street_address, 
-                    scraped_price, 
-                    scraped_area, 
-                    scraped_latitude, 
-                    scraped_longitude,
-                    analysis_timestamp 
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                ON CONFLICT(listing_id) DO UPDATE SET
-                    scraped_title = excluded.scraped_title,
-                    scraped_street_address = excluded.scraped_street_address,
-                    scraped_price = excluded.scraped_price,
-                    scraped_area = excluded.scraped_area,
-                    scraped_latitude = excluded.scraped_latitude,
-                    scraped_longitude = excluded.scraped_longitude,
-                    analysis_timestamp = excluded.analysis_timestamp;
-            """, (listing_id, title, street_address, db_price, db_area, db_latitude, db_longitude))
-            conn.commit()
-            self.logger.info(f"Successfully saved/updated scrape data for listing_id: {listing_id}")
+            row = self._scrape_row(listing_id, title, street_address, price, area, latitude, longitude, otodom_id)
+            previous = self.store.fetch_scraped_coordinates([listing_id])
+            self.store.upsert_listing_scrapes([row])
+            self._invalidate_map_tiles([row], previous)
+            self.logger.info("Successfully saved/updated scrape data for listing_id: %s", listing_id)
         except sqlite3.Error as e:
-            self.logger.error(f"Database error while saving scrape data for {listing_id}: {e}")
-            if conn:
-                conn.rollback()
+            self.logger.error("Database error while saving scrape data for %s: %s", listing_id, e)
         except ValueError as e: 
-            self.logger.error(f"Data type error for listing {listing_id} before DB save (e.g., converting price/area to float): {e}")
-        finally:
-            if conn:
-                conn.close()
+            self.logger.error("Data type error for listing %s before DB save (e.g., converting price/area to float): %s", listing_id, e)
+
+    @staticmethod
+    def _scrape_row(listing_id: str, title: Optional[str], street_address: Optional[str],
+                    price, area, latitude, longitude, otodom_id=None) -> tuple:
+        # Convert to float or None, handling empty strings for numeric types
+        def _num(value):
+            return float(value) if value is not None and str(value).strip() != '' else None
+        return (listing_id, title, street_address, _num(price), _num(area), _num(latitude), _num(longitude),
+                str(otodom_id) if otodom_id is not None else None)
+
+    def _invalidate_map_tiles(self, rows: List[tuple], previous: Dict[str, tuple]):
+        # Only the cached tiles containing the written coordinates are dropped,
+        # plus the tiles a moved listing was in before this write.
+        points = [(row[5], row[6]) for row in rows]
+        points += [previous[row[0]] for row in rows if row[0] in previous and previous[row[0]] != (row[5], row[6])]
+        try:
+            invalidate_points(points)
+        except Exception as e:
+            self.logger.warning("Map tile invalidation failed: %s", e)
+
+    def save_listings_scrape_data_bulk(self, records: List[Dict]) -> int:
+        """Upsert many listings into property_analyses in a single transaction.
+
+        Each record uses the keyword names of ``save_listing_scrape_data``
+        (listing_id, title, street_address, price, area, latitude, longitude,
+        otodom_id). Price history is only recorded for records with an otodom_id.
+        Records that fail type conversion are skipped and logged. Returns the
+        number of rows written.
+        """
+        rows = []
+        for rec in records:
+            try:
+                rows.append(self._scrape_row(
+                    rec.get('listing_id'), rec.get('title'), rec.get('street_address'),
+                    rec.get('price'), rec.get('area'), rec.get('latitude'), rec.get('longitude'),
+                    rec.get('otodom_id'),
+                ))
+            except (TypeError, ValueError) as e:
+                self.logger.error("Data type error for listing %s before DB save: %s", rec.get('listing_id'), e)
+        try:
+            previous = self.store.fetch_scraped_coordinates([row[0] for row in rows])
+            written = self.store.upsert_listing_scrapes(rows)
+            self._invalidate_map_tiles(rows, previous)
+            self.logger.info("Saved/updated scrape data for %d listings in one transaction.", written)
+            return written
+        except sqlite3.Error as e:
+            self.logger.error("Database error while bulk-saving scrape data (%d rows): %s", len(rows), e)
+            return 0
 
 
     def _wait_for_api_rate_limit(self):
-        
-        current_time = time.time()
-        time_since_last_call = current_time - self.last_api_call
-        
-        if time_since_last_call < self.api_delay:
-            wait_time = self.api_delay - time_since_last_call
-            print(f"⏳ Attente de {wait_time:.1f}s pour respecter les limites API...")
+        # Reserve the next slot under the lock, sleep outside it: concurrent
+        # callers on a shared analyzer are spaced api_delay apart.
+        with self._rate_lock:
+            current_time = time.time()
+            slot = max(current_time, self.last_api_call + self.api_delay)
+            self.last_api_call = slot
+        
+        wait_time = slot - current_time
+        if wait_time > 0:
+            self.logger.debug("⏳ Attente de %.1fs pour respecter les limites API...", wait_time)
             time.sleep(wait_time)
-        
-        self.last_api_call = time.time()
+
+    def close(self):
+        """Release pooled HTTP connections and this thread's SQLite connection."""
+        self.http.close()
+        self.store.close()
 
     def _generate_property_summary(self, gemini_analysis_results: List[Dict]) -> Dict:
         
@@ -275,7 +257,7 @@ class RoomAnalyzer:
             self.logger.warning("_generate_property_summary: No analysis results to process.")
             return {}
 
-        self.logger.debug(f"Received {len(gemini_analysis_results)} analysis results.")
+        self.logger.debug("Received %d analysis results.", len(gemini_analysis_results))
 
         room_types = [res.get('room_type') for res in gemini_analysis_results if isinstance(res, dict) and res.get('room_type')]
         conditions = [res.get('condition') for res in gemini_analysis_results if isinstance(res, dict) and res.get('condition')]
@@ -288,7 +270,7 @@ class RoomAnalyzer:
                 if res.get('features') and isinstance(res.get('features'), list):
                     all_features.extend(f for f in res.get('features') if isinstance(f, str))
             else:
-                self.logger.warning(f"Skipping non-dict item in gemini_analysis_results (features extraction): type {type(res)} - content (truncated): {str(res)[:100]}")
+                self.logger.warning("Skipping non-dict item in gemini_analysis_results (features extraction): type %s - content (truncated): %s", type(res), CappedText(res, 100))
 
         all_issues = []
         for res in gemini_analysis_results:
@@ -297,22 +279,25 @@ class RoomAnalyzer:
                     valid_issues = [i for i in res.get('visible_issues') if isinstance(i, dict) and 'issue' in i and 'severity' in i]
                     all_issues.extend(valid_issues)
             else:
-                self.logger.warning(f"Skipping non-dict item in gemini_analysis_results (issues extraction): type {type(res)} - content (truncated): {str(res)[:100]}")
+                self.logger.warning("Skipping non-dict item in gemini_analysis_results (issues extraction): type %s - content (truncated): %s", type(res), CappedText(res, 100))
 
         # Benzersiz sorunları alırken dict'lerin hashable olmaması sorununu çöz
+        # Sorted so the same listing structure always yields the same top issues / cache key
         unique_issues_tuples = {tuple(sorted(d.items())) for d in all_issues if isinstance(d, dict)}
-        unique_issues_list = [dict(t) for t in unique_issues_tuples]
+        unique_issues_list = [dict(t) for t in sorted(unique_issues_tuples, key=lambda t: (-self._severity_rank(dict(t).get('severity')), str(t)))]
 
+        # Most frequent features first, ties broken alphabetically
+        feature_counts = Counter(all_features)
         summary = {
-            'room_counts': dict(Counter(room_types)) if room_types else {},
-            'overall_condition': Counter(conditions).most_common(1)[0][0] if conditions else None,
-            'dominant_style': Counter(styles).most_common(1)[0][0] if styles else None,
-            'key_features': list(set(all_features)), # Benzersiz string özellikler
+            'room_counts': dict(sorted(Counter(room_types).items())) if room_types else {},
+            'overall_condition': self._mode(conditions),
+            'dominant_style': self._mode(styles),
+            'key_features': sorted(feature_counts, key=lambda f: (-feature_counts[f], f)), # Benzersiz string özellikler
             'visible_issues': unique_issues_list,
-            'overall_lighting': Counter(lightings).most_common(1)[0][0] if lightings else None,
+            'overall_lighting': self._mode(lightings),
             'property_summary_text': ""
         }
-        self.logger.debug(f"Initial structured summary: {summary}")
+        self.logger.debug("Initial structured summary: %s", CappedJson(summary, 1000))
 
         
         prompt_details = {
@@ -334,14 +319,27 @@ class RoomAnalyzer:
             },
             "instructions": "Based on the property analysis data, create a concise bullet-point list. Include 3-5 main positive selling points and up to 2 notable issues. Start each point with a dash (-). Keep the entire response under 200 tokens."
         }
-        
+
+        if self.summary_mode == "template":
+            summary['property_summary_text'] = self._render_summary_template(prompt_details['property_analysis'])
+            self.logger.debug("_generate_property_summary: Rendered summary from local template (no API call).")
+            return summary
+
+        fingerprint = self._summary_fingerprint(prompt_details['property_analysis'])
+        try:
+            cached_text = get_cached(SUMMARY_CACHE_NAMESPACE, fingerprint)
+        except Exception as cache_e:
+            self.logger.warning("Summary cache lookup failed: %s", cache_e)
+            cached_text = None
+        if cached_text:
+            summary['property_summary_text'] = cached_text
+            self.logger.info("_generate_property_summary: Summary cache hit (%s), skipping Gemini request.", fingerprint[:12])
+            return summary
         
         try:
             prompt_text_for_gemini = f"Please act as a {prompt_details['role']}. {prompt_details['objective']}. {prompt_details['instructions']}\n\nHere is the property analysis data:\n```json\n{json.dumps(prompt_details['property_analysis'], indent=2, ensure_ascii=False)}\n```"
-            self.logger.debug(f"Length of detailed prompt for Gemini: {len(prompt_text_for_gemini)}")
-            # Log a larger portion of the prompt, or all of it if not excessively long
-            log_prompt_display = prompt_text_for_gemini if len(prompt_text_for_gemini) < 2000 else prompt_text_for_gemini[:2000] + "... (prompt truncated for logging)"
-            self.logger.debug(f"Detailed prompt for Gemini (up to 2000 chars): {log_prompt_display}")
+            self.logger.debug("Length of detailed prompt for Gemini: %d", len(prompt_text_for_gemini))
+            self.logger.debug("Detailed prompt for Gemini (up to 2000 chars): %s", CappedText(prompt_text_for_gemini, 2000))
             payload = {
                 "contents": [
                     {
@@ -353,29 +351,20 @@ class RoomAnalyzer:
                 }
             }
             
-            self.logger.info("CASCADE_DEBUG: _generate_property_summary: Requesting detailed textual summary from Gemini...")
-            # Truncate payload for logging if it's too large
-            payload_str_for_log = json.dumps(payload, indent=2)
-            if len(payload_str_for_log) > 1000:
-                payload_str_for_log = payload_str_for_log[:1000] + "... (payload truncated for logging)"
-            self.logger.debug(f"CASCADE_DEBUG: Payload for detailed Gemini summary: {payload_str_for_log}")
+            self.logger.info("_generate_property_summary: Requesting detailed textual summary from Gemini...")
+            self.logger.debug("Payload for detailed Gemini summary: %s", CappedJson(payload, 1000))
             
             detailed_summary_response = self._make_gemini_request(payload, max_retries=2) # Changed max_retries to 2
             
-            # Log the type and a truncated version of the response
-            response_type = type(detailed_summary_response)
-            response_content_for_log = str(detailed_summary_response)
-            if len(response_content_for_log) > 500:
-                response_content_for_log = response_content_for_log[:500] + "... (response truncated for logging)"
-            self.logger.debug(f"CASCADE_DEBUG: Raw response from detailed Gemini summary call: {response_content_for_log}")
-            self.logger.debug(f"CASCADE_DEBUG: Type of detailed_summary_response: {response_type}")
+            # Lazy, truncated view of the response for logging
+            response_content_for_log = CappedText(detailed_summary_response, 500)
+            self.logger.debug("Raw response from detailed Gemini summary call: %s", response_content_for_log)
+            self.logger.debug("Type of detailed_summary_response: %s", type(detailed_summary_response))
 
             if not isinstance(detailed_summary_response, dict):
-                self.logger.error(f"CASCADE_DEBUG: detailed_summary_response IS NOT A DICT. Content (truncated): {response_content_for_log}")
+                self.logger.error("detailed_summary_response IS NOT A DICT. Content (truncated): %s", response_content_for_log)
             
-            self.logger.debug("CASCADE_DEBUG: Entering processing block for detailed_summary_response.")
             if detailed_summary_response and isinstance(detailed_summary_response, dict) and detailed_summary_response.get('candidates'):
-                self.logger.debug("CASCADE_DEBUG: detailed_summary_response is a dict and has 'candidates'.")
                 candidates = detailed_summary_response.get('candidates', [])
                 if candidates and isinstance(candidates, list) and len(candidates) > 0:
                     content = candidates[0].get('content', {})
@@ -384,22 +373,25 @@ class RoomAnalyzer:
                     
                     if generated_text.strip():
                         summary['property_summary_text'] = generated_text.strip()
-                        self.logger.info("CASCADE_DEBUG: _generate_property_summary: Successfully generated detailed summary from Gemini.")
-                        # self.logger.debug(f"CASCADE_DEBUG: Detailed summary text: {summary['property_summary_text']}")
+                        self.logger.info("_generate_property_summary: Successfully generated detailed summary from Gemini.")
+                        try:
+                            set_cached(SUMMARY_CACHE_NAMESPACE, fingerprint, summary['property_summary_text'], ttl=SUMMARY_CACHE_TTL)
+                        except Exception as cache_e:
+                            self.logger.warning("Summary cache write failed: %s", cache_e)
                     else:
-                        self.logger.warning("CASCADE_DEBUG: _generate_property_summary: Gemini returned empty text for detailed summary. Will raise ValueError.")
+                        self.logger.warning("_generate_property_summary: Gemini returned empty text for detailed summary. Will raise ValueError.")
                         raise ValueError("Empty text from Gemini for detailed summary")
                 else:
-                    self.logger.warning(f"CASCADE_DEBUG: 'candidates' list is empty or not structured as expected in detailed_summary_response. Candidates: {candidates}")
+                    self.logger.warning("'candidates' list is empty or not structured as expected in detailed_summary_response. Candidates: %s", CappedJson(candidates))
                     raise ValueError("No valid candidates structure from Gemini for detailed summary")
             else:
-                self.logger.warning(f"CASCADE_DEBUG: _generate_property_summary: No candidates found or issue with Gemini response structure. Response (truncated): {response_content_for_log}")
+                self.logger.warning("_generate_property_summary: No candidates found or issue with Gemini response structure. Response (truncated): %s", response_content_for_log)
                 # If detailed_summary_response is None or not a dict, this path will be taken.
                 # If it's a dict but no 'candidates', this is also taken.
                 raise ValueError("No valid response or structure from Gemini for detailed summary")
 
         except Exception as e:
-            self.logger.error(f"CASCADE_DEBUG: _generate_property_summary: Error during detailed summary generation: {e}", exc_info=True)
+            self.logger.error("_generate_property_summary: Error during detailed summary generation: %s", e, exc_info=True)
             # Fallback: Basit bir özet metin oluşturma
             summary_parts = []
             if summary['room_counts']:
@@ -420,11 +412,54 @@ class RoomAnalyzer:
                 summary_parts.append("Mülk hakkında temel özet bilgileri çıkarılamadı.")
                     
             summary['property_summary_text'] = " ".join(summary_parts)
-            print("[INFO] _generate_property_summary: Using fallback simple summary text.")
+            self.logger.info("_generate_property_summary: Using fallback simple summary text.")
         
-        print(f"[DEBUG] _generate_property_summary: Final summary object: {{... 'property_summary_text': '{summary['property_summary_text'][:100]}...'}}")
+        self.logger.debug("_generate_property_summary: Final summary text: %s", CappedText(summary['property_summary_text'], 100))
         return summary
 
+    @staticmethod
+    def _severity_rank(severity: Optional[str]) -> int:
+        return {"critical": 4, "major": 3, "moderate": 2, "minor": 1}.get(str(severity).lower(), 0)
+
+    @staticmethod
+    def _mode(values: List) -> Optional[str]:
+        """Most frequent value; ties go to the smallest, so image order never changes the result."""
+        if not values:
+            return None
+        counts = Counter(values)
+        return min(counts, key=lambda v: (-counts[v], str(v)))
+
+    @staticmethod
+    def _summary_fingerprint(property_analysis: Dict) -> str:
+        """Canonical hash of the structured summary input (used as cache key)."""
+        canonical = json.dumps(property_analysis, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _render_summary_template(self, property_analysis: Dict) -> str:
+        """Render the bullet-point summary locally, mirroring the Gemini prompt's format."""
+        lines = []
+        room_summary = property_analysis.get("room_summary") or {}
+        if room_summary:
+            rooms = ", ".join(
+                f"{count} x {(self.get_room_type_by_id(rt) or {}).get('name', rt)}" for rt, count in room_summary.items()
+            )
+            lines.append(f"- Rooms photographed: {rooms}")
+        if property_analysis.get("overall_condition"):
+            lines.append(f"- Overall condition: {property_analysis['overall_condition']}")
+        style = property_analysis.get("dominant_style")
+        lighting = property_analysis.get("overall_lighting")
+        if style and lighting:
+            lines.append(f"- {style} style with {str(lighting).lower()} natural light")
+        elif style:
+            lines.append(f"- {style} style interior")
+        elif lighting:
+            lines.append(f"- Natural lighting: {lighting}")
+        for feature in (property_analysis.get("highlighted_features") or [])[:3]:
+            lines.append(f"- {feature}")
+        for issue in (property_analysis.get("notable_issues") or [])[:2]:
+            lines.append(f"- Note: {issue.get('issue')} ({issue.get('severity')})")
+        return "\n".join(lines) if lines else "- No structured details available for this property."
+
     def _save_analysis_to_db(self, analysis_id: str, listing_id_url: str, total_images: int, 
                          successfully_classified_images: int, unique_rooms_detected: int, 
                          duplicate_images_found: int, execution_time: float, batch_mode_used: bool,
@@ -442,21 +477,17 @@ class RoomAnalyzer:
                          duplicate_ratio: Optional[float]=None,
                          total_unique_rooms: Optional[int]=None):
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
         try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO analysis_results (
-                    analysis_id, listing_id, total_images, successfully_classified, 
-                    unique_rooms_detected, duplicate_images_found, execution_time, batch_mode_used, 
-                    status, progress, message, created_at, 
-                    room_summary, avg_impression_score, dominant_clutter_level, max_renovation_need,
-                    property_summary_text, key_features_text, visible_issues_text, raw_gemini_response,
-                    overall_condition, dominant_style, overall_lighting, numeric_visual_features_json,
-                    overall_impression_score_avg, overall_impression_score_median, clutter_level_mode,
-                    estimated_renovation_need_mode, habitable_room_ratio, duplicate_ratio, total_unique_rooms
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
+            # Wide JSON goes to the compressed analysis_payloads table, not the hot row.
+            payloads = {
+                'room_summary': json.dumps(room_summary_data) if room_summary_data else None,
+                'key_features_text': json.dumps(key_features_text) if key_features_text else None,
+                'visible_issues_text': json.dumps(visible_issues_text) if visible_issues_text else None,
+                'raw_gemini_response': raw_gemini_response,
+                'numeric_visual_features_json': json.dumps(numeric_visual_features) if numeric_visual_features else None,
+            }
+            # Values follow analysis_store.ANALYSIS_RESULT_COLUMNS order.
+            self.store.save_analysis((
                 analysis_id,
                 listing_id_url, # This is the URL, maps to listing_id in the table
                 total_images,
@@ -469,18 +500,18 @@ class RoomAnalyzer:
                 100.0,  # progress
                 'Analysis completed successfully.',  # message
                 datetime.datetime.now(), # created_at
-                json.dumps(room_summary_data) if room_summary_data else None,
+                None,  # room_summary -> payloads
                 avg_impression_score,
                 dominant_clutter_level,
                 max_renovation_need,
                 property_summary_text,
-                json.dumps(key_features_text) if key_features_text else None,
-                json.dumps(visible_issues_text) if visible_issues_text else None,
-                raw_gemini_response,
+                None,  # key_features_text -> payloads
+                None,  # visible_issues_text -> payloads
+                None,  # raw_gemini_response -> payloads
                 overall_condition,
                 dominant_style,
                 overall_lighting,
-                json.dumps(numeric_visual_features) if numeric_visual_features else None,
+                None,  # numeric_visual_features_json -> payloads
                 (numeric_visual_features or {}).get("overall_impression_score_avg", overall_impression_score_avg),
                 (numeric_visual_features or {}).get("overall_impression_score_median", overall_impression_score_median),
                 (numeric_visual_features or {}).get("clutter_level_mode", clutter_level_mode),
@@ -488,29 +519,22 @@ class RoomAnalyzer:
                 (numeric_visual_features or {}).get("habitable_room_ratio", habitable_room_ratio),
                 (numeric_visual_features or {}).get("duplicate_ratio", duplicate_ratio),
                 (numeric_visual_features or {}).get("total_unique_rooms", total_unique_rooms)
-            ))
-            conn.commit()
-            self.logger.info(f"[DB] Analysis for '{listing_id_url}' (ID: {analysis_id}) saved/updated in analysis_results.")
+            ), payloads)
+            self.logger.info("[DB] Analysis for '%s' (ID: %s) saved/updated in analysis_results.", listing_id_url, analysis_id)
         except sqlite3.Error as e:
-            self.logger.error(f"[DB] Database error while saving analysis for {listing_id_url} (ID: {analysis_id}): {e}")
-            if conn:
-                conn.rollback()
+            self.logger.error("[DB] Database error while saving analysis for %s (ID: %s): %s", listing_id_url, analysis_id, e)
         except Exception as e:
-            self.logger.error(f"[DB] General error during _save_analysis_to_db for {listing_id_url} (ID: {analysis_id}): {e}")
-            if conn:
-                conn.rollback()
-        finally:
-            if conn:
-                conn.close()
-    
+            self.logger.error("[DB] General error during _save_analysis_to_db for %s (ID: %s): %s", listing_id_url, analysis_id, e)
+
     def _make_gemini_request(self, payload, retry_count=0, max_retries=3):
         if retry_count >= max_retries:
             self.logger.error(f"❌ Échec de la requête Gemini après {max_retries} tentatives.")
             return None
 
         headers = {'Content-Type': 'application/json'}
-        token_estimate = self._estimate_token_usage(payload)
-        self.logger.debug(f"Estimation des jetons pour cette requête : {token_estimate}")
+        debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
+        if debug_enabled:
+            self.logger.debug("Estimation des jetons pour cette requête : %d", self._estimate_token_usage(payload))
 
         num_parts = 0
         if 'contents' in payload and len(payload['contents']) > 0:
@@ -518,38 +542,38 @@ class RoomAnalyzer:
             if 'parts' in content:
                 parts = content['parts']
                 num_parts = len(parts)
-                self.logger.debug(f"Structure de la charge utile de la requête : {num_parts} parties.")
-                if num_parts > 0:
-                    first_part_type = 'image' if 'inlineData' in parts[0] else parts[0].get('text', 'Type de partie inconnu')
-                    self.logger.debug(f"Type de la première partie : {first_part_type}")
-                    self.logger.debug(f"Types des parties (max 3) : {[type(p).__name__ for p in parts[:3]]}...")
+                if debug_enabled:
+                    self.logger.debug("Structure de la charge utile de la requête : %d parties.", num_parts)
 
         # Timeout: 90s for multi-part (likely image), 45s for single-part (likely text/summary)
         timeout = 90 if num_parts > 1 else 45
-        payload_size_kb = len(str(payload)) // 1024
-        self.logger.debug(f"Timeout de la requête réglé à {timeout} secondes (taille de la charge utile : {payload_size_kb} Ko)")
+        self.logger.debug("Timeout de la requête réglé à %d secondes (taille de la charge utile : %s Ko)", timeout, PayloadSize(payload))
 
         try:
-            response = requests.post(self.gemini_url, headers=headers, json=payload, timeout=timeout)
-            self.logger.debug(f"Statut de la réponse Gemini : {response.status_code}")
+            started = time.perf_counter()
+            response = self.http.post(self.gemini_url, headers=headers, json=payload, timeout=timeout)
+            self.logger.debug("Statut de la réponse Gemini : %s", response.status_code)
 
             if response.status_code == 200:
                 try:
                     response_json = response.json()
                     if not isinstance(response_json, dict):
-                        self.logger.error(f"Réponse Gemini API OK (200) mais le JSON n'est pas un dictionnaire. Type: {type(response_json)}, Contenu (tronqué): {str(response_json)[:500]}")
+                        self.logger.error("Réponse Gemini API OK (200) mais le JSON n'est pas un dictionnaire. Type: %s, Contenu (tronqué): %s", type(response_json), CappedText(response_json))
                         return None
-                    self.logger.debug(f"Structure de la réponse JSON Gemini (clés) : {list(response_json.keys()) if response_json else 'Vide'}")
+                    if debug_enabled:
+                        self.logger.debug("Structure de la réponse JSON Gemini (clés) : %s", list(response_json.keys()) if response_json else 'Vide')
+                    # Stored with the raw response: the distilled classifier reports Gemini latency from it.
+                    response_json['gemini_seconds'] = round(time.perf_counter() - started, 3)
                     return response_json
                 except ValueError as json_err: # Catches JSONDecodeError
-                    self.logger.error(f"Erreur de décodage JSON de la réponse Gemini (statut 200) : {json_err}. Texte de la réponse (tronqué): {response.text[:500]}")
+                    self.logger.error("Erreur de décodage JSON de la réponse Gemini (statut 200) : %s. Texte de la réponse (tronqué): %s", json_err, CappedText(response.text))
                     return None
             elif response.status_code == 429:
                 self.logger.warning("Limite de taux Gemini dépassée. Attente et nouvelle tentative...")
                 time.sleep(5 * (retry_count + 1))
                 return self._make_gemini_request(payload, retry_count + 1, max_retries)
             else:
-                self.logger.error(f"Erreur API Gemini : {response.status_code} - {response.text[:500]}") # Truncate response text
+                self.logger.error("Erreur API Gemini : %s - %s", response.status_code, CappedText(response.text))
                 if retry_count < max_retries - 1:
                     self.logger.info(f"Nouvelle tentative {retry_count + 2}/{max_retries}...")
                     time.sleep(2 * (retry_count + 1))
@@ -596,7 +620,7 @@ class RoomAnalyzer:
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
             }
-            response = requests.get(image_url, headers=headers, timeout=5, verify=False)
+            response = self.http.get(image_url, headers=headers, timeout=5, verify=False)
             response.raise_for_status()
             
             image = Image.open(BytesIO(response.content))
@@ -615,7 +639,7 @@ class RoomAnalyzer:
             return base64.b64encode(image_data).decode('utf-8')
             
         except Exception as e:
-            print(f"❌ Erreur lors du téléchargement de l'image {image_url}: {e}")
+            self.logger.warning("❌ Erreur lors du téléchargement de l'image %s: %s", image_url, e)
             return None
     
     def _classify_room_with_gemini(self, image_base64: str) -> Tuple[Optional[str], Optional[Dict]]:
@@ -678,20 +702,20 @@ Analyze the following image:
                             analysis_json = json.loads(part['text'])
                         except json.JSONDecodeError as e:
                             self.logger.error(f"Gemini yanıtı JSON olarak parse edilemedi (text field): {e}")
-                            self.logger.debug(f"Alınan text: {part['text']}")
+                            self.logger.debug("Alınan text: %s", CappedText(part['text']))
                             return None, raw_gemini_response 
                     elif isinstance(part, dict): 
                         analysis_json = part 
 
             if not analysis_json:
                 self.logger.error("Gemini yanıtından geçerli bir analiz JSON'u çıkarılamadı.")
-                self.logger.debug(f"Ham Gemini Yanıtı: {raw_gemini_response}")
+                self.logger.debug("Ham Gemini Yanıtı: %s", CappedJson(raw_gemini_response))
                 return None, raw_gemini_response
             
             
             required_keys = ["identified_room_type_id", "confidence_score", "main_characteristics"]
             if not all(key in analysis_json for key in required_keys):
-                self.logger.warning(f"Gemini'den gelen JSON'da beklenen bazı anahtar alanlar eksik. Gelen JSON: {analysis_json}")
+                self.logger.warning("Gemini'den gelen JSON'da beklenen bazı anahtar alanlar eksik. Gelen JSON: %s", CappedJson(analysis_json))
                 
                 
 
@@ -755,7 +779,7 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
             return False
             
         except Exception as e:
-            print(f"Erreur lors de la comparaison d'images: {e}")
+            self.logger.warning("Erreur lors de la comparaison d'images: %s", e)
             return False
     
     def _create_batch_analysis_prompt(self, images_data: List[Tuple[int, str, str]]) -> str:
@@ -885,24 +909,22 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
                 "contents": [{"parts": parts}]
             }
             
-            print(f"🚀 Envoi d'une seule requête pour {len(images_data)} images...")
+            self.logger.info("🚀 Envoi d'une seule requête pour %d images...", len(images_data))
             result = self._make_gemini_request(payload)
             
             if not result:
-                print("❌ Erreur dans la requête batch")
+                self.logger.error("❌ Erreur dans la requête batch")
                 return self._fallback_to_individual_analysis(images_data)
             
             # Parser la réponse JSON
-            print(f"[DEBUG] API Response structure: {list(result.keys()) if result else 'None'}")
-            print(f"[DEBUG] Full API response: {json.dumps(result)[:500]}...")
+            self.logger.debug("API response: %s", CappedJson(result))
             if 'candidates' in result and len(result['candidates']) > 0:
                 content = result['candidates'][0].get('content', {})
                 parts = content.get('parts', [])
-                print(f"[DEBUG] Response parts count: {len(parts)}")
+                self.logger.debug("Response parts count: %d", len(parts))
                 if parts and 'text' in parts[0]:
                     response_text = parts[0]['text'].strip()
-                    print(f"[DEBUG] Response text (first 100 chars): {response_text[:100]}...")
-                    print(f"[DEBUG] Full response text: {response_text}")
+                    self.logger.debug("Response text: %s", CappedText(response_text, 2000))
                     
                     
                     try:
@@ -911,34 +933,37 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
                         json_end = response_text.rfind(']') + 1
                         if json_start >= 0 and json_end > json_start:
                             json_text = response_text[json_start:json_end]
-                            print(f"[DEBUG] Extracted JSON (first 100 chars): {json_text[:100]}...")
                             parsed_result = json.loads(json_text)
-                            print(f"[DEBUG] Parsed JSON contains {len(parsed_result)} items")
                             
                             
                             if isinstance(parsed_result, list):
-                                print(f"[DEBUG] Analysis entries: {len(parsed_result)}")
+                                self.logger.debug("Analysis entries: %d", len(parsed_result))
                                 
                                 analysis_results = parsed_result
+                                url_by_index = {idx: url for idx, url, _ in images_data}
+                                seconds_per_image = round(result.get('gemini_seconds', 0) / len(images_data), 3)
                                 
-                                for result in analysis_results:
-                                    if 'room_type' not in result or not result['room_type']:
-                                        result['room_type'] = 'other'
-                                    if 'same_room_as' not in result:
-                                        result['same_room_as'] = []
+                                for entry in analysis_results:
+                                    if 'room_type' not in entry or not entry['room_type']:
+                                        entry['room_type'] = 'other'
+                                    if 'same_room_as' not in entry:
+                                        entry['same_room_as'] = []
+                                    # Keep the image URL with its label so stored responses can train the local classifier
+                                    if entry.get('image_index') in url_by_index:
+                                        entry.setdefault('image_url', url_by_index[entry['image_index']])
+                                    entry['gemini_seconds_per_image'] = seconds_per_image
                                 processed_classifications = self._process_batch_results(analysis_results, images_data)
-                                return processed_classifications, result
+                                return processed_classifications, analysis_results
                     except json.JSONDecodeError as e:
-                        print(f"⚠️ Erreur de parsing JSON: {e}")
-                        print(f"Réponse reçue: {response_text[:500]}...")
+                        self.logger.warning("⚠️ Erreur de parsing JSON: %s. Réponse reçue: %s", e, CappedText(response_text))
             else:
-                print(f"[DEBUG] No text found in response parts")
+                self.logger.debug("No text found in response parts")
             
-            print("⚠️ Réponse invalide, basculement vers l'analyse individuelle")
+            self.logger.warning("⚠️ Réponse invalide, basculement vers l'analyse individuelle")
             return self._fallback_to_individual_analysis(images_data)
             
         except Exception as e:
-            print(f"❌ Erreur dans l'analyse batch: {e}")
+            self.logger.error("❌ Erreur dans l'analyse batch: %s", e)
             return self._fallback_to_individual_analysis(images_data)
     
     def _process_batch_results(self, analysis_results: List[Dict], images_data: List[Tuple[int, str, str]]) -> List[Dict]:
@@ -946,7 +971,7 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
         room_classifications = []
         
         
-        print(f"[DEBUG] Processing batch results: {len(analysis_results)} analysis results, {len(images_data)} images")
+        self.logger.debug("Processing batch results: %d analysis results, %d images", len(analysis_results), len(images_data))
         
         for i, (image_index, image_url, _) in enumerate(images_data):
             
@@ -959,10 +984,10 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
             if not result and i < len(analysis_results):
                 
                 result = analysis_results[i]
-                print(f"[DEBUG] Using result at index {i} for image index {image_index}")
+                self.logger.debug("Using result at index %d for image index %d", i, image_index)
             
             if not result:
-                print(f"[DEBUG] No result found for image index {image_index}, using default")
+                self.logger.debug("No result found for image index %d, using default", image_index)
                 room_classifications.append({
                     'image_index': image_index,
                     'image_url': image_url,
@@ -983,7 +1008,7 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
                 })
                 continue
 
-            self.logger.debug(f"[DEBUG] Result for image {image_index}: {result}")
+            self.logger.debug("Result for image %d: %s", image_index, CappedJson(result))
 
             room_type = result.get('room_type', 'other')
             
@@ -999,11 +1024,11 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
                         if isinstance(idx, int):
                             processed_same_room_as.append(idx)
                         else:
-                            self.logger.warning(f"[DEBUG] Discarding invalid item in same_room_as for image {image_index}: {item}")
+                            self.logger.warning("Discarding invalid item in same_room_as for image %s: %s", image_index, CappedJson(item))
                     else:
-                        self.logger.warning(f"[DEBUG] Discarding unexpected item type in same_room_as for image {image_index}: {item}")
+                        self.logger.warning("Discarding unexpected item type in same_room_as for image %s: %s", image_index, CappedText(item))
             else:
-                self.logger.warning(f"[DEBUG] 'same_room_as' for image {image_index} is not a list: {raw_same_room_as}. Defaulting to empty list.")
+                self.logger.warning("'same_room_as' for image %s is not a list: %s. Defaulting to empty list.", image_index, CappedText(raw_same_room_as))
             
             same_room_as = processed_same_room_as
 
@@ -1122,7 +1147,7 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
                         continue
                     
                     if current_room_type_id == next_room_type_id:
-                        self.logger.debug(f"Comparaison de l'image {current_entry['image_index']} et {next_entry['image_index']} pour la duplication (type: {current_room_type_id})")
+                        self.logger.debug("Comparaison de l'image %s et %s pour la duplication (type: %s)", current_entry['image_index'], next_entry['image_index'], current_room_type_id)
                         try:
                             is_same_room = self._compare_images_with_gemini(
                                 image_data_cache[current_entry['image_index']], 
@@ -1144,7 +1169,7 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
         
         
         
-        print(f"Analyse de l'annonce: {listing_url}")
+        self.logger.info("Analyse de l'annonce: %s", listing_url)
         start_time = time.time()
     
         
@@ -1162,14 +1187,14 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
                 'listing_url': listing_url
             }
         
-        print(f"Trouvé {len(image_urls)} images à analyser")
+        self.logger.info("Trouvé %d images à analyser", len(image_urls))
         
         
         images_data = []
         failed_images = []
         
         for i, image_url in enumerate(image_urls):
-            print(f"Téléchargement de l'image {i+1}/{len(image_urls)}: {image_url}")
+            self.logger.debug("Téléchargement de l'image %d/%d: %s", i + 1, len(image_urls), image_url)
             
             # Télécharge et encode l'image
             image_base64 = self._download_and_encode_image(image_url)
@@ -1187,20 +1212,27 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
                     'is_duplicate': False
                 })
         
-        print(f"✅ {len(images_data)} images téléchargées avec succès, {len(failed_images)} échecs")
+        self.logger.info("✅ %d images téléchargées avec succès, %d échecs", len(images_data), len(failed_images))
+
+        # Confident, non-habitable images are labelled by the local classifier
+        local_classifications, gemini_images_data = self._classify_locally(images_data)
         
         # Analyse les images selon le mode choisi
-        if self.batch_mode and len(images_data) > 0:
-            print("🚀 Mode batch activé - analyse de toutes les images en une seule requête")
+        if not gemini_images_data:
+            room_classifications = []
+            batch_mode_raw_outputs = []
+            individual_mode_raw_output = []
+        elif self.batch_mode:
+            self.logger.debug("🚀 Mode batch activé - analyse de toutes les images en une seule requête")
             batch_mode_raw_outputs = []
             # Limité à 8 images par lot pour optimiser la vitesse
             max_batch_size = 8
-            if len(images_data) > max_batch_size:
-                print(f"Trop d'images pour un seul lot ({len(images_data)}), division en lots de {max_batch_size}")
+            if len(gemini_images_data) > max_batch_size:
+                self.logger.debug("Trop d'images pour un seul lot (%d), division en lots de %d", len(gemini_images_data), max_batch_size)
                 all_classifications = []
-                for i in range(0, len(images_data), max_batch_size):
-                    batch = images_data[i:i+max_batch_size]
-                    print(f"Traitement du lot {i//max_batch_size + 1}/{(len(images_data) + max_batch_size - 1)//max_batch_size}")
+                for i in range(0, len(gemini_images_data), max_batch_size):
+                    batch = gemini_images_data[i:i+max_batch_size]
+                    self.logger.debug("Traitement du lot %d/%d", i // max_batch_size + 1, (len(gemini_images_data) + max_batch_size - 1) // max_batch_size)
                     batch_classifications, batch_raw_json = self._analyze_all_images_batch(batch)
                     if batch_classifications:
                         all_classifications.extend(batch_classifications)
@@ -1208,19 +1240,20 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
                         batch_mode_raw_outputs.append(batch_raw_json)
                 room_classifications = all_classifications
             else:
-                classifications, raw_json = self._analyze_all_images_batch(images_data)
+                classifications, raw_json = self._analyze_all_images_batch(gemini_images_data)
                 room_classifications = classifications if classifications is not None else []
                 if raw_json:
                     batch_mode_raw_outputs.append(raw_json)
         else:
-            print("🔄 Mode individuel - analyse image par image")
+            self.logger.debug("🔄 Mode individuel - analyse image par image")
             individual_mode_raw_output = [] # Initialize
-            classifications, raw_jsons = self._fallback_to_individual_analysis(images_data)
+            classifications, raw_jsons = self._fallback_to_individual_analysis(gemini_images_data)
             room_classifications = classifications if classifications is not None else []
             if raw_jsons:
                 individual_mode_raw_output = raw_jsons
         
-        # Ajouter les images qui ont échoué au téléchargement
+        # Ajouter les images classées localement et celles qui ont échoué au téléchargement
+        room_classifications.extend(local_classifications)
         room_classifications.extend(failed_images)
         
         # Trier par index d'image pour maintenir l'ordre
@@ -1233,14 +1266,12 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
         room_counts_with_duplicates = {}
         habitable_rooms = 0
         
-        print(f"[DEBUG] Calculating statistics from {len(room_classifications)} classifications")
+        self.logger.debug("Calculating statistics from %d classifications", len(room_classifications))
         
         for classification in room_classifications:
             room_type = classification['room_type_id']
             is_duplicate = classification['is_duplicate']
             
-            print(f"[DEBUG] Processing room: {room_type}, is_duplicate: {is_duplicate}")
-            
             # Compter les pièces uniques
             if not is_duplicate:
                 unique_rooms.add(room_type)
@@ -1262,10 +1293,8 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
             else:
                 room_counts_with_duplicates[room_type] = 1
                 
-        print(f"[DEBUG] Final statistics: unique_rooms={len(unique_rooms)}, duplicate_count={duplicate_count}")
-        print(f"[DEBUG] Room counts (unique): {room_counts}")
-        print(f"[DEBUG] Room counts (with duplicates): {room_counts_with_duplicates}")
-        print(f"[DEBUG] Habitable rooms (unique): {habitable_rooms}")
+        self.logger.debug("Final statistics: unique_rooms=%d, duplicate_count=%d, habitable=%d, room_counts=%s, with_duplicates=%s",
+                          len(unique_rooms), duplicate_count, habitable_rooms, room_counts, room_counts_with_duplicates)
 
         # Traiter les classifications pour obtenir les détails nécessaires pour le résumé
         room_classifications_processed = []
@@ -1328,11 +1357,13 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
                     summary_input_data.extend(parsed_item)
                 elif isinstance(parsed_item, dict):  # Analyse unique
                     summary_input_data.append(parsed_item)
+        # Rooms labelled by the local classifier never appear in a Gemini response
+        summary_input_data.extend(local_classifications)
 
         property_summary_dict = self._generate_property_summary(summary_input_data if summary_input_data else room_classifications_processed)
 
         # Calculer les métriques visuelles agrégées
-        self.logger.debug(f"CASCADE_DEBUG: Content of actual_raw_gemini_output_for_metrics before calling _calculate_aggregated_visual_metrics (type: {type(actual_raw_gemini_output_for_metrics)}): {str(actual_raw_gemini_output_for_metrics)[:1000]}...")
+        self.logger.debug("Raw output for metrics (type %s): %s", type(actual_raw_gemini_output_for_metrics), CappedJson(actual_raw_gemini_output_for_metrics, 1000))
         visual_metrics = self._calculate_aggregated_visual_metrics(actual_raw_gemini_output_for_metrics)
         
         # Encode numeric visual features
@@ -1347,10 +1378,14 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
         )
 
         # Sauvegarder dans la base de données
-        if actual_raw_gemini_output_for_summary_and_db: # S'assurer qu'il y a quelque chose à sauvegarder
+        if len(room_classifications) > len(failed_images): # S'assurer qu'il y a quelque chose à sauvegarder
             try:
                 # Pour la base de données, nous voulons stocker la chaîne JSON brute telle quelle (ou une représentation en chaîne de la liste)
-                if isinstance(actual_raw_gemini_output_for_summary_and_db, list):
+                if not actual_raw_gemini_output_for_summary_and_db:
+                    # Every image was labelled locally (or Gemini failed): no raw response to keep.
+                    # Local labels are not stored here, so they never become training labels.
+                    raw_gemini_json_string_for_db = None
+                elif isinstance(actual_raw_gemini_output_for_summary_and_db, list):
                     raw_gemini_json_string_for_db = json.dumps(actual_raw_gemini_output_for_summary_and_db)
                 else: # C'est déjà une chaîne (espérons-le)
                     raw_gemini_json_string_for_db = actual_raw_gemini_output_for_summary_and_db
@@ -1391,7 +1426,7 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
             except Exception as e:
                 self.logger.error(f"[DB ERROR] Failed to save analysis for '{listing_url}': {e}", exc_info=True)
         else:
-            self.logger.warning("No raw Gemini output available to generate summary or save to DB.")
+            self.logger.warning("No room classifications available to save to DB.")
 
         # Créer l'objet de résultats final
         final_results_object = {
@@ -1413,15 +1448,15 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
             'visual_metrics': visual_metrics,
             'numeric_visual_features': numeric_visual_features,
             'analysis_mode': "batch" if self.batch_mode else "individual",
+            'locally_classified_images': len(local_classifications),
             'execution_time': time.time() - start_time
         }
 
         return final_results_object
     
     def get_room_type_by_id(self, room_id: str) -> Optional[Dict]:
-        """Retourne les détails d'un type de pièce par son ID."""
-        room_types = self._load_room_types()
-        return next((room for room in room_types if room['id'] == room_id), None)
+        """Retourne les détails d'un type de pièce par son ID (index O(1) du registre)."""
+        return self.room_type_registry.get(room_id)
     
     def _encode_numeric_visual_features(
         self,
@@ -1766,7 +1801,7 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
             if not isinstance(analysis, dict):
                 continue
             for key, value in analysis.items():
-                if value is None:
+                if value is None or key == "image_url":
                     continue
                 # Numeric (int / float)
                 if isinstance(value, (int, float)):
@@ -1864,41 +1899,13 @@ Répondez UNIQUEMENT par "oui" si c'est la même pièce, ou "non" si ce sont des
     
     def get_all_listings_for_map(self) -> List[Dict]:
         """Fetches all listings from the database that have coordinate data."""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        listings_for_map = []
         try:
-            cursor.execute("""
-                SELECT 
-                    listing_id, 
-                    scraped_title, 
-                    scraped_street_address, 
-                    scraped_price, 
-                    scraped_area, 
-                    scraped_latitude, 
-                    scraped_longitude
-                FROM property_analyses
-                WHERE scraped_latitude IS NOT NULL AND scraped_longitude IS NOT NULL;
-            """)
-            rows = cursor.fetchall()
-            for row in rows:
-                listings_for_map.append({
-                    'id': row[0],  # Using listing_id as 'id' for map consistency
-                    'title': row[1],
-                    'address': row[2],
-                    'price': row[3],
-                    'area': row[4],
-                    'latitude': row[5],
-                    'longitude': row[6],
-                    'detail_url': row[0]  # listing_id is the detail_url
-                })
-            self.logger.info(f"Fetched {len(listings_for_map)} listings with coordinates for map view.")
+            listings_for_map = self.store.fetch_map_listings()
+            self.logger.info("Fetched %d listings with coordinates for map view.", len(listings_for_map))
+            return listings_for_map
         except sqlite3.Error as e:
-            self.logger.error(f"Database error while fetching listings for map: {e}")
-        finally:
-            if conn:
-                conn.close()
-        return listings_for_map
+            self.logger.error("Database error while fetching listings for map: %s", e)
+            return []
 
     def save_analysis_results(self, results: Dict, output_file: str = 'room_analysis_results.json'):
         
@@ -1939,6 +1946,9 @@ if __name__ == "__main__":
     if not gemini_api_key:
         logger.error("GEMINI_API_KEY not found in environment variables or .env file.")
         exit(1)
+
+    from migrations import migrate_analysis_db
+    migrate_analysis_db()
     
     # Initialize RoomAnalyzer
     # Test with batch_mode=True and enable_duplicate_detection=True for a more comprehensive test
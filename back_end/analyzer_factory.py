@@ -0,0 +1,51 @@
+"""Process-wide ``RoomAnalyzer`` instances for Flask routes and Celery tasks.
+
+Building an analyzer loads the feature/issue vocabulary, the optional local
+classifier and its HTTP session, so routes and tasks share one configured
+instance per option set instead of constructing their own. The analyzer is
+safe to share: per-call state lives on the stack, the rate limiter is locked,
+and the SQLite store hands out one connection per thread.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import threading
+from typing import Dict, Optional, Tuple
+
+from analyze_the_rooms import RoomAnalyzer
+
+_instances: Dict[Tuple, RoomAnalyzer] = {}
+_lock = threading.Lock()
+
+# One module object whether imported as "analyzer_factory" or "back_end.analyzer_factory", so
+# routes and tasks share the process-wide state held here.
+sys.modules.setdefault("analyzer_factory", sys.modules[__name__])
+sys.modules.setdefault("back_end.analyzer_factory", sys.modules[__name__])
+
+
+def get_analyzer(gemini_api_key: Optional[str] = None, **options) -> RoomAnalyzer:
+    """Return the shared analyzer for ``gemini_api_key`` and constructor ``options``.
+
+    The key defaults to ``GEMINI_API_KEY``. Raises ``RuntimeError`` if no key
+    is configured.
+    """
+    api_key = gemini_api_key or os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY not set. Cannot initialize RoomAnalyzer.")
+    key = (api_key, tuple(sorted(options.items())))
+    analyzer = _instances.get(key)
+    if analyzer is None:
+        with _lock:
+            analyzer = _instances.get(key)
+            if analyzer is None:
+                analyzer = _instances[key] = RoomAnalyzer(gemini_api_key=api_key, **options)
+    return analyzer
+
+
+def reset_analyzers() -> None:
+    """Drop cached instances (tests, key rotation)."""
+    with _lock:
+        for analyzer in _instances.values():
+            analyzer.close()
+        _instances.clear()
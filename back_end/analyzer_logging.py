@@ -0,0 +1,139 @@
+"""Logging helpers for the room analyzer hot path.
+
+* One switch (``ANALYZER_DEBUG`` env var or ``configure_analyzer_logging``)
+  controls debug verbosity for every analyzer logger.
+* ``CappedJson`` / ``CappedText`` / ``PayloadSize`` are lazy wrappers. They do
+  no work until a handler actually formats the record, so passing them as
+  ``%s`` arguments costs nothing when debug is off.
+* Serializers never stringify image data: ``inline_data`` / ``inlineData``
+  blobs are replaced by a short size marker, and long strings are truncated
+  before ``json.dumps`` sees them.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Optional
+
+ANALYZER_LOGGER_NAME = "back_end.analyzer"
+DEFAULT_CAP = 500
+_IMAGE_KEYS = {"inline_data", "inlineData"}
+_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+_configured = False
+_config_lock = threading.Lock()
+
+
+def _debug_from_env() -> bool:
+    return os.getenv("ANALYZER_DEBUG", "false").lower() in ("1", "true", "yes")
+
+
+def configure_analyzer_logging(debug: Optional[bool] = None) -> logging.Logger:
+    """Attach a single handler and set the analyzer log level.
+
+    ``debug=None`` reads ``ANALYZER_DEBUG``. Safe to call repeatedly; the
+    handler is only attached once per process.
+    """
+    global _configured
+    root = logging.getLogger(ANALYZER_LOGGER_NAME)
+    level = logging.DEBUG if (_debug_from_env() if debug is None else debug) else logging.INFO
+    with _config_lock:
+        if not _configured:
+            if not root.handlers:
+                handler = logging.StreamHandler()
+                handler.setFormatter(logging.Formatter(_FORMAT))
+                root.addHandler(handler)
+            root.propagate = False
+            _configured = True
+        root.setLevel(level)
+    return root
+
+
+def get_analyzer_logger(suffix: Optional[str] = None) -> logging.Logger:
+    """Return a child of the analyzer logger, configuring it on first use."""
+    if not _configured:
+        configure_analyzer_logging()
+    return logging.getLogger(f"{ANALYZER_LOGGER_NAME}.{suffix}" if suffix else ANALYZER_LOGGER_NAME)
+
+
+def _redact(obj: Any, cap: int, depth: int = 0) -> Any:
+    """Copy ``obj`` with image blobs replaced and long strings / lists shortened."""
+    if depth > 6:
+        return "…"
+    if isinstance(obj, dict):
+        out = {}
+        for k, v in obj.items():
+            if k in _IMAGE_KEYS and isinstance(v, dict):
+                data = v.get("data")
+                out[k] = f"<{v.get('mime_type') or v.get('mimeType') or 'image'} {len(data) if isinstance(data, str) else 0} b64 chars>"
+            else:
+                out[k] = _redact(v, cap, depth + 1)
+        return out
+    if isinstance(obj, (list, tuple)):
+        items = [_redact(v, cap, depth + 1) for v in obj[:20]]
+        if len(obj) > 20:
+            items.append(f"… {len(obj) - 20} more")
+        return items
+    if isinstance(obj, str) and len(obj) > cap:
+        return obj[:cap] + f"… ({len(obj)} chars)"
+    return obj
+
+
+class CappedJson:
+    """Lazy, image-safe, length-capped JSON rendering of ``obj``."""
+
+    __slots__ = ("obj", "cap")
+
+    def __init__(self, obj: Any, cap: int = DEFAULT_CAP) -> None:
+        self.obj = obj
+        self.cap = cap
+
+    def __str__(self) -> str:
+        try:
+            text = json.dumps(_redact(self.obj, self.cap), ensure_ascii=False, default=str)
+        except Exception:
+            text = repr(type(self.obj))
+        return text if len(text) <= self.cap else text[: self.cap] + "… (truncated)"
+
+    __repr__ = __str__
+
+
+class CappedText:
+    """Lazy truncation of a (possibly huge) string or object's ``str()``."""
+
+    __slots__ = ("value", "cap")
+
+    def __init__(self, value: Any, cap: int = DEFAULT_CAP) -> None:
+        self.value = value
+        self.cap = cap
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else str(_redact(self.value, self.cap))
+        return text if len(text) <= self.cap else text[: self.cap] + f"… ({len(text)} chars)"
+
+    __repr__ = __str__
+
+
+def payload_size(obj: Any) -> int:
+    """Approximate payload size in characters without serializing it."""
+    if isinstance(obj, str):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sum(len(str(k)) + payload_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sum(payload_size(v) for v in obj)
+    return 8
+
+
+class PayloadSize:
+    """Lazy ``payload_size`` in KiB, for log arguments."""
+
+    __slots__ = ("obj",)
+
+    def __init__(self, obj: Any) -> None:
+        self.obj = obj
+
+    def __str__(self) -> str:
+        return str(payload_size(self.obj) // 1024)
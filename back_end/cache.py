@@ -1,17 +1,42 @@
-"""Redis-backed simple cache for HTTP and geocoding responses."""
+"""Redis-backed simple cache for HTTP and geocoding responses.
+
+HTTP entries are envelopes holding the body plus its ``ETag`` /
+``Last-Modified`` validators and a freshness deadline. The Redis key outlives
+freshness by ``HTTP_CACHE_STALE_TTL`` seconds, so an expired page can still be
+revalidated with a conditional GET (``fetch_pro_helpers.ProFetcher.get_text_cached``).
+A 304 renews the entry without downloading the body again.
+
+Envelopes are stored compressed (zstd when ``zstandard`` is installed, else
+zlib) through a second, binary Redis client, behind a one-byte codec tag.
+Text values written by older code are still read.
+"""
 import json
 import hashlib
 import os
 import logging
-from typing import Optional
+import sys
+import time
+import zlib
+from typing import Dict, Optional, Union
 
 import redis
 from redis.exceptions import RedisError
 
+try:
+    import zstandard as _zstd  # optional, better ratio and faster than zlib
+except ImportError:  # pragma: no cover - depends on environment
+    _zstd = None
+
 _logger = logging.getLogger(__name__)
 
 _REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 _redis_client: Optional[redis.Redis] = None
+_redis_binary_client: Optional[redis.Redis] = None
+
+# One module object whether imported as "cache" or "back_end.cache", so
+# routes and tasks share the process-wide state held here.
+sys.modules.setdefault("cache", sys.modules[__name__])
+sys.modules.setdefault("back_end.cache", sys.modules[__name__])
 
 
 # ------------------ In-memory fallback ------------------
@@ -39,6 +64,9 @@ class _DummyCache:
 
         self._store[key] = (value, time.time() + ttl)
 
+    def delete(self, *keys: str):
+        return sum(1 for k in keys if self._store.pop(k, None) is not None)
+
 
 _dummy_cache = _DummyCache()
 
@@ -57,6 +85,17 @@ def get_redis() -> redis.Redis:
     return _redis_client
 
 
+def get_redis_binary() -> redis.Redis:
+    """Client returning ``bytes`` (for compressed values); same server as ``get_redis``."""
+    global _redis_binary_client
+    if _redis_binary_client is None:
+        if isinstance(get_redis(), _DummyCache):
+            _redis_binary_client = get_redis()
+        else:
+            _redis_binary_client = redis.Redis.from_url(_REDIS_URL, decode_responses=False)
+    return _redis_binary_client
+
+
 def _make_key(namespace: str, raw: str) -> str:
     digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
     return f"{namespace}:{digest}"
@@ -72,15 +111,117 @@ def set_cached(namespace: str, raw: str, value: str, ttl: int = 86400):
     get_redis().setex(key, ttl, value)
 
 
-# Convenience wrappers -------------------------------------
+def delete_cached(namespace: str, *raws: str) -> int:
+    """Drop one or more entries of ``namespace`` in a single round-trip."""
+    if not raws:
+        return 0
+    try:
+        return get_redis().delete(*(_make_key(namespace, raw) for raw in raws))
+    except RedisError as e:
+        _logger.warning("Cache delete failed for %s (%d keys): %s", namespace, len(raws), e)
+        return 0
+
+
+# HTTP responses -------------------------------------------
+
+HTTP_CACHE_STALE_TTL = int(os.getenv("HTTP_CACHE_STALE_TTL", str(7 * 86400)))
+HTTP_CACHE_CODEC = os.getenv("HTTP_CACHE_CODEC", "zstd" if _zstd else "zlib")
+_ENVELOPE_PREFIX = '{"_http":'
+# First byte of a compressed value; text values never start with these.
+_ZLIB_TAG, _ZSTD_TAG = b"\x01", b"\x02"
+_zstd_compressor = _zstd.ZstdCompressor(level=6) if _zstd else None
+_zstd_decompressor = _zstd.ZstdDecompressor() if _zstd else None
+
+
+def _compress(text: str) -> bytes:
+    data = text.encode("utf-8")
+    if HTTP_CACHE_CODEC == "zstd" and _zstd_compressor is not None:
+        return _ZSTD_TAG + _zstd_compressor.compress(data)
+    return _ZLIB_TAG + zlib.compress(data, 6)
+
+
+def _decompress(raw: Union[bytes, str]) -> str:
+    if isinstance(raw, str):
+        return raw
+    tag, body = raw[:1], raw[1:]
+    if tag == _ZSTD_TAG:
+        if _zstd_decompressor is None:
+            raise ValueError("zstd-compressed cache entry but zstandard is not installed")
+        return _zstd_decompressor.decompress(body).decode("utf-8")
+    if tag == _ZLIB_TAG:
+        return zlib.decompress(body).decode("utf-8")
+    return raw.decode("utf-8")
+
+
+def _http_key(url: str, variant: Optional[str]) -> str:
+    return _make_key("http", f"{url}#{variant}" if variant else url)
+
+
+def http_get_entry(url: str, variant: Optional[str] = None) -> Optional[Dict]:
+    """Cached envelope for ``url`` (fresh or stale), or ``None``.
+
+    Keys: ``body``, ``etag``, ``last_modified``, ``fresh_until`` (epoch
+    seconds). ``variant`` names a reduced form of the body (e.g. only the
+    fragments a parser needs) cached separately from the full document.
+    """
+    try:
+        raw = get_redis_binary().get(_http_key(url, variant))
+        if raw is None:
+            return None
+        text = _decompress(raw)
+    except (RedisError, ValueError, zlib.error) as e:
+        _logger.warning("HTTP cache read failed for %s: %s", url, e)
+        return None
+    if not text.startswith(_ENVELOPE_PREFIX):
+        # Entry written before envelopes: fresh for as long as Redis keeps it.
+        return {"body": text, "etag": None, "last_modified": None, "fresh_until": float("inf")}
+    try:
+        entry = json.loads(text)
+    except ValueError:
+        return None
+    entry.pop("_http", None)
+    return entry
+
+
+def http_is_fresh(entry: Optional[Dict]) -> bool:
+    return bool(entry) and entry.get("fresh_until", 0) > time.time()
+
+
+def http_put_entry(url: str, body: str, ttl: int, etag: Optional[str] = None,
+                   last_modified: Optional[str] = None, variant: Optional[str] = None) -> int:
+    """Store ``body`` fresh for ``ttl`` seconds; return the stored (compressed) size in bytes.
+
+    Entries with validators are kept ``HTTP_CACHE_STALE_TTL`` longer for revalidation.
+    """
+    envelope = {"_http": 1, "body": body, "etag": etag, "last_modified": last_modified,
+                "fresh_until": time.time() + ttl}
+    keep = max(1, ttl + HTTP_CACHE_STALE_TTL if (etag or last_modified) else ttl)
+    value = _compress(json.dumps(envelope, separators=(",", ":"), ensure_ascii=False))
+    try:
+        get_redis_binary().setex(_http_key(url, variant), keep, value)
+    except RedisError as e:
+        _logger.warning("HTTP cache write failed for %s: %s", url, e)
+    return len(value)
+
+
+def http_renew_entry(url: str, entry: Dict, ttl: int, etag: Optional[str] = None,
+                     last_modified: Optional[str] = None, variant: Optional[str] = None) -> int:
+    """A 304 confirmed ``entry``: restart its freshness, taking any updated validators."""
+    return http_put_entry(url, entry["body"], ttl, etag or entry.get("etag"),
+                          last_modified or entry.get("last_modified"), variant)
+
 
 def http_get_cached(url: str) -> Optional[str]:
-    return get_cached("http", url)
+    """Body cached for ``url`` if still fresh."""
+    entry = http_get_entry(url)
+    return entry["body"] if http_is_fresh(entry) else None
 
 
 def http_set_cached(url: str, text: str, ttl: int = 86400):
-    set_cached("http", url, text, ttl)
+    http_put_entry(url, text, ttl)
+
 
+# Geocoding ------------------------------------------------
 
 def geo_get_cached(addr: str) -> Optional[str]:
     return get_cached("geo", addr)
@@ -0,0 +1,414 @@
+"""Pipelined asyncio crawl of Otodom search results.
+
+Stages, connected by bounded ``asyncio.Queue`` s:
+
+    fetch pages -> parse items (+ batch geocode per page) -> enrich details (+ inline analysis) -> emit chunks
+
+* Page N+1 is fetched while page N's listings are still being enriched. The
+  bounded queues apply back-pressure, so a slow stage throttles the fetcher
+  instead of buffering the whole search in memory.
+* ``chunks()`` / ``iter_crawl_chunks()`` stream finalized listings in small
+  chunks as soon as they are enriched; ``scrape_sinks`` persists each chunk,
+  so a crash late in a long crawl keeps everything before it.
+* Incremental mode (``CRAWL_INCREMENTAL``, on by default) consults
+  ``seen_index.SeenIndex``: listings whose search-item content hash is
+  unchanged since the last run are skipped before geocoding, enrichment,
+  writes and analysis dispatch, and paging stops after
+  ``CRAWL_STOP_AFTER_KNOWN`` consecutive unchanged listings (results are
+  newest first), so requests scale with new inventory, not page count.
+  New and changed listings are emitted as ``ListingChunk`` s and only
+  marked seen when the chunk is stored (``scrape_sinks.persist_stream``).
+* Blocking work (``ProFetcher``, the geocoding stage, the analyzer) runs in worker threads
+  via ``asyncio.to_thread``; the event loop only schedules.
+* ``HostLimiter`` caps concurrent requests per host and enforces a minimum
+  interval between request starts per host. Configure with
+  ``CRAWL_HOST_CONCURRENCY`` / ``CRAWL_HOST_INTERVAL`` as
+  ``host=value`` pairs, e.g. ``www.otodom.pl=4``.
+* The per-listing logic (parsing, geocoding, enrichment, validation, final
+  normalization) is shared with the sequential path in ``otodom_scraper``.
+  The scraper module is passed in rather than imported here: it is loaded as
+  both ``otodom_scraper`` and ``back_end.otodom_scraper`` depending on the
+  caller, and importing the other name would run its start-up side effects
+  (metrics server, logging config) a second time.
+"""
+from __future__ import annotations
+
+import asyncio
+import importlib
+import logging
+import os
+import queue
+import threading
+from contextlib import asynccontextmanager
+from types import ModuleType
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlparse
+
+from seen_index import ListingChunk, SeenIndex, split_unchanged
+
+logger = logging.getLogger(__name__)
+
+OTODOM_HOST = "www.otodom.pl"
+
+DEFAULT_CHUNK_SIZE = int(os.getenv("CRAWL_CHUNK_SIZE", "50"))
+
+_DONE = object()  # end-of-stream marker passed down the pipeline
+
+
+def _host_map(raw: Optional[str], cast) -> Dict[str, float]:
+    """Parse ``host=value,host=value`` (as used by the CRAWL_HOST_* env vars)."""
+    out = {}
+    for part in (raw or "").split(","):
+        host, sep, value = part.partition("=")
+        if sep and host.strip():
+            out[host.strip()] = cast(value)
+    return out
+
+
+class CrawlConfig:
+    """Tuning knobs for one crawl; ``from_env()`` reads the ``CRAWL_*`` variables."""
+
+    def __init__(self, *, page_queue_size: int = 2, listing_queue_size: int = 64,
+                 enrich_workers: int = 8, host_concurrency: Optional[Dict[str, int]] = None,
+                 host_interval: Optional[Dict[str, float]] = None,
+                 default_host_concurrency: int = 4, default_host_interval: float = 0.0,
+                 incremental: bool = False, stop_after_known: int = 20) -> None:
+        self.page_queue_size = page_queue_size
+        self.listing_queue_size = listing_queue_size
+        self.enrich_workers = max(1, enrich_workers)
+        # Nominatim is not listed: geocoding.py paces it process-wide.
+        self.host_concurrency = {OTODOM_HOST: 8, **(host_concurrency or {})}
+        self.host_interval = {OTODOM_HOST: 0.25, **(host_interval or {})}
+        self.default_host_concurrency = default_host_concurrency
+        self.default_host_interval = default_host_interval
+        # Incremental mode: skip unchanged listings and stop paging after
+        # ``stop_after_known`` consecutive unchanged ones (0 = never stop early).
+        self.incremental = incremental
+        self.stop_after_known = stop_after_known
+
+    @classmethod
+    def from_env(cls) -> "CrawlConfig":
+        return cls(
+            page_queue_size=int(os.getenv("CRAWL_PAGE_QUEUE", "2")),
+            listing_queue_size=int(os.getenv("CRAWL_LISTING_QUEUE", "64")),
+            enrich_workers=int(os.getenv("CRAWL_ENRICH_WORKERS", os.getenv("DETAIL_MAX_WORKERS", "8"))),
+            host_concurrency=_host_map(os.getenv("CRAWL_HOST_CONCURRENCY"), int),
+            host_interval=_host_map(os.getenv("CRAWL_HOST_INTERVAL"), float),
+            incremental=os.getenv("CRAWL_INCREMENTAL", "true").lower() == "true",
+            stop_after_known=int(os.getenv("CRAWL_STOP_AFTER_KNOWN", "20")),
+        )
+
+
+class HostLimiter:
+    """Per-host concurrency cap plus a minimum gap between request starts."""
+
+    def __init__(self, concurrency: Dict[str, int], interval: Dict[str, float],
+                 default_concurrency: int = 4, default_interval: float = 0.0) -> None:
+        self.concurrency = concurrency
+        self.interval = interval
+        self.default_concurrency = default_concurrency
+        self.default_interval = default_interval
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._gates: Dict[str, asyncio.Lock] = {}
+        self._next_start: Dict[str, float] = {}
+
+    @asynccontextmanager
+    async def slot(self, url_or_host: str) -> AsyncIterator[None]:
+        host = urlparse(url_or_host).netloc or url_or_host
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(
+                max(1, int(self.concurrency.get(host, self.default_concurrency)))
+            )
+            self._gates[host] = asyncio.Lock()
+        async with semaphore:
+            interval = self.interval.get(host, self.default_interval)
+            if interval > 0:
+                loop = asyncio.get_running_loop()
+                async with self._gates[host]:
+                    wait = self._next_start.get(host, 0.0) - loop.time()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    self._next_start[host] = loop.time() + interval
+            yield
+
+
+class CrawlEngine:
+    """One search crawl: ``await run()`` returns all listings, ``chunks()`` streams them."""
+
+    def __init__(self, scraper: ModuleType, max_pages: Optional[int] = None, analyzer_instance=None,
+                 config: Optional[CrawlConfig] = None, search_url: Optional[str] = None,
+                 seen_index=None) -> None:
+        self.scraper = scraper
+        self.max_pages = max_pages or scraper.DEFAULT_MAX_PAGES
+        self.analyzer = analyzer_instance
+        self.config = config or CrawlConfig.from_env()
+        self.search_url = search_url or scraper.BASE_OTODOM_SEARCH_URL_WROCLAW
+        self.limiter = HostLimiter(
+            self.config.host_concurrency, self.config.host_interval,
+            self.config.default_host_concurrency, self.config.default_host_interval,
+        )
+        if seen_index is None and self.config.incremental:
+            seen_index = SeenIndex()
+        self.seen = seen_index
+        self.stats = {"new": 0, "changed": 0, "unchanged": 0}
+        self._known_streak = 0
+        self._stop_paging = False
+
+    async def run(self) -> List[Dict]:
+        """Crawl everything and return all listings (kept for list-based callers).
+
+        The result is one ``ListingChunk``: pass it to ``persist_stream`` (or
+        call ``commit()`` after storing it) to mark the listings seen.
+        """
+        results = ListingChunk(index=self.seen)
+
+        async def collect(chunk: List[Dict]) -> None:
+            results.absorb(chunk)
+
+        await self._run_pipeline(collect, chunk_size=self.scraper.SCRAPE_DB_FLUSH_EVERY)
+        return results
+
+    async def chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[List[Dict]]:
+        """Yield finalized listings in chunks of up to ``chunk_size`` as soon as they are enriched.
+
+        At most one chunk waits for the consumer; a slow consumer throttles the crawl.
+        """
+        out: asyncio.Queue = asyncio.Queue(maxsize=1)
+        task = asyncio.create_task(self._run_pipeline(out.put, chunk_size))
+        try:
+            while True:
+                getter = asyncio.ensure_future(out.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    await asyncio.gather(getter, return_exceptions=True)
+                if getter.done() and not getter.cancelled():
+                    yield getter.result()
+                    continue
+                while not out.empty():
+                    yield out.get_nowait()
+                task.result()  # re-raise pipeline errors
+                return
+        finally:
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+    async def _run_pipeline(self, emit: Callable[[List[Dict]], Awaitable[None]], chunk_size: int) -> None:
+        cfg = self.config
+        pages: asyncio.Queue = asyncio.Queue(maxsize=cfg.page_queue_size)
+        parsed: asyncio.Queue = asyncio.Queue(maxsize=cfg.listing_queue_size)
+        enriched: asyncio.Queue = asyncio.Queue(maxsize=cfg.listing_queue_size)
+
+        tasks = [
+            asyncio.create_task(self._fetch_pages(pages)),
+            asyncio.create_task(self._parse(pages, parsed)),
+            *(asyncio.create_task(self._enrich(parsed, enriched)) for _ in range(cfg.enrich_workers)),
+            asyncio.create_task(self._persist(enriched, emit, max(1, chunk_size))),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    # ----------------- Stages -----------------
+    async def _fetch_pages(self, out: asyncio.Queue) -> None:
+        scraper = self.scraper
+        try:
+            for page in range(1, self.max_pages + 1):
+                if self._stop_paging:
+                    logger.info("Reached %d consecutive known listings; stopping before page %d.",
+                                self._known_streak, page)
+                    break
+                url = self.search_url.format(page=page)
+                logger.info("Scraping URL: %s", url)
+                async with self.limiter.slot(url):
+                    next_data = await asyncio.to_thread(scraper.fetch_search_next_data, url)
+                try:
+                    items = scraper._search_items(next_data) if next_data else []
+                except KeyError as e:
+                    logger.error("KeyError while accessing searchAds items: %s. Check __NEXT_DATA__ structure.", e)
+                    items = []
+                if not items:
+                    logger.info("No listings found on page %d. Stopping pagination.", page)
+                    break
+                logger.info("Found %d items on page %d.", len(items), page)
+                await out.put(items)
+        finally:
+            await out.put(_DONE)
+
+    async def _parse(self, inp: asyncio.Queue, out: asyncio.Queue) -> None:
+        scraper = self.scraper
+        try:
+            while (items := await inp.get()) is not _DONE:
+                if self.seen is not None:
+                    entries, unchanged = await asyncio.to_thread(split_unchanged, self.seen, items)
+                    self._count_states(entries)
+                else:
+                    entries, unchanged = [(item, None, "new") for item in items], []
+                parsed = []
+                for item, content_hash, state in entries:
+                    if state == "unchanged":
+                        continue
+                    try:
+                        basic, street, city = scraper._listing_from_search_item(item)
+                    except Exception as e:
+                        logger.warning("Error parsing a specific listing item (ID: %s): %s", item.get("id", "N/A"), e)
+                        continue
+                    if not city:
+                        logger.warning("Skipping geocoding for listing ID %s due to missing city name.",
+                                       basic.get("id", "N/A"))
+                    parsed.append((basic, street, city, content_hash))
+                to_geocode = [(basic, street, city) for basic, street, city, _ in parsed if city]
+                if to_geocode:
+                    # One batch per page: addresses are deduplicated and
+                    # Nominatim is paced inside the geocoding stage.
+                    await asyncio.to_thread(scraper._geocode_listings, to_geocode)
+                for basic, street, city, content_hash in parsed:
+                    try:
+                        await out.put((scraper._validate_listing(basic), street, bool(city), content_hash))
+                    except Exception as e:
+                        logger.warning("Error parsing a specific listing item (ID: %s): %s", basic.get("id", "N/A"), e)
+                if unchanged:
+                    # Bump last-seen only: in the seen index and in listing_latest (time on market).
+                    await asyncio.to_thread(self.seen.mark, unchanged)
+                    await asyncio.to_thread(scraper._touch_listings, [listing_id for listing_id, _ in unchanged])
+                if self.config.stop_after_known and self._known_streak >= self.config.stop_after_known:
+                    self._stop_paging = True
+        finally:
+            for _ in range(self.config.enrich_workers):
+                await out.put(_DONE)
+
+    def _count_states(self, entries: List) -> None:
+        """Update run stats, the exported counters and the consecutive-known streak."""
+        page_counts = {"new": 0, "changed": 0, "unchanged": 0}
+        for _, _, state in entries:
+            page_counts[state] += 1
+            # A changed listing is still fresh inventory for this run, so it
+            # breaks the streak just like a new one.
+            self._known_streak = self._known_streak + 1 if state == "unchanged" else 0
+        for state, n in page_counts.items():
+            self.stats[state] += n
+        self.scraper._record_listing_states(page_counts)
+
+    async def _enrich(self, inp: asyncio.Queue, out: asyncio.Queue) -> None:
+        scraper = self.scraper
+        try:
+            while (entry := await inp.get()) is not _DONE:
+                listing, street, geocoded, content_hash = entry
+                if geocoded and self.analyzer:
+                    await asyncio.to_thread(scraper._analyze_listing_inline, self.analyzer, listing)
+                if scraper.ENABLE_DETAIL_FETCH:
+                    try:
+                        async with self.limiter.slot(listing.get("detail_url") or OTODOM_HOST):
+                            listing = await asyncio.to_thread(scraper._enrich_listing_details, listing)
+                    except Exception as e:
+                        logger.debug("Detail enrichment failed for %s: %s", listing.get("id"), e)
+                await out.put((listing, street, geocoded, content_hash))
+        finally:
+            await out.put(_DONE)
+
+    async def _persist(self, inp: asyncio.Queue, emit: Callable[[List[Dict]], Awaitable[None]],
+                       chunk_size: int) -> None:
+        scraper = self.scraper
+        rows: List[Dict] = []
+        chunk: List[Dict] = []
+        seen: List = []
+        remaining = self.config.enrich_workers
+
+        async def flush() -> None:
+            # SQLite scrape rows land before the chunk is handed on. Listings are
+            # marked seen by whoever stores the chunk (ListingChunk.commit, called
+            # by scrape_sinks.persist_stream once every sink has written it).
+            if self.analyzer:
+                await asyncio.to_thread(scraper._flush_scrape_rows, self.analyzer, rows)
+            if chunk:
+                await emit(ListingChunk(scraper._finalize_listings(list(chunk)), self.seen, seen))
+                chunk.clear()
+                seen.clear()
+
+        while remaining:
+            entry = await inp.get()
+            if entry is _DONE:
+                remaining -= 1
+                continue
+            listing, street, geocoded, content_hash = entry
+            chunk.append(listing)
+            if self.seen is not None:
+                seen.append((str(listing.get("id")), content_hash))
+            if self.analyzer and geocoded:
+                rows.append(scraper._scrape_row(listing, street))
+            if len(chunk) >= chunk_size:
+                await flush()
+        await flush()
+        if self.seen is not None:
+            await asyncio.to_thread(self.seen.prune)
+            logger.info("Incremental crawl: %(new)d new, %(changed)d changed, %(unchanged)d unchanged listings",
+                        self.stats)
+
+
+def _default_scraper(scraper: Optional[ModuleType]) -> ModuleType:
+    return scraper or importlib.import_module("otodom_scraper")
+
+
+def crawl_otodom_search(max_pages: Optional[int] = None, analyzer_instance=None,
+                        config: Optional[CrawlConfig] = None,
+                        scraper: Optional[ModuleType] = None) -> List[Dict]:
+    """Synchronous entry point (scripts, Flask routes, Celery tasks)."""
+    engine = CrawlEngine(_default_scraper(scraper), max_pages=max_pages,
+                         analyzer_instance=analyzer_instance, config=config)
+    return asyncio.run(engine.run())
+
+
+def iter_crawl_chunks(max_pages: Optional[int] = None, analyzer_instance=None,
+                      config: Optional[CrawlConfig] = None, scraper: Optional[ModuleType] = None,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[Dict]]:
+    """Synchronous generator over ``CrawlEngine.chunks``.
+
+    The event loop runs on a helper thread and hands chunks over through a
+    one-slot queue, so memory stays flat however many pages are crawled.
+    Closing the generator early stops the crawl.
+    """
+    engine = CrawlEngine(_default_scraper(scraper), max_pages=max_pages,
+                         analyzer_instance=analyzer_instance, config=config)
+    handoff: queue.Queue = queue.Queue(maxsize=1)
+    stop = threading.Event()
+
+    async def pump() -> None:
+        stream = engine.chunks(chunk_size)
+        try:
+            async for chunk in stream:
+                await asyncio.to_thread(handoff.put, chunk)
+                if stop.is_set():
+                    break
+        finally:
+            await stream.aclose()
+
+    def worker() -> None:
+        try:
+            asyncio.run(pump())
+            handoff.put(_DONE)
+        except BaseException as e:  # surfaced in the consumer thread
+            handoff.put(e)
+
+    thread = threading.Thread(target=worker, name="crawl-engine", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = handoff.get()
+            if item is _DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        while thread.is_alive():  # unblock a pending put until the crawl winds down
+            try:
+                handoff.get(timeout=0.1)
+            except queue.Empty:
+                pass
@@ -1,17 +1,26 @@
 """SQLAlchemy session and table definitions for listings."""
 from __future__ import annotations
 
+import csv
+import hashlib
+import io
+import json
+import logging
 import os
-from sqlalchemy import (Column, Float, Integer, MetaData, String, Table,
-                        create_engine, inspect)
+import threading
+from sqlalchemy import (JSON, Column, Float, Integer, MetaData, String, Table,
+                        create_engine, inspect, text)
 from sqlalchemy.orm import sessionmaker
 
 # Optional Postgres; fallback to no-op if unavailable
 try:
     from sqlalchemy.dialects.postgresql import JSONB  # type: ignore
+    JSONType = JSON().with_variant(JSONB(), "postgresql")
 except Exception:
     # SQLite fallback type
-    from sqlalchemy import JSON as JSONB  # type: ignore
+    JSONType = JSON()  # type: ignore
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
@@ -42,64 +51,170 @@ listings_table = Table(
     Column("latitude", Float),
     Column("longitude", Float),
     Column("detail_url", String),
-    Column("images", JSONB),
+    Column("images", JSONType),
     Column("date_created", String),
-    Column("extras", JSONB),
+    Column("extras", JSONType),
+    # sha256 of the row content; upserts skip rows whose hash is unchanged
+    Column("content_hash", String(64)),
 )
 
+CORE_COLUMNS = [
+    "id", "title", "price", "currency", "price_per_sqm", "area_sqm", "rooms", "city_name",
+    "latitude", "longitude", "detail_url", "images", "date_created",
+]
+JSON_COLUMNS = {"images", "extras"}
+WRITE_COLUMNS = CORE_COLUMNS + ["extras", "content_hash"]
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
 
 def init_db():
-    if not _engine_available:
+    """Create/patch the listings table once per process."""
+    global _schema_ready
+    if not _engine_available or _schema_ready:
         return
-    inspector = inspect(engine)
-    if not inspector.has_table("listings"):
-        metadata_obj.create_all(engine)
+    with _schema_lock:
+        if _schema_ready:
+            return
+        inspector = inspect(engine)
+        if not inspector.has_table("listings"):
+            metadata_obj.create_all(engine)
+        elif "content_hash" not in {c["name"] for c in inspector.get_columns("listings")}:
+            with engine.begin() as conn:
+                conn.execute(text("ALTER TABLE listings ADD COLUMN content_hash VARCHAR(64)"))
+        _schema_ready = True
+
+
+# ------------------ Row preparation ------------------
+
+def listing_content_hash(row: dict) -> str:
+    """Stable hash of a prepared row's content (``id`` and ``content_hash`` excluded)."""
+    payload = {k: v for k, v in row.items() if k not in ("id", "content_hash")}
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _prepare_rows(listings: list[dict]) -> list[dict]:
+    """Core columns + 'extras' + content hash; duplicate ids keep the last occurrence."""
+    by_id: dict = {}
+    for l in listings:
+        row = {col: l.get(col) for col in CORE_COLUMNS}
+        row["id"] = str(l["id"])
+        # Combine miscellaneous cols into 'extras'
+        row["extras"] = {k: v for k, v in l.items() if k not in CORE_COLUMNS}
+        row["content_hash"] = listing_content_hash(row)
+        by_id[row["id"]] = row
+    return list(by_id.values())
+
+
+def _db_value(col: str, value):
+    if col in JSON_COLUMNS and value is not None:
+        return json.dumps(value, ensure_ascii=False, default=str)
+    return value
+
+
+# ------------------ Writers ------------------
+
+_UPDATE_SET = ", ".join(f"{c} = EXCLUDED.{c}" for c in WRITE_COLUMNS if c != "id")
+
+_PG_MERGE_SQL = f"""
+    INSERT INTO listings ({", ".join(WRITE_COLUMNS)})
+    SELECT {", ".join(f"{c}::jsonb" if c in JSON_COLUMNS else c for c in WRITE_COLUMNS)} FROM listings_stage
+    ON CONFLICT (id) DO UPDATE SET {_UPDATE_SET}
+    WHERE listings.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+    RETURNING (xmax = 0) AS inserted
+"""
+
+_SQLITE_UPSERT_SQL = f"""
+    INSERT INTO listings ({", ".join(WRITE_COLUMNS)})
+    VALUES ({", ".join(":" + c for c in WRITE_COLUMNS)})
+    ON CONFLICT (id) DO UPDATE SET {_UPDATE_SET}
+    WHERE listings.content_hash IS NOT EXCLUDED.content_hash
+"""
+
+_COPY_NULL = r"\N"
+
+
+def _dbapi_connection(conn):
+    fairy = conn.connection
+    return getattr(fairy, "dbapi_connection", None) or fairy.connection
+
+
+def _upsert_postgres(conn, rows: list[dict]) -> dict:
+    """COPY rows into a temp staging table, then one set-based merge."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        writer.writerow([
+            _COPY_NULL if row[c] is None else _db_value(c, row[c]) for c in WRITE_COLUMNS
+        ])
+    buf.seek(0)
+
+    conn.execute(text(
+        "CREATE TEMP TABLE listings_stage "
+        "(LIKE listings INCLUDING DEFAULTS) ON COMMIT DROP"
+    ))
+    # Staging JSON columns as text keeps COPY input as plain CSV; the merge casts back.
+    for col in JSON_COLUMNS:
+        conn.execute(text(f"ALTER TABLE listings_stage ALTER COLUMN {col} TYPE text"))
+    copy_sql = (
+        f"COPY listings_stage ({', '.join(WRITE_COLUMNS)}) FROM STDIN "
+        f"WITH (FORMAT csv, NULL '{_COPY_NULL}')"
+    )
+    cursor = _dbapi_connection(conn).cursor()
+    try:
+        if hasattr(cursor, "copy_expert"):  # psycopg2
+            cursor.copy_expert(copy_sql, buf)
+        else:  # psycopg 3
+            with cursor.copy(copy_sql) as copy:
+                copy.write(buf.getvalue())
+    finally:
+        cursor.close()
+
+    flags = [r[0] for r in conn.execute(text(_PG_MERGE_SQL))]
+    inserted = sum(1 for f in flags if f)
+    updated = len(flags) - inserted
+    return {"inserted": inserted, "updated": updated, "unchanged": len(rows) - len(flags)}
+
+
+def _upsert_sqlite(conn, rows: list[dict], chunk_size: int = 500) -> dict:
+    """executemany fallback for local SQLite stand-ins."""
+    inserted = updated = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        params = {f"id{i}": r["id"] for i, r in enumerate(chunk)}
+        existing = dict(conn.execute(
+            text(f"SELECT id, content_hash FROM listings WHERE id IN ({', '.join(':' + k for k in params)})"),
+            params,
+        ).fetchall())
+        for r in chunk:
+            if r["id"] not in existing:
+                inserted += 1
+            elif existing[r["id"]] != r["content_hash"]:
+                updated += 1
+        conn.execute(
+            text(_SQLITE_UPSERT_SQL),
+            [{c: _db_value(c, r[c]) for c in WRITE_COLUMNS} for r in chunk],
+        )
+    return {"inserted": inserted, "updated": updated, "unchanged": len(rows) - inserted - updated}
+
 
+def upsert_listings(listings: list[dict]) -> dict:
+    """Insert new listings and update changed ones.
 
-def upsert_listings(listings: list[dict]):
+    Rows whose content hash matches the stored one are left untouched.
+    Returns ``{"inserted", "updated", "unchanged"}`` counts.
+    """
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
     if not listings or not _engine_available:
-        return 0
+        return counts
     init_db()
-    from sqlalchemy.dialects.postgresql import insert  # type: ignore
+    rows = _prepare_rows(listings)
     with engine.begin() as conn:
-        # Prepare rows; combine miscellaneous cols into 'extras'
-        rows = []
-        for l in listings:
-            core_cols = {
-                "id": l["id"],
-                "title": l.get("title"),
-                "price": l.get("price"),
-                "currency": l.get("currency"),
-                "price_per_sqm": l.get("price_per_sqm"),
-                "area_sqm": l.get("area_sqm"),
-                "rooms": l.get("rooms"),
-                "city_name": l.get("city_name"),
-                "latitude": l.get("latitude"),
-                "longitude": l.get("longitude"),
-                "detail_url": l.get("detail_url"),
-                "images": l.get("images"),
-                "date_created": l.get("date_created"),
-                "extras": {
-                    k: v
-                    for k, v in l.items()
-                    if k not in {
-                        "id",
-                        "title",
-                        "price",
-                        "currency",
-                        "price_per_sqm",
-                        "area_sqm",
-                        "rooms",
-                        "city_name",
-                        "latitude",
-                        "longitude",
-                        "detail_url",
-                        "images",
-                        "date_created",
-                    }
-                },
-            }
-            rows.append(core_cols)
-        insert_stmt = listings_table.insert().prefix_with("ON CONFLICT (id) DO NOTHING")
-        result = conn.execute(insert_stmt, rows)
-        return result.rowcount
+        if engine.dialect.name == "postgresql":
+            counts = _upsert_postgres(conn, rows)
+        else:
+            counts = _upsert_sqlite(conn, rows)
+    logger.debug("upsert_listings: %s", counts)
+    return counts
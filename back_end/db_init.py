@@ -3,6 +3,7 @@ Veritabanını oluşturmak için araç.
 """
 
 from models import db, Listing, ListingDetail, Image, RoomClassification, SameRoomRelation, AnalysisResult
+from analysis_store import sqlalchemy_uri
 from flask import Flask
 import os
 import argparse
@@ -10,7 +11,7 @@ import argparse
 def init_db():
     """Veritabanını oluştur."""
     app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////Users/kadirhan/Desktop/ev/real_estate_agent_v2/back_end/real_estate_analysis.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = sqlalchemy_uri()  # ANALYSIS_DB_PATH, same file as RoomAnalyzer
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SQLALCHEMY_ECHO'] = False
     
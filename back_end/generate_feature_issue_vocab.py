@@ -6,7 +6,7 @@ Run:
     python generate_feature_issue_vocab.py
 
 It connects to the local SQLite DB (path defined below), scans the
-`analysis_results.raw_gemini_response` column, parses the JSON and
+stored `raw_gemini_response` payloads, parses the JSON and
 collects unique strings. Results are written to
 `gemini_feature_issue_vocab.json` in the same directory.
 """
@@ -15,7 +15,9 @@ import os
 import sqlite3
 from typing import Set, Dict
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "real_estate_analysis.db")
+from analysis_store import default_db_path, iter_payloads
+
+DB_PATH = default_db_path()
 OUTPUT_JSON = os.path.join(os.path.dirname(__file__), "gemini_feature_issue_vocab.json")
 
 
@@ -36,14 +38,11 @@ def _extract_from_analysis(analysis: Dict, characteristics: Set[str], issues: Se
 
 def collect_vocab():
     conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT raw_gemini_response FROM analysis_results WHERE raw_gemini_response IS NOT NULL")
 
     characteristics: Set[str] = set()
     issues: Set[str] = set()
 
-    rows = cursor.fetchall()
-    for (raw_json_str,) in rows:
+    for _analysis_id, raw_json_str in iter_payloads(conn, "raw_gemini_response"):
         try:
             data = json.loads(raw_json_str)
         except json.JSONDecodeError:
@@ -0,0 +1,290 @@
+"""Batch geocoding stage for scraped listings.
+
+``geocode_listings(entries)`` resolves coordinates for one search page at a
+time, cheapest source first:
+
+1. Coordinates Otodom already supplied (``location.latitude/longitude``) are
+   kept. Listings with a street also teach the gazetteer.
+2. The remaining listings are grouped by normalized ``street, city`` key,
+   so each distinct address is resolved once per page.
+3. Keys are looked up in the local gazetteer (``geo_gazetteer`` in the
+   analysis DB), then in the Redis geo cache. Cache hits are promoted into
+   the gazetteer, so it accumulates every address ever resolved.
+4. Only true unknowns go to Nominatim, paced to one request per
+   ``NOMINATIM_MIN_INTERVAL`` seconds across threads. Hits are cached and
+   learned. Misses are negative-cached for ``GEO_NEGATIVE_TTL`` and not
+   retried on every run. Service errors (timeouts, outages) are not cached.
+5. Streets that cannot be resolved fall back to the city centre, resolved
+   through the same steps once per city.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+NOMINATIM_USER_AGENT = "real_estate_agent_v2_scraper/1.0"
+NOMINATIM_MIN_INTERVAL = float(os.getenv("NOMINATIM_MIN_INTERVAL", "1.0"))
+GEO_CACHE_TTL = 604800
+GEO_NEGATIVE_TTL = int(os.getenv("GEO_NEGATIVE_TTL", str(3 * 86400)))
+
+_STREET_PREFIXES = [r'^ul\.\s*', r'^al\.\s*', r'^os\.\s*', r'^ulica\s+', r'^aleja\s+', r'^osiedle\s+']
+
+Coords = Tuple[float, float]
+
+
+# ----------------- Normalization -----------------
+def normalize_street(street: Optional[str]) -> Optional[str]:
+    """Strip ``ul.`` / ``al.`` / ``os.`` style prefixes and slashes; ``None`` if nothing is left."""
+    if not street or not isinstance(street, str):
+        return None
+    street = street.replace('/', ' ')
+    for pattern in _STREET_PREFIXES:
+        street = re.sub(pattern, '', street.strip(), flags=re.IGNORECASE)
+    street = " ".join(street.split())
+    return street or None
+
+
+def address_query(street: Optional[str], city: str) -> str:
+    """Nominatim query for a listing address (city only when there is no street)."""
+    street = normalize_street(street)
+    city = " ".join(str(city).split())
+    return f"{street}, {city}" if street else city
+
+
+def address_key(query: str) -> str:
+    """Cache / gazetteer key of a query: case- and whitespace-insensitive."""
+    return " ".join(query.split()).casefold()
+
+
+def source_coordinates(listing: Dict) -> Optional[Coords]:
+    """Coordinates supplied with the listing itself, if plausible."""
+    try:
+        lat, lon = float(listing.get("latitude")), float(listing.get("longitude"))
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or (lat == 0 and lon == 0):
+        return None
+    return lat, lon
+
+
+# ----------------- Backends -----------------
+class NominatimGeocoder:
+    """geopy Nominatim paced to one request per ``min_interval`` seconds (process-wide)."""
+
+    def __init__(self, min_interval: float = NOMINATIM_MIN_INTERVAL, user_agent: str = NOMINATIM_USER_AGENT,
+                 client=None) -> None:
+        if client is None:
+            from geopy.geocoders import Nominatim
+
+            client = Nominatim(user_agent=user_agent)
+        self._client = client
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._last_request = 0.0
+
+    def geocode(self, query: str) -> Optional[Coords]:
+        """``(lat, lon)`` or ``None`` when not found; service errors propagate."""
+        with self._lock:
+            wait = self._last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                location = self._client.geocode(query, timeout=10, country_codes='pl')
+            finally:
+                self._last_request = time.monotonic()
+        return (location.latitude, location.longitude) if location else None
+
+
+class Gazetteer:
+    """Street-level coordinates in the analysis DB (``geo_gazetteer``).
+
+    Errors (locked or unmigrated DB) are logged and treated as misses; the
+    stage then falls through to the cache and Nominatim.
+    """
+
+    def __init__(self, store=None) -> None:
+        self._store = store
+        self._lock = threading.Lock()
+
+    def _get_store(self):
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    from analysis_store import get_store
+                    from migrations import migrate_analysis_db
+
+                    store = get_store()
+                    migrate_analysis_db(store.path)
+                    self._store = store
+        return self._store
+
+    def lookup(self, keys: Sequence[str]) -> Dict[str, Coords]:
+        try:
+            return self._get_store().lookup_gazetteer(list(keys))
+        except sqlite3.Error as e:
+            logger.warning("Gazetteer lookup failed: %s", e)
+            return {}
+
+    def learn(self, rows: Sequence[Tuple[str, float, float]]) -> None:
+        try:
+            self._get_store().learn_gazetteer(rows)
+        except sqlite3.Error as e:
+            logger.warning("Gazetteer update failed for %d addresses: %s", len(rows), e)
+
+
+def _default_cache() -> Tuple[Callable, Callable]:
+    from cache import get_cached, set_cached
+
+    return (lambda key: get_cached("geo", key)), (lambda key, value, ttl: set_cached("geo", key, value, ttl))
+
+
+# ----------------- Stage -----------------
+class BatchGeocoder:
+    def __init__(self, geocoder: Optional[NominatimGeocoder] = None, gazetteer: Optional[Gazetteer] = None,
+                 cache_get: Optional[Callable[[str], Optional[str]]] = None,
+                 cache_set: Optional[Callable[[str, str, int], None]] = None) -> None:
+        self._geocoder = geocoder
+        self.gazetteer = gazetteer or Gazetteer()
+        if cache_get is None or cache_set is None:
+            cache_get, cache_set = _default_cache()
+        self._cache_get = cache_get
+        self._cache_set = cache_set
+
+    @property
+    def geocoder(self) -> NominatimGeocoder:
+        if self._geocoder is None:
+            self._geocoder = NominatimGeocoder()
+        return self._geocoder
+
+    def geocode_listings(self, entries: Iterable[Tuple[Dict, Optional[str], Optional[str]]]) -> Dict[str, int]:
+        """Set ``latitude``/``longitude`` on each ``(listing, street, city)``; return per-source counts.
+
+        Listings without a city are left untouched.
+        """
+        stats = dict.fromkeys(("source", "gazetteer", "cache", "nominatim", "negative", "city_fallback"), 0)
+        groups: Dict[str, List[Dict]] = {}
+        queries: Dict[str, str] = {}
+        legacy: Dict[str, str] = {}
+        cities: Dict[str, str] = {}
+        learned = []
+        for listing, street, city in entries:
+            if not city:
+                continue
+            query = address_query(street, city)
+            key = address_key(query)
+            coords = source_coordinates(listing)
+            if coords:
+                stats["source"] += 1
+                if normalize_street(street):
+                    learned.append((key, *coords))
+                continue
+            groups.setdefault(key, []).append(listing)
+            queries[key] = query
+            legacy[key] = f"{street},{city}"  # key format of the pre-batch per-listing cache
+            cities[key] = address_query(None, city)
+        if learned:
+            self.gazetteer.learn(learned)
+
+        resolved = self._resolve(queries, legacy, stats)
+        city_queries = {cities[key] for key, coords in resolved.items() if coords is None}
+        fallback = {address_key(q): q for q in city_queries if address_key(q) not in queries}
+        if fallback:
+            resolved.update(self._resolve(fallback, {}, stats))
+
+        for key, listings in groups.items():
+            coords = resolved.get(key)
+            if coords is None:
+                coords = resolved.get(address_key(cities[key]))
+                if coords is not None:
+                    stats["city_fallback"] += len(listings)
+            for listing in listings:
+                listing["latitude"], listing["longitude"] = coords or (None, None)
+
+        logger.info(
+            "Geocoding: %(source)d from source, %(gazetteer)d gazetteer, %(cache)d cache, "
+            "%(nominatim)d Nominatim (%(negative)d misses), %(city_fallback)d city fallbacks", stats,
+        )
+        return stats
+
+    def _resolve(self, queries: Dict[str, str], legacy: Dict[str, str],
+                 stats: Dict[str, int]) -> Dict[str, Optional[Coords]]:
+        """Resolve ``{key: query}`` via gazetteer, cache, then Nominatim.
+
+        Keys with a cached or fresh negative result map to ``None``; keys whose
+        lookup failed with a service error are absent.
+        """
+        resolved: Dict[str, Optional[Coords]] = {}
+        pending = dict(queries)
+
+        for key, coords in self.gazetteer.lookup(list(pending)).items():
+            resolved[key] = coords
+            pending.pop(key, None)
+            stats["gazetteer"] += 1
+
+        promote = []
+        for key in list(pending):
+            raw = self._cache_get(key) or (self._cache_get(legacy[key]) if key in legacy else None)
+            if not raw:
+                continue
+            try:
+                entry = json.loads(raw)
+            except ValueError:
+                continue
+            pending.pop(key)
+            if entry.get("miss"):
+                resolved[key] = None
+                stats["negative"] += 1
+            elif entry.get("lat") is not None and entry.get("lon") is not None:
+                resolved[key] = (entry["lat"], entry["lon"])
+                promote.append((key, entry["lat"], entry["lon"]))
+                stats["cache"] += 1
+            else:
+                resolved[key] = None
+        if promote:
+            self.gazetteer.learn(promote)
+
+        learned = []
+        for key, query in pending.items():
+            try:
+                coords = self.geocoder.geocode(query)
+            except Exception as e:  # timeouts / outages: retry next run
+                logger.error("Geocoding service error for '%s': %s", query, e)
+                continue
+            stats["nominatim"] += 1
+            resolved[key] = coords
+            if coords:
+                self._cache_set(key, json.dumps({"lat": coords[0], "lon": coords[1]}), GEO_CACHE_TTL)
+                learned.append((key, *coords))
+            else:
+                logger.warning("Could not geocode address: '%s'. Location not found.", query)
+                self._cache_set(key, json.dumps({"miss": True}), GEO_NEGATIVE_TTL)
+                stats["negative"] += 1
+        if learned:
+            self.gazetteer.learn(learned)
+        return resolved
+
+
+_default_stage: Optional[BatchGeocoder] = None
+_default_stage_lock = threading.Lock()
+
+
+def get_batch_geocoder() -> BatchGeocoder:
+    """Process-wide stage, so the Nominatim pacing is shared by every caller."""
+    global _default_stage
+    if _default_stage is None:
+        with _default_stage_lock:
+            if _default_stage is None:
+                _default_stage = BatchGeocoder()
+    return _default_stage
+
+
+def geocode_listings(entries: Iterable[Tuple[Dict, Optional[str], Optional[str]]]) -> Dict[str, int]:
+    return get_batch_geocoder().geocode_listings(entries)
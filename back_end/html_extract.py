@@ -0,0 +1,97 @@
+"""Fast extraction of ``<script>`` payloads (JSON-LD, __NEXT_DATA__) from raw HTML.
+
+Listing and detail pages carry everything the scrapers read as JSON inside
+script elements. Building a BeautifulSoup tree of a full page just to reach
+those elements costs more than the rest of the parse.
+
+* ``iter_scripts`` scans the text for ``<script>`` start tags with one
+  compiled regex and slices each body up to its ``</script``. No tree is
+  built. Like ``html.parser``:
+  * HTML comments are skipped;
+  * attribute names are lower-cased and values entity-decoded;
+  * script bodies are raw text (no entity decoding);
+  * ``<script .../>`` is an empty element.
+  Script elements come out identical to
+  ``BeautifulSoup(html, "html.parser").find_all("script")``.
+* ``loads`` decodes JSON with ``orjson`` when it is installed. Anything
+  orjson rejects (NaN, ...) is decoded again with the standard library, and
+  payloads with 19+ digit numbers skip orjson. The result and the error
+  type therefore match ``json.loads``.
+
+``scripts/bench_html_extract.py`` compares both paths on recorded pages.
+"""
+from __future__ import annotations
+
+import html as _html
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import orjson as _orjson  # optional, several times faster than json on large payloads
+except ImportError:  # pragma: no cover - depends on environment
+    _orjson = None
+
+# A comment (skipped) or a script start tag; quoted attribute values may contain '>'.
+_SCRIPT_START_RE = re.compile(
+    r"<!--.*?-->|<script(?=[\s/>])((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>", re.I | re.S
+)
+_SCRIPT_END_RE = re.compile(r"</script", re.I)
+_ATTR_RE = re.compile(r"([^\s/>=][^\s/>=]*)(?:\s*=\s*(\"[^\"]*\"|'[^']*'|[^\s>]*))?")
+# orjson has no arbitrary-precision ints (older releases even turn them into floats).
+_LONG_NUMBER_RE = re.compile(r"\d{19}")
+
+
+def _parse_attrs(raw: str) -> Dict[str, str]:
+    attrs: Dict[str, str] = {}
+    for name, value in _ATTR_RE.findall(raw):
+        if value[:1] in ("'", '"'):
+            value = value[1:-1]
+        attrs[name.lower()] = _html.unescape(value) if "&" in value else value
+    return attrs
+
+
+def iter_scripts(html: str) -> Iterator[Tuple[Dict[str, str], str]]:
+    """Yield ``(attributes, body)`` for every ``<script>`` element, in document order."""
+    pos = 0
+    while True:
+        match = _SCRIPT_START_RE.search(html, pos)
+        if match is None:
+            return
+        pos = match.end()
+        raw_attrs = match.group(1)
+        if raw_attrs is None:  # comment
+            continue
+        if raw_attrs.rstrip().endswith("/"):
+            yield _parse_attrs(raw_attrs), ""
+            continue
+        end = _SCRIPT_END_RE.search(html, pos)
+        body_end = end.start() if end else len(html)
+        yield _parse_attrs(raw_attrs), html[pos:body_end]
+        pos = body_end
+
+
+def script_texts(html: str, **attrs: str) -> List[str]:
+    """Bodies of the script elements whose attributes equal ``attrs`` (e.g. ``type="application/ld+json"``)."""
+    return [
+        body for found, body in iter_scripts(html)
+        if all(found.get(name) == value for name, value in attrs.items())
+    ]
+
+
+def script_text(html: str, **attrs: str) -> Optional[str]:
+    """Body of the first matching script element, or ``None``."""
+    for found, body in iter_scripts(html):
+        if all(found.get(name) == value for name, value in attrs.items()):
+            return body
+    return None
+
+
+def loads(text: str) -> Any:
+    """``json.loads`` with the same results, through orjson when available."""
+    if _orjson is not None and not _LONG_NUMBER_RE.search(text):
+        try:
+            return _orjson.loads(text)
+        except _orjson.JSONDecodeError:
+            pass  # json.loads decides: it accepts more (NaN, big ints) or raises its own error
+    return json.loads(text)
@@ -0,0 +1,158 @@
+"""Pre-clustered listing tiles for the map (slippy-map z/x/y addressing).
+
+Each tile is a compact GeoJSON FeatureCollection. Below ``POINT_ZOOM`` the
+tile is split into a ``GRID`` x ``GRID`` grid and every non-empty cell becomes
+one cluster feature: count, centroid and median price per m². At
+``POINT_ZOOM`` and above, listings are sent as individual points.
+
+Rendered tiles are cached in Redis (cache.py, namespace ``tile``). Writers
+call ``invalidate_points`` with the coordinates they just stored, and with
+the previous coordinates of listings that moved. Only the tiles containing
+those points (one per zoom level) are dropped, so a scrape of one district
+does not flush the whole city. When Redis is down, tiles are rendered
+uncached.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import statistics
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from cache import delete_cached, get_cached, set_cached
+
+logger = logging.getLogger(__name__)
+
+MIN_ZOOM = 0
+MAX_ZOOM = 18
+POINT_ZOOM = int(os.getenv("MAP_TILE_POINT_ZOOM", "16"))
+GRID = 8
+TILE_CACHE_NAMESPACE = "tile"
+TILE_CACHE_TTL = int(os.getenv("MAP_TILE_CACHE_TTL", str(86400)))
+_MAX_LAT = 85.0511287798
+
+
+# ----------------- Tile math -----------------
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Return ``(south, west, north, east)`` of a Web-Mercator tile."""
+    n = 2 ** z
+
+    def lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+def tile_for(lat: float, lon: float, z: int) -> Tuple[int, int]:
+    """Return the ``(x, y)`` of the tile containing a point at zoom ``z``."""
+    n = 2 ** z
+    lat = max(-_MAX_LAT, min(_MAX_LAT, lat))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def valid_tile(z: int, x: int, y: int) -> bool:
+    return MIN_ZOOM <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def _tile_key(z: int, x: int, y: int) -> str:
+    return f"{z}/{x}/{y}"
+
+
+# ----------------- Rendering -----------------
+def _price_per_m2(price, area) -> Optional[float]:
+    if price and area and area > 0:
+        return price / area
+    return None
+
+
+def _feature(lon: float, lat: float, properties: Dict) -> Dict:
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [round(lon, 6), round(lat, 6)]},
+        "properties": properties,
+    }
+
+
+def build_tile(points: Iterable[tuple], z: int, x: int, y: int) -> Dict:
+    """Aggregate ``(listing_id, lat, lon, price, area, title)`` rows into a tile FeatureCollection."""
+    features: List[Dict] = []
+    if z >= POINT_ZOOM:
+        for listing_id, lat, lon, price, area, title in points:
+            ppm2 = _price_per_m2(price, area)
+            features.append(_feature(lon, lat, {
+                "id": listing_id,
+                "title": title,
+                "count": 1,
+                "price": price,
+                "price_per_m2": round(ppm2) if ppm2 else None,
+            }))
+        return {"type": "FeatureCollection", "features": features}
+
+    south, west, north, east = tile_bounds(z, x, y)
+    cell_h, cell_w = (north - south) / GRID, (east - west) / GRID
+    cells: Dict[Tuple[int, int], List] = {}
+    for _listing_id, lat, lon, price, area, _title in points:
+        row = min(int((lat - south) / cell_h), GRID - 1)
+        col = min(int((lon - west) / cell_w), GRID - 1)
+        cell = cells.setdefault((row, col), [0, 0.0, 0.0, []])
+        cell[0] += 1
+        cell[1] += lat
+        cell[2] += lon
+        ppm2 = _price_per_m2(price, area)
+        if ppm2:
+            cell[3].append(ppm2)
+    for (row, col), (count, lat_sum, lon_sum, ppm2s) in sorted(cells.items()):
+        features.append(_feature(lon_sum / count, lat_sum / count, {
+            "count": count,
+            "median_price_per_m2": round(statistics.median(ppm2s)) if ppm2s else None,
+        }))
+    return {"type": "FeatureCollection", "features": features}
+
+
+def get_tile(store, z: int, x: int, y: int) -> str:
+    """Return the tile as a compact GeoJSON string, from cache when possible."""
+    key = _tile_key(z, x, y)
+    try:
+        cached = get_cached(TILE_CACHE_NAMESPACE, key)
+    except RedisError as e:
+        logger.warning("Tile cache read failed for %s: %s", key, e)
+        cached = None
+    if cached is not None:
+        return cached
+    south, west, north, east = tile_bounds(z, x, y)
+    tile = build_tile(store.iter_tile_points(south, west, north, east), z, x, y)
+    body = json.dumps(tile, separators=(",", ":"))
+    try:
+        set_cached(TILE_CACHE_NAMESPACE, key, body, ttl=TILE_CACHE_TTL)
+    except RedisError as e:
+        logger.warning("Tile cache write failed for %s: %s", key, e)
+    return body
+
+
+# ----------------- Invalidation -----------------
+def tiles_for_points(points: Iterable[Tuple[float, float]],
+                     zooms: Iterable[int] = range(MIN_ZOOM, MAX_ZOOM + 1)) -> set:
+    zooms = list(zooms)
+    keys = set()
+    for lat, lon in points:
+        if lat is None or lon is None:
+            continue
+        for z in zooms:
+            keys.add(_tile_key(z, *tile_for(lat, lon, z)))
+    return keys
+
+
+def invalidate_points(points: Iterable[Tuple[float, float]]) -> int:
+    """Drop cached tiles containing any of ``points`` (all zoom levels)."""
+    keys = tiles_for_points(points)
+    if not keys:
+        return 0
+    deleted = delete_cached(TILE_CACHE_NAMESPACE, *sorted(keys))
+    logger.debug("Invalidated %d/%d map tiles", deleted or 0, len(keys))
+    return len(keys)
@@ -5,6 +5,29 @@ import threading
 SCRAPED_LISTINGS = Counter("scraped_listings_total", "Total listings successfully scraped")
 SCRAPE_ERRORS = Counter("scrape_errors_total", "Total scrape errors")
 REQUEST_LATENCY = Histogram("fetch_request_seconds", "HTTP fetch latency")
+# Re-seen listings by content-hash outcome: new / changed / unchanged
+LISTING_CHANGES = Counter("scraped_listing_changes_total", "Search listings by content-hash state", ["state"])
+# Per-host fetch throttling (fetch_pro_helpers.ProFetcher / rate_control.py)
+FETCH_RATE = Gauge("fetch_host_rate", "Current token-bucket rate (requests/s) per host", ["host"])
+FETCH_CONCURRENCY_LIMIT = Gauge("fetch_host_concurrency_limit", "Current AIMD in-flight limit per host", ["host"])
+FETCH_IN_FLIGHT = Gauge("fetch_host_in_flight", "Requests in flight per host", ["host"])
+FETCH_THROTTLED = Counter("fetch_throttled_total", "429/503 responses per host", ["host", "status"])
+# Proxy pool health (proxy_pool.py); labels are host:port, never credentials
+PROXY_REQUESTS = Counter("proxy_requests_total", "Requests per proxy by outcome", ["proxy", "outcome"])
+PROXY_LATENCY = Gauge("proxy_latency_ewma_seconds", "Latency EWMA per proxy", ["proxy"])
+PROXY_QUARANTINED = Gauge("proxy_quarantined", "1 while quarantined (as of its last request)", ["proxy"])
+# HTTP cache outcomes (hit / revalidated via 304 / miss) and bytes on the wire by Content-Encoding
+HTTP_CACHE_REQUESTS = Counter("http_cache_requests_total", "HTTP cache lookups by outcome", ["outcome"])
+HTTP_BYTES = Counter("http_response_bytes_total", "Downloaded response bytes (as sent)", ["encoding"])
+# Redis HTTP cache footprint (whole document vs. stored compressed entry) and read+decode cost
+HTTP_CACHE_ENTRY_BYTES = Histogram(
+    "http_cache_entry_bytes", "Size of a cached page", ["variant", "form"],
+    buckets=(1e3, 5e3, 2e4, 5e4, 1e5, 2e5, 5e5, 1e6, 2e6),
+)
+HTTP_CACHE_DECODE_SECONDS = Histogram(
+    "http_cache_decode_seconds", "Redis GET + decompress + decode of a cached page", ["variant"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
 PREDICTION_COUNT = Counter("prediction_count_total", "Total predictions served")
 PREDICTION_MAE = Counter("prediction_mae_sum", "Sum of absolute errors for MAE calculation")
 
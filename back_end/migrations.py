@@ -0,0 +1,490 @@
+"""Versioned schema migrations for the local SQLite databases.
+
+Usage:
+    python migrations.py                              # analyzer DB (ANALYSIS_DB_PATH)
+    python migrations.py --db path/to/analysis.db
+    python migrations.py --listings-db sqlite:///otodom.db
+    python migrations.py --vacuum                     # also reclaim space after moving payloads
+
+Each database keeps a ``schema_version`` table. Steps are applied in order,
+each in its own ``BEGIN IMMEDIATE`` transaction, so two processes booting at
+the same time serialize instead of racing on ALTER TABLE. Once a database is
+current, a run costs one SELECT.
+
+Run this at deploy / worker boot (the Celery worker, the web app and the
+scraper CLI all call it on start-up). ``RoomAnalyzer`` itself no longer does
+any DDL or schema introspection.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sqlite3
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from analysis_store import PAYLOAD_COLUMNS, default_db_path, encode_payload
+
+logger = logging.getLogger(__name__)
+
+Migration = Tuple[int, str, Callable[[sqlite3.Connection], None]]
+
+SCHEMA_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+# ----------------- Internal helpers -----------------
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_missing_columns(conn: sqlite3.Connection, table: str, columns: dict) -> None:
+    existing = _columns(conn, table)
+    for col, col_type in columns.items():
+        if col not in existing:
+            logger.info("Adding missing column '%s' to %s table...", col, table)
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {col} {col_type}")
+
+
+# ----------------- Analyzer DB (property_analyses / analysis_results) -----------------
+CREATE_PROPERTY_ANALYSES = """
+    CREATE TABLE IF NOT EXISTS property_analyses (
+        listing_id TEXT UNIQUE NOT NULL,
+        scraped_title TEXT,
+        scraped_street_address TEXT,
+        scraped_price REAL,
+        scraped_area REAL,
+        scraped_latitude REAL,
+        scraped_longitude REAL,
+        analysis_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (listing_id)
+    )
+"""
+
+CREATE_ANALYSIS_RESULTS = """
+    CREATE TABLE IF NOT EXISTS analysis_results (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        listing_id TEXT,
+        analysis_id TEXT UNIQUE,
+        total_images INTEGER,
+        successfully_classified INTEGER,
+        unique_rooms_detected INTEGER,
+        duplicate_images_found INTEGER,
+        execution_time REAL,
+        batch_mode_used BOOLEAN,
+        status TEXT,
+        progress REAL,
+        message TEXT,
+        created_at TEXT,
+        room_summary TEXT,
+        avg_impression_score REAL,
+        dominant_clutter_level TEXT,
+        max_renovation_need TEXT,
+        property_summary_text TEXT,
+        key_features_text TEXT,
+        visible_issues_text TEXT,
+        raw_gemini_response TEXT,
+        overall_condition TEXT,
+        dominant_style TEXT,
+        overall_lighting TEXT,
+        FOREIGN KEY (listing_id) REFERENCES property_analyses (listing_id)
+    )
+"""
+
+
+def _analysis_base_tables(conn: sqlite3.Connection) -> None:
+    conn.execute(CREATE_PROPERTY_ANALYSES)
+    conn.execute(CREATE_ANALYSIS_RESULTS)
+
+
+def _analysis_numeric_features(conn: sqlite3.Connection) -> None:
+    # Older DB files predate these; fresh ones get them here too.
+    _add_missing_columns(conn, "analysis_results", {
+        "numeric_visual_features_json": "TEXT",
+        "overall_impression_score_avg": "REAL",
+        "overall_impression_score_median": "REAL",
+        "clutter_level_mode": "TEXT",
+        "estimated_renovation_need_mode": "TEXT",
+        "habitable_room_ratio": "REAL",
+        "duplicate_ratio": "REAL",
+        "total_unique_rooms": "INTEGER",
+    })
+
+
+# R*Tree over property_analyses.rowid; kept in sync by triggers so every write
+# path (single upsert, bulk upsert, manual SQL) maintains the index.
+SPATIAL_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS property_geo USING rtree(
+        id, min_lat, max_lat, min_lon, max_lon
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS property_geo_ai AFTER INSERT ON property_analyses
+    WHEN NEW.scraped_latitude IS NOT NULL AND NEW.scraped_longitude IS NOT NULL
+    BEGIN
+        INSERT OR REPLACE INTO property_geo VALUES (
+            NEW.rowid, NEW.scraped_latitude, NEW.scraped_latitude,
+            NEW.scraped_longitude, NEW.scraped_longitude);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS property_geo_au
+    AFTER UPDATE OF scraped_latitude, scraped_longitude ON property_analyses
+    BEGIN
+        DELETE FROM property_geo WHERE id = OLD.rowid;
+        INSERT INTO property_geo
+        SELECT NEW.rowid, NEW.scraped_latitude, NEW.scraped_latitude,
+               NEW.scraped_longitude, NEW.scraped_longitude
+        WHERE NEW.scraped_latitude IS NOT NULL AND NEW.scraped_longitude IS NOT NULL;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS property_geo_ad AFTER DELETE ON property_analyses
+    BEGIN
+        DELETE FROM property_geo WHERE id = OLD.rowid;
+    END
+    """,
+]
+
+
+def _analysis_spatial_index(conn: sqlite3.Connection) -> None:
+    for ddl in SPATIAL_INDEX_DDL:
+        conn.execute(ddl)
+    conn.execute("""
+        INSERT OR REPLACE INTO property_geo
+        SELECT rowid, scraped_latitude, scraped_latitude, scraped_longitude, scraped_longitude
+        FROM property_analyses
+        WHERE scraped_latitude IS NOT NULL AND scraped_longitude IS NOT NULL
+    """)
+
+
+PAYLOAD_BACKFILL_BATCH = 500
+
+
+def _analysis_payload_table(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS analysis_payloads (
+            analysis_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            codec TEXT NOT NULL,
+            raw_size INTEGER,
+            data BLOB NOT NULL,
+            PRIMARY KEY (analysis_id, kind)
+        ) WITHOUT ROWID
+    """)
+    # Move existing wide JSON out of the hot table in rowid-ordered batches, so
+    # only PAYLOAD_BACKFILL_BATCH values are in memory at a time. Rows without
+    # an analysis_id cannot be keyed and stay inline.
+    existing = _columns(conn, "analysis_results")
+    for col in (c for c in PAYLOAD_COLUMNS if c in existing):
+        moved, last_rowid = 0, 0
+        while True:
+            rows = conn.execute(
+                f"SELECT rowid, analysis_id, {col} FROM analysis_results "
+                f"WHERE rowid > ? AND {col} IS NOT NULL AND analysis_id IS NOT NULL ORDER BY rowid LIMIT ?",
+                (last_rowid, PAYLOAD_BACKFILL_BATCH),
+            ).fetchall()
+            if not rows:
+                break
+            payloads = []
+            for _, analysis_id, text in rows:
+                codec, blob = encode_payload(text)
+                payloads.append((analysis_id, col, codec, len(text), blob))
+            conn.executemany(
+                "INSERT OR REPLACE INTO analysis_payloads (analysis_id, kind, codec, raw_size, data) VALUES (?, ?, ?, ?, ?)",
+                payloads,
+            )
+            conn.executemany(f"UPDATE analysis_results SET {col} = NULL WHERE rowid = ?", [(r[0],) for r in rows])
+            moved += len(rows)
+            last_rowid = rows[-1][0]
+        if moved:
+            logger.info("Moved %d %s values to analysis_payloads", moved, col)
+
+
+# Append-only price/status history plus a one-row-per-listing latest state.
+# The trigger keeps listing_latest in sync with every history insert, so
+# "current price" is a primary-key lookup and "recent price drops" is a range
+# scan on a covering index instead of a window over the whole history.
+PRICE_HISTORY_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS listing_price_history (
+        listing_id TEXT NOT NULL,
+        observed_at TEXT NOT NULL,
+        price REAL,
+        status TEXT NOT NULL DEFAULT 'active',
+        PRIMARY KEY (listing_id, observed_at)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS listing_latest (
+        listing_id TEXT PRIMARY KEY,
+        price REAL,
+        previous_price REAL,
+        status TEXT,
+        first_seen TEXT NOT NULL,
+        last_seen TEXT NOT NULL,
+        changed_at TEXT NOT NULL,
+        price_changed_at TEXT
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_listing_latest_price_change
+    ON listing_latest (price_changed_at, price, previous_price)
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS listing_price_history_ai AFTER INSERT ON listing_price_history
+    BEGIN
+        INSERT INTO listing_latest (
+            listing_id, price, previous_price, status,
+            first_seen, last_seen, changed_at, price_changed_at
+        ) VALUES (
+            NEW.listing_id, NEW.price, NULL, NEW.status,
+            NEW.observed_at, NEW.observed_at, NEW.observed_at, NULL
+        )
+        ON CONFLICT(listing_id) DO UPDATE SET
+            previous_price = CASE WHEN excluded.price IS NOT listing_latest.price
+                                  THEN listing_latest.price ELSE listing_latest.previous_price END,
+            price_changed_at = CASE WHEN excluded.price IS NOT listing_latest.price
+                                    THEN excluded.changed_at ELSE listing_latest.price_changed_at END,
+            price = excluded.price,
+            status = excluded.status,
+            changed_at = excluded.changed_at,
+            last_seen = MAX(listing_latest.last_seen, excluded.last_seen)
+        WHERE excluded.changed_at >= listing_latest.changed_at;
+    END
+    """,
+]
+
+
+def _analysis_price_history(conn: sqlite3.Connection) -> None:
+    for statement in PRICE_HISTORY_DDL:
+        conn.execute(statement)
+    # Seed from the last scrape we have for each listing.
+    conn.execute("""
+        INSERT OR IGNORE INTO listing_price_history (listing_id, observed_at, price, status)
+        SELECT listing_id, COALESCE(analysis_timestamp, CURRENT_TIMESTAMP), scraped_price, 'active'
+        FROM property_analyses
+    """)
+
+
+# Secondary indexes for the hot lookups (tests/test_query_plans.py guards the
+# plans). Names match the ``db.Index`` declarations in models.py so create_all
+# and these migrations never build the same index twice.
+ANALYSIS_INDEXES = {
+    "idx_analysis_results_listing_id": "analysis_results (listing_id)",
+    "idx_analysis_results_created_at": "analysis_results (created_at)",
+}
+
+
+def _create_indexes(conn: sqlite3.Connection, indexes: dict) -> None:
+    # Skip tables/columns a partial legacy file does not have.
+    for name, target in indexes.items():
+        table, cols = target.split(" ", 1)
+        wanted = {c.strip() for c in cols.strip("()").split(",")}
+        if wanted <= _columns(conn, table):
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+
+
+def _analysis_secondary_indexes(conn: sqlite3.Connection) -> None:
+    _create_indexes(conn, ANALYSIS_INDEXES)
+
+
+# Street-level coordinates learned from source coordinates, geo cache hits
+# and Nominatim results (see geocoding.py). Keys are normalized addresses;
+# coordinates are a running mean over ``samples`` observations.
+CREATE_GEO_GAZETTEER = """
+CREATE TABLE IF NOT EXISTS geo_gazetteer (
+    address_key TEXT PRIMARY KEY,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    samples INTEGER NOT NULL DEFAULT 1,
+    updated_at TEXT NOT NULL
+) WITHOUT ROWID
+"""
+
+
+def _analysis_geo_gazetteer(conn: sqlite3.Connection) -> None:
+    conn.execute(CREATE_GEO_GAZETTEER)
+
+
+# Payloads belong to their analysis_results row. INSERT OR REPLACE does not
+# fire DELETE triggers (recursive_triggers is off), so rewrites keep theirs;
+# AnalysisStore.save_analysis replaces them explicitly.
+PAYLOAD_CASCADE_DDL = """
+    CREATE TRIGGER IF NOT EXISTS analysis_results_payloads_ad AFTER DELETE ON analysis_results
+    WHEN OLD.analysis_id IS NOT NULL
+    BEGIN
+        DELETE FROM analysis_payloads WHERE analysis_id = OLD.analysis_id;
+    END
+"""
+
+
+def _analysis_payload_cascade(conn: sqlite3.Connection) -> None:
+    conn.execute(PAYLOAD_CASCADE_DDL)
+    # Drop payloads whose analysis was deleted before the trigger existed.
+    orphans = conn.execute("""
+        DELETE FROM analysis_payloads WHERE analysis_id NOT IN (
+            SELECT analysis_id FROM analysis_results WHERE analysis_id IS NOT NULL
+        )
+    """).rowcount
+    if orphans:
+        logger.info("Deleted %d orphaned analysis_payloads rows", orphans)
+
+
+def _analysis_history_otodom_id(conn: sqlite3.Connection) -> None:
+    # Price history is keyed by the numeric Otodom id. Scrape rows are keyed by
+    # detail URL, so property_analyses records the id. Detail URLs do not embed
+    # the id, so history written under a URL cannot be re-keyed here;
+    # AnalysisStore.upsert_listing_scrapes folds it into the id on the listing's
+    # next scrape write, and mark_removed leaves URL-keyed rows alone until then.
+    _add_missing_columns(conn, "property_analyses", {"otodom_id": "TEXT"})
+    legacy = conn.execute("SELECT COUNT(*) FROM listing_latest WHERE listing_id LIKE 'http%'").fetchone()[0]
+    if legacy:
+        logger.info("%d URL-keyed listing_latest rows will be folded into Otodom ids on their next scrape", legacy)
+
+
+ANALYSIS_MIGRATIONS: List[Migration] = [
+    (1, "property_analyses and analysis_results tables", _analysis_base_tables),
+    (2, "analysis_results numeric visual feature columns", _analysis_numeric_features),
+    (3, "property_geo R*Tree spatial index", _analysis_spatial_index),
+    (4, "compressed analysis_payloads side table", _analysis_payload_table),
+    (5, "listing price history and latest-state tables", _analysis_price_history),
+    (6, "analysis_results listing_id / created_at indexes", _analysis_secondary_indexes),
+    (7, "geo_gazetteer street-level coordinates", _analysis_geo_gazetteer),
+    (8, "delete analysis_payloads with their analysis_results row", _analysis_payload_cascade),
+    (9, "property_analyses.otodom_id (price history key)", _analysis_history_otodom_id),
+]
+
+
+# ----------------- Listings DB (models.Listing, store_listings.py) -----------------
+def _listings_backfill_columns(conn: sqlite3.Connection) -> None:
+    # Tables come from models.py (create_all); this only patches pre-existing files.
+    if not _columns(conn, "listings"):
+        return
+    _add_missing_columns(conn, "listings", {
+        "area_sqm": "REAL",
+        "rooms": "INTEGER",
+        "image_count": "INTEGER",
+        "is_private_owner": "INTEGER",  # SQLite lacks BOOLEAN
+        "date_created": "DATETIME",
+        "floor": "INTEGER",
+        "total_floors": "INTEGER",
+        "year_built": "INTEGER",
+        "building_type": "TEXT",
+        "condition": "TEXT",
+        "parking_spaces": "INTEGER",
+        "balcony_area": "REAL",
+        "heating_type": "TEXT",
+    })
+
+
+LISTINGS_INDEXES = {
+    "idx_listings_lat_lon": "listings (latitude, longitude)",
+    **ANALYSIS_INDEXES,
+}
+
+
+def _listings_secondary_indexes(conn: sqlite3.Connection) -> None:
+    _create_indexes(conn, LISTINGS_INDEXES)
+
+
+LISTINGS_MIGRATIONS: List[Migration] = [
+    (1, "listings professional-extras columns", _listings_backfill_columns),
+    (2, "listings coordinate and analysis_results lookup indexes", _listings_secondary_indexes),
+]
+
+
+# ----------------- Runner -----------------
+def current_version(conn: sqlite3.Connection) -> int:
+    conn.execute(SCHEMA_VERSION_DDL)
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def migrate(conn: sqlite3.Connection, migrations: Sequence[Migration]) -> int:
+    """Apply pending ``migrations`` to ``conn`` in order; return the resulting version."""
+    versions = [m[0] for m in migrations]
+    if versions != sorted(set(versions)):
+        raise ValueError("Migration versions must be unique and ascending")
+
+    previous_isolation = conn.isolation_level
+    conn.isolation_level = None  # explicit transactions below
+    try:
+        version = current_version(conn)
+        for step_version, description, apply in migrations:
+            if step_version <= version:
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have applied it while we waited for the lock.
+                if current_version(conn) >= step_version:
+                    conn.execute("COMMIT")
+                    continue
+                apply(conn)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                    (step_version, description),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            logger.info("Applied migration %d: %s", step_version, description)
+            version = step_version
+        return version
+    finally:
+        conn.isolation_level = previous_isolation
+
+
+def migrate_sqlite_file(path: str, migrations: Sequence[Migration]) -> int:
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        return migrate(conn, migrations)
+    finally:
+        conn.close()
+
+
+def migrate_analysis_db(path: Optional[str] = None) -> int:
+    """Bring the analyzer SQLite file (default ``ANALYSIS_DB_PATH``) up to date."""
+    return migrate_sqlite_file(path or default_db_path(), ANALYSIS_MIGRATIONS)
+
+
+def migrate_listings_db(engine) -> Optional[int]:
+    """Apply listings migrations for a SQLAlchemy engine (SQLite only)."""
+    if engine.dialect.name != "sqlite":
+        logger.info("Skipping listings migrations for %s (managed by create_all).", engine.dialect.name)
+        return None
+    return migrate_sqlite_file(engine.url.database or ":memory:", LISTINGS_MIGRATIONS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply schema migrations.")
+    parser.add_argument("--db", default=None, help="Analyzer SQLite path (default: ANALYSIS_DB_PATH).")
+    parser.add_argument("--listings-db", default=None, help="Optional SQLAlchemy URL of the listings DB.")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM the analyzer DB afterwards (reclaims moved payload space).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(f"Analyzer DB at schema version {migrate_analysis_db(args.db)}")
+    if args.vacuum:
+        conn = sqlite3.connect(args.db or default_db_path())
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+    if args.listings_db:
+        from sqlalchemy import create_engine
+        from models import db
+
+        engine = create_engine(args.listings_db)
+        db.Model.metadata.create_all(engine)
+        print(f"Listings DB at schema version {migrate_listings_db(engine)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,27 @@
 
 Usage:
     python feature_etl.py --db ../analysis_results.db --out features.parquet
+    python feature_etl.py --since "2025-01-01 00:00:00" --out new_features.parquet
 
 The script will:
-1. Read analysis_results table.
-2. Flatten numeric_visual_features_json into columns.
+1. Read the compact typed columns of analysis_results (no wide JSON), only rows
+   created after ``--since`` when given (served by idx_analysis_results_created_at).
+2. Load and flatten the compressed numeric_visual_features_json payloads.
 3. Merge with explicit numeric columns already present.
 4. Write a Parquet file ready for model training.
 """
 import argparse
 import json
 import os
-from typing import Dict, Any
+import sys
+from typing import Any, Dict, Optional
 
 import pandas as pd
 import sqlite3
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from analysis_store import GET_PAYLOAD_SQL, PAYLOAD_COLUMNS, decode_payload, iter_payloads  # noqa: E402
+
 DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(__file__), "..", "analysis_results.db")
 
 
@@ -32,20 +38,43 @@ def flatten_json(row_json: Dict[str, Any]) -> Dict[str, Any]:
     return flat
 
 
-def main(db_path: str, out_path: str):
+def main(db_path: str, out_path: str, since: Optional[str] = None):
     if not os.path.isfile(db_path):
         raise FileNotFoundError(f"Database not found: {db_path}")
 
     conn = sqlite3.connect(db_path)
-    # Read entire table; for production use, incremental loads can use created_at > last_ts
-    df = pd.read_sql_query("SELECT * FROM analysis_results", conn)
-    conn.close()
+    # Explicit columns only: the wide JSON payloads are never pulled into this scan.
+    columns = [
+        row[1] for row in conn.execute("PRAGMA table_info(analysis_results)")
+        if row[1] not in PAYLOAD_COLUMNS
+    ]
+    sql = f"SELECT {', '.join(columns)} FROM analysis_results"
+    params: tuple = ()
+    if since:
+        sql += " WHERE created_at > ? ORDER BY created_at"
+        params = (since,)
+    df = pd.read_sql_query(sql, conn, params=params)
 
-    # Parse JSON column
-    if "numeric_visual_features_json" in df.columns:
-        flat_records = df["numeric_visual_features_json"].apply(lambda x: flatten_json(json.loads(x) if x else {}))
-        flat_df = pd.json_normalize(flat_records)
-        df = pd.concat([df.drop(columns=["numeric_visual_features_json"]), flat_df], axis=1)
+    # Numeric visual features, decompressed only for this payload kind
+    # (and, for incremental runs, only for the selected rows)
+    if since:
+        payloads = []
+        for analysis_id in df["analysis_id"].dropna():
+            row = conn.execute(GET_PAYLOAD_SQL, (analysis_id, "numeric_visual_features_json")).fetchone()
+            if row:
+                payloads.append((analysis_id, decode_payload(*row)))
+    else:
+        payloads = iter_payloads(conn, "numeric_visual_features_json")
+    features = {
+        analysis_id: flatten_json(json.loads(text) if text else {})
+        for analysis_id, text in payloads
+    }
+    conn.close()
+    if features:
+        flat_df = pd.DataFrame.from_dict(features, orient="index")
+        # Typed columns already on the row win over the same keys in the JSON
+        flat_df = flat_df.drop(columns=[c for c in flat_df.columns if c in df.columns])
+        df = df.merge(flat_df, left_on="analysis_id", right_index=True, how="left")
 
     # Ensure all non-numeric are dropped except identifiers and label placeholders
     id_cols = ["listing_id", "analysis_id", "created_at"]
@@ -61,5 +90,6 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--db", default=DEFAULT_SQLITE_PATH, help="Path to SQLite DB.")
     parser.add_argument("--out", default="features.parquet", help="Output Parquet file.")
+    parser.add_argument("--since", default=None, help="Only rows with created_at after this timestamp.")
     args = parser.parse_args()
-    main(args.db, args.out)
+    main(args.db, args.out, args.since)
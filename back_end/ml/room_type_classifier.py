@@ -0,0 +1,315 @@
+"""Distil stored Gemini room-type labels into a lightweight local classifier.
+
+Usage:
+    python room_type_classifier.py --db ../real_estate_analysis.db --model room_type_clf.joblib
+
+The script will:
+1. Read per-image Gemini labels from the stored raw_gemini_response payloads and
+   map each ``image_index`` back to the listing's image URLs.
+2. Download each labelled image and compute cheap colour / layout / edge features.
+3. Fit a CPU-only logistic-regression classifier on a training split.
+4. Report accuracy, coverage and latency against the held-out Gemini labels.
+
+The fitted artefact is loaded by ``RoomAnalyzer`` (``local_classifier_path``) to
+label confident images locally and only send the rest to Gemini.
+"""
+import argparse
+import base64
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import time
+from io import BytesIO
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from analysis_store import iter_payloads  # noqa: E402
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(__file__), "..", "real_estate_analysis.db")
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "models", "room_type_clf.joblib")
+
+# Bump when the feature layout changes so stale artefacts are rejected.
+FEATURE_VERSION = 1
+_THUMB_SIZE = (16, 16)
+_GRID = 4
+_HIST_BINS = 8
+
+
+def extract_image_features(image: Image.Image) -> np.ndarray:
+    """Return a fixed-length feature vector for a PIL image.
+
+    Features: per-channel colour histograms, a coarse grid of mean colours
+    (captures layout such as bright windows or white floor plans), a small
+    grayscale thumbnail and simple edge densities. Everything runs on CPU in
+    a few milliseconds per image.
+    """
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    small = image.copy()
+    small.thumbnail((128, 128))
+    arr = np.asarray(small, dtype=np.float32) / 255.0
+
+    hist = [
+        np.histogram(arr[:, :, c], bins=_HIST_BINS, range=(0.0, 1.0))[0] / arr[:, :, c].size
+        for c in range(3)
+    ]
+
+    grid = np.asarray(small.resize((_GRID, _GRID), Image.Resampling.BILINEAR), dtype=np.float32) / 255.0
+
+    gray = np.asarray(small.convert("L").resize(_THUMB_SIZE, Image.Resampling.BILINEAR), dtype=np.float32) / 255.0
+
+    full_gray = arr.mean(axis=2)
+    dx = np.abs(np.diff(full_gray, axis=1)).mean() if full_gray.shape[1] > 1 else 0.0
+    dy = np.abs(np.diff(full_gray, axis=0)).mean() if full_gray.shape[0] > 1 else 0.0
+    stats = np.array([dx, dy, full_gray.mean(), full_gray.std(), arr.std(axis=(0, 1)).mean()], dtype=np.float32)
+
+    return np.concatenate([np.concatenate(hist), grid.ravel(), gray.ravel(), stats]).astype(np.float32)
+
+
+def features_from_bytes(image_bytes: bytes) -> np.ndarray:
+    return extract_image_features(Image.open(BytesIO(image_bytes)))
+
+
+def features_from_base64(image_base64: str) -> np.ndarray:
+    return features_from_bytes(base64.b64decode(image_base64))
+
+
+class LocalRoomClassifier:
+    """Thin wrapper around the fitted scikit-learn pipeline."""
+
+    def __init__(self, model, classes: List[str]):
+        self.model = model
+        self.classes = list(classes)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalRoomClassifier":
+        import joblib
+
+        artefact = joblib.load(path)
+        if artefact.get("feature_version") != FEATURE_VERSION:
+            raise ValueError(
+                f"Room classifier at {path} uses feature version {artefact.get('feature_version')}, "
+                f"expected {FEATURE_VERSION}. Re-run room_type_classifier.py."
+            )
+        return cls(artefact["model"], artefact["classes"])
+
+    def save(self, path: str):
+        import joblib
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        joblib.dump({"model": self.model, "classes": self.classes, "feature_version": FEATURE_VERSION}, path)
+
+    def predict_features(self, features: np.ndarray) -> Tuple[str, float]:
+        proba = self.model.predict_proba(features.reshape(1, -1))[0]
+        best = int(np.argmax(proba))
+        return str(self.model.classes_[best]), float(proba[best])
+
+    def predict_base64(self, image_base64: str) -> Tuple[str, float]:
+        """Return ``(room_type_id, confidence)`` for a base64-encoded JPEG."""
+        return self.predict_features(features_from_base64(image_base64))
+
+
+# ----------------------------- Label extraction -----------------------------
+
+def _iter_analyses(raw: object) -> Iterable[Dict]:
+    """Yield per-image analysis dicts from any stored raw_gemini_response shape."""
+    if isinstance(raw, list):
+        for item in raw:
+            yield from _iter_analyses(item)
+    elif isinstance(raw, dict):
+        if isinstance(raw.get("image_analyses"), list):
+            yield from _iter_analyses(raw["image_analyses"])
+        elif raw.get("candidates"):
+            # Individual-mode responses keep the API envelope (and the call's timing).
+            for cand in raw["candidates"]:
+                for part in (cand.get("content") or {}).get("parts", []):
+                    if isinstance(part, dict) and part.get("text"):
+                        try:
+                            for analysis in _iter_analyses(json.loads(part["text"])):
+                                if raw.get("gemini_seconds") is not None:  # one image per call
+                                    analysis.setdefault("gemini_seconds_per_image", raw["gemini_seconds"])
+                                yield analysis
+                        except json.JSONDecodeError:
+                            continue
+        else:
+            yield raw
+
+
+def _listing_image_urls(listing_url: str) -> List[str]:
+    """Image URLs of a listing, in the order the analyzer numbered them."""
+    from scraper_otodom import get_listing_details
+
+    return (get_listing_details(listing_url) or {}).get("image_urls") or []
+
+
+def collect_labels(db_path: str, image_urls_for: Callable[[str], List[str]] = _listing_image_urls
+                   ) -> Tuple[List[Tuple[str, str]], Optional[float]]:
+    """Return ``[(image_url, room_type_id), ...]`` and the median Gemini seconds/image.
+
+    Batch responses label images by ``image_index``: its position in the
+    listing's ``image_urls``. Analyses that did not record their ``image_url``
+    are resolved through ``image_urls_for(listing_url)`` (fetched once per
+    listing). The latency is the timed Gemini call the analyzer stores with
+    each response, divided by the images it covered; older rows have none.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        listing_by_analysis = dict(conn.execute("SELECT analysis_id, listing_id FROM analysis_results"))
+        rows = list(iter_payloads(conn, "raw_gemini_response"))
+    finally:
+        conn.close()
+
+    labels: Dict[str, str] = {}
+    per_image_secs: List[float] = []
+    urls_by_listing: Dict[str, List[str]] = {}
+    for analysis_id, raw_json in rows:
+        try:
+            data = json.loads(raw_json)
+        except (TypeError, json.JSONDecodeError):
+            continue
+        listing_url = listing_by_analysis.get(analysis_id)
+        for analysis in _iter_analyses(data):
+            if analysis.get("gemini_seconds_per_image"):
+                per_image_secs.append(float(analysis["gemini_seconds_per_image"]))
+            room_type = analysis.get("room_type") or analysis.get("identified_room_type_id")
+            url = analysis.get("image_url")
+            index = analysis.get("image_index")
+            if not url and listing_url and isinstance(index, int):
+                if listing_url not in urls_by_listing:
+                    try:
+                        urls_by_listing[listing_url] = image_urls_for(listing_url)
+                    except Exception as e:
+                        print(f"[DISTIL] No image URLs for {listing_url}: {e}")
+                        urls_by_listing[listing_url] = []
+                urls = urls_by_listing[listing_url]
+                url = urls[index] if 0 <= index < len(urls) else None
+            if url and room_type:
+                labels[url] = room_type
+    gemini_latency = statistics.median(per_image_secs) if per_image_secs else None
+    return sorted(labels.items()), gemini_latency
+
+
+def _download(url: str) -> Optional[bytes]:
+    import requests
+
+    try:
+        r = requests.get(url, timeout=10)
+        r.raise_for_status()
+        return r.content
+    except Exception as e:
+        print(f"[DISTIL] Skipping {url}: {e}")
+        return None
+
+
+# ----------------------------- Training / report -----------------------------
+
+def build_report(clf: LocalRoomClassifier, X_test: np.ndarray, y_test: List[str], latencies_ms: List[float],
+                 threshold: float, gemini_sec_per_image: Optional[float]) -> Dict:
+    preds = [clf.predict_features(x) for x in X_test]
+    correct = [p == y for (p, _), y in zip(preds, y_test)]
+    confident = [(p == y) for (p, conf), y in zip(preds, y_test) if conf >= threshold]
+
+    per_class: Dict[str, Dict[str, float]] = {}
+    for label in sorted(set(y_test)):
+        idx = [i for i, y in enumerate(y_test) if y == label]
+        per_class[label] = {
+            "support": len(idx),
+            "accuracy": round(sum(correct[i] for i in idx) / len(idx), 3),
+        }
+
+    lat_sorted = sorted(latencies_ms)
+    return {
+        "held_out_images": len(y_test),
+        "accuracy": round(sum(correct) / len(correct), 3) if correct else None,
+        "confidence_threshold": threshold,
+        "coverage_at_threshold": round(len(confident) / len(y_test), 3) if y_test else None,
+        "accuracy_at_threshold": round(sum(confident) / len(confident), 3) if confident else None,
+        "local_latency_ms_mean": round(statistics.mean(lat_sorted), 2) if lat_sorted else None,
+        "local_latency_ms_p95": round(lat_sorted[int(0.95 * (len(lat_sorted) - 1))], 2) if lat_sorted else None,
+        "gemini_latency_ms_per_image_median": round(gemini_sec_per_image * 1000, 1) if gemini_sec_per_image else None,
+        "per_class": per_class,
+    }
+
+
+def main(db_path: str, model_path: str, test_size: float, threshold: float, max_images: Optional[int],
+         report_path: Optional[str]):
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import train_test_split
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    if not os.path.isfile(db_path):
+        raise FileNotFoundError(f"Database not found: {db_path}")
+
+    labels, gemini_latency = collect_labels(db_path)
+    if max_images:
+        labels = labels[:max_images]
+    print(f"[DISTIL] {len(labels)} labelled images found")
+
+    X: List[np.ndarray] = []
+    y: List[str] = []
+    raw_images: List[bytes] = []
+    for url, room_type in labels:
+        content = _download(url)
+        if content is None:
+            continue
+        try:
+            X.append(features_from_bytes(content))
+        except Exception as e:
+            print(f"[DISTIL] Could not featurise {url}: {e}")
+            continue
+        y.append(room_type)
+        raw_images.append(content)
+
+    # Classes with a single example cannot be stratified; drop them.
+    counts = {label: y.count(label) for label in set(y)}
+    keep = [i for i, label in enumerate(y) if counts[label] >= 2]
+    if len({y[i] for i in keep}) < 2:
+        raise SystemExit("[DISTIL] Need at least two room types with two examples each to train.")
+
+    train_idx, test_idx = train_test_split(
+        keep, test_size=test_size, random_state=42, stratify=[y[i] for i in keep]
+    )
+    X_train = np.stack([X[i] for i in train_idx])
+    X_test = np.stack([X[i] for i in test_idx])
+    y_train = [y[i] for i in train_idx]
+    y_test = [y[i] for i in test_idx]
+
+    pipeline = Pipeline([
+        ("scale", StandardScaler()),
+        ("clf", LogisticRegression(max_iter=2000, class_weight="balanced")),
+    ])
+    pipeline.fit(X_train, y_train)
+    clf = LocalRoomClassifier(pipeline, list(pipeline.classes_))
+
+    # Latency covers the full local path: decode + features + predict.
+    latencies_ms: List[float] = []
+    for i in test_idx:
+        t0 = time.perf_counter()
+        clf.predict_features(features_from_bytes(raw_images[i]))
+        latencies_ms.append((time.perf_counter() - t0) * 1000)
+
+    report = build_report(clf, X_test, y_test, latencies_ms, threshold, gemini_latency)
+    clf.save(model_path)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if report_path:
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"[DISTIL] Model saved to {model_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--db", default=DEFAULT_SQLITE_PATH, help="Path to SQLite DB.")
+    parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="Output joblib artefact.")
+    parser.add_argument("--test-size", type=float, default=0.2, help="Held-out fraction for the report.")
+    parser.add_argument("--threshold", type=float, default=0.85, help="Confidence threshold to report coverage at.")
+    parser.add_argument("--max-images", type=int, default=None, help="Cap the number of labelled images used.")
+    parser.add_argument("--report", default=None, help="Optional path to write the JSON report.")
+    args = parser.parse_args()
+    main(args.db, args.model, args.test_size, args.threshold, args.max_images, args.report)
@@ -5,6 +5,9 @@ db = SQLAlchemy()
 
 class Listing(db.Model):
     __tablename__ = 'listings'
+    __table_args__ = (
+        db.Index('idx_listings_lat_lon', 'latitude', 'longitude'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     listing_id = db.Column(db.Integer, unique=True)
@@ -84,6 +87,10 @@ class SameRoomRelation(db.Model):
 
 class AnalysisResult(db.Model):
     __tablename__ = 'analysis_results'
+    __table_args__ = (
+        db.Index('idx_analysis_results_listing_id', 'listing_id'),
+        db.Index('idx_analysis_results_created_at', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     listing_id = db.Column(db.Integer, db.ForeignKey('listings.id'))
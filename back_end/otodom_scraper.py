@@ -3,23 +3,24 @@ import json
 import logging
 import time
 import re
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderUnavailable
-from back_end.analyze_the_rooms import RoomAnalyzer
+from analyze_the_rooms import RoomAnalyzer
 from back_end.tasks import analyze_images_task
 import math
 from typing import Optional, Dict, List
-from bs4 import BeautifulSoup
 import os
+import sqlite3
+import sys
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from fetch_pro_helpers import ProFetcher
-from cache import http_get_cached, http_set_cached, geo_get_cached, geo_set_cached
+from analysis_store import get_store
+from cache import http_get_cached, http_set_cached
+from geocoding import geocode_listings
+from html_extract import loads as json_loads, script_texts
 from schemas import ListingSchema
-from metrics import SCRAPED_LISTINGS, SCRAPE_ERRORS, REQUEST_LATENCY, start_metrics_server
+from seen_index import ListingChunk, SeenIndex, split_unchanged
+from metrics import SCRAPED_LISTINGS, SCRAPE_ERRORS, REQUEST_LATENCY, LISTING_CHANGES, start_metrics_server
 from datetime import datetime
-import pandas as pd
 from pathlib import Path
-from db import upsert_listings
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(module)s - %(message)s')
@@ -27,16 +28,13 @@ logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %
 # Start metrics on import
 start_metrics_server(int(os.getenv("METRICS_PORT", "8000")))
 
+# Newest first, so incremental crawls can stop at the first run of known listings
 BASE_OTODOM_SEARCH_URL_WROCLAW = (
     "https://www.otodom.pl/pl/oferty/sprzedaz/mieszkanie/wroclaw"
-    "?distanceRadius=0&limit=36&viewType=listing&page={page}"
+    "?distanceRadius=0&limit=36&viewType=listing&by=LATEST&direction=DESC&page={page}"
 )
 DEFAULT_MAX_PAGES = 3  # can be overridden
 
-# Initialize Nominatim geocoder
-# Using a custom user_agent is good practice as per Nominatim's usage policy
-geolocator = Nominatim(user_agent="real_estate_agent_v2_scraper/1.0")
-
 # ----------------------------- Otodom Offer API -----------------------------
 OTODOM_OFFER_API = "https://www.otodom.pl/api/v1/offers/{id}"
 
@@ -64,6 +62,14 @@ except Exception:
     _SEL_AVAILABLE = False
 
 DETAIL_MAX_WORKERS = int(os.getenv("DETAIL_MAX_WORKERS", "8"))  # Parallel detail fetchers
+# property_analyses rows are buffered and written in one transaction per page or per N listings
+SCRAPE_DB_FLUSH_EVERY = int(os.getenv("SCRAPE_DB_FLUSH_EVERY", "50"))
+# Search pages change every few minutes; a day-long HTTP cache would hide new listings
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "300"))
+# Cache only the __NEXT_DATA__ / JSON-LD fragments the parsers read instead of whole HTML pages
+HTTP_CACHE_EXTRACT = os.getenv("HTTP_CACHE_EXTRACT", "true").lower() == "true"
+# "async" (pipelined crawl_engine) or "sequential" (page by page)
+CRAWL_ENGINE = os.getenv("CRAWL_ENGINE", "async").lower()
 
 # Field aliases for robust extraction across API/key variants
 FIELD_ALIASES = {
@@ -148,67 +154,10 @@ def _enrich_listing_details(listing: Dict[str, any]):
 
 
 def get_coordinates_for_address(address_str, city_name="Wrocław"):
-    """Geocodes an address string to (latitude, longitude) using Nominatim after normalization."""
-    
-    normalized_address_str = address_str
-    if normalized_address_str and isinstance(normalized_address_str, str):
-        # Replace '/' with space
-        normalized_address_str = normalized_address_str.replace('/', ' ')
-        
-        # Remove common prefixes (case-insensitive) and strip whitespace
-        # This regex looks for 'ul.', 'al.', 'os.' possibly followed by a space, at the beginning of words.
-        # It also handles cases where these might be part of a longer string if not careful, so we ensure they are somewhat standalone.
-        prefixes_to_remove = [r'^ul\.\s*', r'^al\.\s*', r'^os\.\s*', r'^ulica\s+', r'^aleja\s+', r'^osiedle\s+']
-        for prefix_pattern in prefixes_to_remove:
-            normalized_address_str = re.sub(prefix_pattern, '', normalized_address_str, flags=re.IGNORECASE).strip()
-        
-        # Remove any remaining standalone 'ul', 'al', 'os' if they are full words after prefix removal
-        # This is a bit more aggressive and might need refinement
-        # standalone_words_to_remove = [r'\b(ul|al|os)\b\.?']
-        # for word_pattern in standalone_words_to_remove:
-        #     normalized_address_str = re.sub(word_pattern, '', normalized_address_str, flags=re.IGNORECASE).strip()
-            
-        # Final strip
-        normalized_address_str = normalized_address_str.strip()
-        
-        if not normalized_address_str: # If stripping prefixes leaves an empty string
-            full_address = city_name
-        else:
-            full_address = f"{normalized_address_str}, {city_name}"
-    else:
-        # If original address_str is missing or not a string, try with city only
-        full_address = city_name
-
-    logging.debug(f"Original address: '{address_str}', Normalized for geocoding: '{full_address}'")
-
-    try:
-        # Add a small delay to comply with usage policies (1 request per second)
-        time.sleep(1)
-        # Ensure country code is used for better accuracy, Nominatim default might be okay but explicit is better.
-        location = geolocator.geocode(full_address, timeout=10, country_codes='pl') 
-        if location:
-            return location.latitude, location.longitude
-        else:
-            logging.warning(f"Could not geocode address: '{full_address}'. Location not found.")
-            # Try again with just the city if normalization resulted in a specific address that failed
-            if normalized_address_str and normalized_address_str != city_name:
-                logging.info(f"Retrying geocoding with city only for: '{city_name}'")
-                time.sleep(1)
-                location_city = geolocator.geocode(city_name, timeout=10, country_codes='pl')
-                if location_city:
-                    return location_city.latitude, location_city.longitude
-                else:
-                    logging.warning(f"Could not geocode city: '{city_name}'. Location not found.")
-            return None, None
-    except GeocoderTimedOut:
-        logging.error(f"Geocoding service timed out for address: '{full_address}'")
-        return None, None
-    except GeocoderUnavailable:
-        logging.error(f"Geocoding service unavailable for address: '{full_address}'")
-        return None, None
-    except Exception as e:
-        logging.error(f"An unexpected error occurred during geocoding for '{full_address}': {e}")
-        return None, None
+    """Geocode one address (source-free path of the batch stage in geocoding.py)."""
+    listing = {}
+    geocode_listings([(listing, address_str, city_name)])
+    return listing.get("latitude"), listing.get("longitude")
 
 
 def extract_next_data(html_content):
@@ -242,22 +191,42 @@ def extract_next_data(html_content):
             return None
         
         json_data_str = html_content[json_start_idx:json_end_idx]
-        return json.loads(json_data_str)
+        return json_loads(json_data_str)
         
     except Exception as e:
         logging.error(f"Error extracting or parsing __NEXT_DATA__ (robust attempt): {e}")
         return None
 
+_JSONLD_SCRIPT_RE = re.compile(r"<script[^>]*application/ld\+json[^>]*>.*?</script>", re.S | re.I)
+
+
+def _next_data_fragment(html_content: str) -> Optional[str]:
+    """The __NEXT_DATA__ script element alone (all ``extract_next_data`` reads), or None if absent."""
+    for marker in ('<script id="__NEXT_DATA__"', "<script id='__NEXT_DATA__'"):
+        start = html_content.find(marker)
+        if start != -1:
+            end = html_content.find('</script>', start)
+            return html_content[start:end + len('</script>')] if end != -1 else None
+    return None
+
+
+def _jsonld_fragment(html_content: str) -> str:
+    """Only the JSON-LD script elements (all ``_parse_jsonld_scripts`` reads); empty if there are none."""
+    return "".join(_JSONLD_SCRIPT_RE.findall(html_content))
+
+
 def _parse_jsonld_scripts(html: str) -> Dict[str, any]:
-    """Parse first JSON-LD block and return dict; if multiple merge shallowly."""
-    soup = BeautifulSoup(html, "html.parser")
+    """Parse first JSON-LD block and return dict; if multiple merge shallowly.
+
+    Script bodies are sliced out by html_extract's scanner (no BeautifulSoup tree).
+    """
     data: Dict[str, any] = {}
-    for script in soup.find_all("script", {"type": "application/ld+json"}):
+    for txt in script_texts(html, type="application/ld+json"):
         try:
-            txt = script.get_text(strip=True)
+            txt = txt.strip()
             if not txt:
                 continue
-            j = json.loads(txt)
+            j = json_loads(txt)
             if isinstance(j, list):
                 for o in j:
                     if isinstance(o, dict):
@@ -268,23 +237,19 @@ def _parse_jsonld_scripts(html: str) -> Dict[str, any]:
             continue
     return data
 
-def fetch_detail_info(detail_url: str, delay: float = 0.5) -> Dict[str, Optional[any]]:
+def fetch_detail_info(detail_url: str, delay: float = 0.0) -> Dict[str, Optional[any]]:
     """Fetch Otodom detail page and extract floor, year_built, lat/lon, description via JSON-LD."""
     if not detail_url:
         return {}
     try:
-        cached = http_get_cached(detail_url)
-        if cached:
-            text_html = cached
-        else:
-            time.sleep(delay)
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Gecko/20100101 Firefox/114.0'
-            }
-            r = FETCHER.get(detail_url, headers=headers, timeout=15)
-            r.raise_for_status()
-            text_html = r.text
-            http_set_cached(detail_url, text_html, ttl=86400*7)
+        if delay:
+            time.sleep(delay)  # FETCHER already paces each host
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Gecko/20100101 Firefox/114.0'
+        }
+        # Cached for a week, then revalidated (304 keeps the stored page)
+        text_html = FETCHER.get_text_cached(detail_url, ttl=86400*7, headers=headers, timeout=15,
+                                            extract=_jsonld_fragment if HTTP_CACHE_EXTRACT else None)
         jsonld = _parse_jsonld_scripts(text_html)
         out: Dict[str, Optional[any]] = {}
         geo = jsonld.get("geo") or {}
@@ -328,11 +293,12 @@ def fetch_offer_api(offer_id: str, detail_url: Optional[str] = None) -> Dict[str
         "Accept": "application/json, text/plain, */*"
     }
 
-    session = FETCHER.session  # Use global session with retry/proxy settings
-
+    # Through FETCHER.get (not its raw session): the host's token bucket, AIMD
+    # limit and proxy pool apply, and 429/503 are retried and fed back. The
+    # shared session still keeps the cookies the detail-page visit sets.
     def _attempt_api() -> Optional[dict]:
         try:
-            r = session.get(api_url, headers=headers, timeout=15)
+            r = FETCHER.get(api_url, headers=headers, timeout=15)
             if r.status_code != 200:
                 return None
             data = r.json()
@@ -348,7 +314,7 @@ def fetch_offer_api(offer_id: str, detail_url: Optional[str] = None) -> Dict[str
     # If empty & we have detail_url, try to prime cookies then retry
     if data is None and detail_url:
         try:
-            session.get(detail_url, timeout=15, allow_redirects=True)
+            FETCHER.get(detail_url, timeout=15, allow_redirects=True).close()
         except Exception:
             pass
         data = _attempt_api()
@@ -433,18 +399,237 @@ def fetch_offer_graphql(offer_id: str) -> Dict[str, Optional[any]]:
         logging.info(f"GraphQL offer fetch failed for {offer_id}: {e}")
         return {}
 
-def parse_listings_from_next_data(next_data_json, analyzer_instance: RoomAnalyzer = None):
-    """Parses listing information from the __NEXT_DATA__ JSON object."""
+def _flush_scrape_rows(analyzer_instance: RoomAnalyzer, rows: List[Dict]) -> None:
+    """Write buffered property_analyses rows in one transaction and clear the buffer."""
+    if not rows:
+        return
+    try:
+        analyzer_instance.save_listings_scrape_data_bulk(rows)
+    except Exception as db_save_e:
+        logging.error(f"Error bulk-saving {len(rows)} listings to DB: {db_save_e}")
+    rows.clear()
+
+
+def _touch_listings(listing_ids: List[str]) -> None:
+    """Bump listing_latest.last_seen for listings re-seen unchanged (one UPDATE per search page)."""
+    if not listing_ids:
+        return
+    try:
+        get_store().touch_listings(listing_ids)
+    except sqlite3.Error as e:
+        logging.warning("Could not bump last_seen for %d unchanged listings: %s", len(listing_ids), e)
+
+
+def _search_items(next_data_json) -> List[Dict]:
+    """searchAds items of a search page's __NEXT_DATA__ (raises KeyError if the layout changed)."""
+    return next_data_json['props']['pageProps']['data']['searchAds']['items']
+
+
+def _listing_from_search_item(item: Dict):
+    """Build the basic listing dict from one search item (no network).
+
+    Returns ``(listing, street_name, city_name)``; the city may come from the
+    location label fallback and is what geocoding should use.
+    """
+    # Robust URL & field extraction
+    slug = item.get("slug")
+    raw_url = item.get("url")
+
+    # Construct absolute detail URL
+    if raw_url and str(raw_url).startswith("http"):
+        detail_url = raw_url
+    elif slug:
+        if str(slug).startswith("http"):
+            detail_url = slug
+        else:
+            # Otodom slugs are path-like, prefix with domain
+            detail_url = f"https://www.otodom.pl/{str(slug).lstrip('/')}"
+    else:
+        detail_url = None
+
+    # Ensure Otodom new format: /pl/oferta/<slug>
+    if detail_url and detail_url.startswith("https://www.otodom.pl/") and "/pl/oferta/" not in detail_url:
+        # Insert /pl/oferta/ after domain
+        path_part = detail_url.split("https://www.otodom.pl/")[1].lstrip('/')
+        detail_url = f"https://www.otodom.pl/pl/oferta/{path_part}"
+
+    # Price may be a dict or scalar
+    price_raw = item.get("price")
+    if isinstance(price_raw, dict):
+        price_val = price_raw.get("value") or price_raw.get("price") or price_raw.get("amount")
+    else:
+        price_val = price_raw
+
+    # Build listing skeleton
+    basic = {
+        "id": item.get("id"),
+        "title": item.get("name") or item.get("title"),
+        "price": price_val,
+        "detail_url": detail_url,
+    }
+
+    # ---- Yeni alanlar ----
+    loc = item.get("location") or {}
+    if loc:
+        # city name
+        city_obj = loc.get("city") or {}
+        basic["city_name"] = city_obj.get("name")
+        # street
+        addr_obj = loc.get("address") or {}
+        basic["street_name"] = addr_obj.get("street")
+        # coordinates from list API (bazı ilanlarda mevcut)
+        basic["latitude"] = loc.get("latitude") or loc.get("lat")
+        basic["longitude"] = loc.get("longitude") or loc.get("lon")
+
+    # images
+    img_arr = item.get("images") or []
+    if isinstance(img_arr, list):
+        # Otodom search listesinde {"large":url,"small":url}
+        basic["images"] = [img.get("large") or img.get("small") for img in img_arr if isinstance(img, dict)]
+
+    # created date
+    basic["date_created"] = item.get("createdAt") or item.get("created_at")
+
+    # seller type -> is_private_owner
+    stype = item.get("sellerType")
+    if stype:
+        basic["seller_type"] = stype
+        basic["is_private_owner"] = stype.lower() == "private"
+
+    # Address bits
+    param_map = {p.get('key'): p.get('value') for p in item.get('parameters', []) if isinstance(p, dict)}
+
+    street_name_val = item.get('streetName') or _get_from_param(param_map, 'streetName')
+    city_name_val = item.get('cityName') or item.get('city')
+    basic['street_name'] = street_name_val
+    basic['city_name'] = city_name_val
+
+    # Fallback: parse from label like "Wrocław, dolnośląskie"
+    if not city_name_val:
+        loc_label = item.get('locationLabel') or item.get('location_label')
+        if isinstance(loc_label, str) and "," in loc_label:
+            city_name_val = loc_label.split(",")[0].strip()
+
+    # Professional extras via alias helper
+    for field in [
+        'floor',
+        'total_floors',
+        'year_built',
+        'building_type',
+        'condition',
+        'parking_spaces',
+        'balcony_area',
+        'heating_type',
+    ]:
+        basic[field] = _get_from_param(param_map, field)
+    return basic, street_name_val, city_name_val
+
+
+def _geocode_listings(entries: List) -> None:
+    """Set latitude/longitude for a page of ``(listing, street, city)`` entries.
+
+    Source coordinates are kept; the rest are deduplicated by address and
+    resolved via gazetteer, geo cache, then Nominatim (see geocoding.py).
+    """
+    try:
+        geocode_listings(entries)
+    except Exception as e:
+        logging.error(f"Geocoding stage failed for {len(entries)} listings: {e}")
+
+
+def _scrape_row(basic: Dict, street_name_val: Optional[str]) -> Dict:
+    """property_analyses row for the bulk scrape write."""
+    return {
+        'listing_id': basic.get('detail_url'),
+        'title': basic.get('title'),
+        'street_address': street_name_val,
+        'price': basic.get('price'),
+        'area': basic.get('area_sqm'),
+        'latitude': basic.get('latitude'),
+        'longitude': basic.get('longitude'),
+        'otodom_id': basic.get('id'),  # price history key (HistorySink, _touch_listings)
+    }
+
+
+def _analyze_listing_inline(analyzer_instance: RoomAnalyzer, basic: Dict) -> None:
+    """Run the visual analysis for one listing and copy the room counts onto it."""
+    try:
+        analysis_results = analyzer_instance.analyze_listing_rooms(listing_url=basic.get('detail_url'))
+        basic['unique_rooms_detected'] = analysis_results.get('unique_rooms_detected')
+        basic['habitable_rooms'] = analysis_results.get('habitable_rooms_unique_count')
+    except Exception as vis_e:
+        logging.error(f"Visual analysis failed for listing {basic.get('detail_url')}: {vis_e}")
+
+
+def _validate_listing(basic: Dict) -> Dict:
+    """Try to validate; if it fails, keep the listing with best-effort fixes."""
+    try:
+        _ = ListingSchema(**basic)
+    except Exception as val_e:
+        # Make minimal fixes: cast id to str, ensure required keys exist
+        basic["id"] = str(basic.get("id"))
+        basic.setdefault("images", [])
+        basic.setdefault("date_created", None)
+        basic.setdefault("is_private_owner", None)
+        logging.warning(
+            f"Listing validation failed (ID {basic.get('id')}), will still keep: {val_e}"
+        )
+    return basic
+
+
+def _finalize_listings(listings: List[Dict]) -> List[Dict]:
+    """Final normalization pass, metrics and Celery analysis dispatch."""
+    listings = [_normalize_listing_fields(l) for l in listings]
+    SCRAPED_LISTINGS.inc(len(listings))
+
+    # Dispatch analysis tasks
+    for l in listings:
+        if l.get("images"):
+            try:
+                analyze_images_task.delay(l["id"], l["images"])
+            except Exception:
+                logging.debug("Celery dispatch failed for %s", l.get("id"))
+    return listings
+
+
+def _record_listing_states(counts: Dict[str, int]) -> None:
+    """Export new/changed/unchanged content-hash counts."""
+    for state, n in counts.items():
+        if n:
+            LISTING_CHANGES.labels(state=state).inc(n)
+
+
+def parse_listings_from_next_data(next_data_json, analyzer_instance: RoomAnalyzer = None, seen_index=None):
+    """Parses listing information from the __NEXT_DATA__ JSON object.
+
+    With ``seen_index`` (``seen_index.SeenIndex``), items whose content hash is
+    unchanged since they were last seen are dropped before geocoding,
+    enrichment, writes and analysis dispatch. The result is a
+    ``ListingChunk``; its listings are marked seen when it is committed
+    after being stored.
+    """
     listings = []
     if not next_data_json:
         return listings
 
     try:
-        items = next_data_json['props']['pageProps']['data']['searchAds']['items']
+        items = _search_items(next_data_json)
         logging.info(f"Found {len(items)} items in __NEXT_DATA__.")
-
-        # Build basic listing objects first
-        basic_listings = []
+        item_hashes: Dict[str, str] = {}
+        if seen_index is not None:
+            entries, unchanged = split_unchanged(seen_index, items)
+            counts = {"new": 0, "changed": 0, "unchanged": 0}
+            for _, _, state in entries:
+                counts[state] += 1
+            _record_listing_states(counts)
+            seen_index.mark(unchanged)
+            _touch_listings([listing_id for listing_id, _ in unchanged])
+            items = [item for item, _, state in entries if state != "unchanged"]
+            item_hashes = {str(item.get("id")): digest for item, digest, state in entries if state != "unchanged"}
+            logging.info("Content hash: %(new)d new, %(changed)d changed, %(unchanged)d unchanged", counts)
+
+        # Build basic listing objects first, then geocode the page in one batch
+        parsed = []
         for idx, item in enumerate(items):
             try:
                 if idx == 0:
@@ -452,153 +637,34 @@ def parse_listings_from_next_data(next_data_json, analyzer_instance: RoomAnalyze
                         logging.debug("ITEM_KEYS %s", json.dumps(list(item.keys())))
                     except Exception:
                         pass
-                # Robust URL & field extraction
-                slug = item.get("slug")
-                raw_url = item.get("url")
-
-                # Construct absolute detail URL
-                if raw_url and str(raw_url).startswith("http"):
-                    detail_url = raw_url
-                elif slug:
-                    if str(slug).startswith("http"):
-                        detail_url = slug
-                    else:
-                        # Otodom slugs are path-like, prefix with domain
-                        detail_url = f"https://www.otodom.pl/{str(slug).lstrip('/')}"
-                else:
-                    detail_url = None
-
-                # Ensure Otodom new format: /pl/oferta/<slug>
-                if detail_url and detail_url.startswith("https://www.otodom.pl/") and "/pl/oferta/" not in detail_url:
-                    # Insert /pl/oferta/ after domain
-                    path_part = detail_url.split("https://www.otodom.pl/")[1].lstrip('/')
-                    detail_url = f"https://www.otodom.pl/pl/oferta/{path_part}"
-
-                # Price may be a dict or scalar
-                price_raw = item.get("price")
-                if isinstance(price_raw, dict):
-                    price_val = price_raw.get("value") or price_raw.get("price") or price_raw.get("amount")
-                else:
-                    price_val = price_raw
-
-                # Build listing skeleton
-                basic = {
-                    "id": item.get("id"),
-                    "title": item.get("name") or item.get("title"),
-                    "price": price_val,
-                    "detail_url": detail_url,
-                }
-                
-                # ---- Yeni alanlar ----
-                loc = item.get("location") or {}
-                if loc:
-                    # city name
-                    city_obj = loc.get("city") or {}
-                    basic["city_name"] = city_obj.get("name")
-                    # street
-                    addr_obj = loc.get("address") or {}
-                    basic["street_name"] = addr_obj.get("street")
-                    # coordinates from list API (bazı ilanlarda mevcut)
-                    basic["latitude"] = loc.get("latitude") or loc.get("lat")
-                    basic["longitude"] = loc.get("longitude") or loc.get("lon")
-
-                # images
-                img_arr = item.get("images") or []
-                if isinstance(img_arr, list):
-                    # Otodom search listesinde {"large":url,"small":url}
-                    basic["images"] = [img.get("large") or img.get("small") for img in img_arr if isinstance(img, dict)]
-
-                # created date
-                basic["date_created"] = item.get("createdAt") or item.get("created_at")
-
-                # seller type -> is_private_owner
-                stype = item.get("sellerType")
-                if stype:
-                    basic["seller_type"] = stype
-                    basic["is_private_owner"] = stype.lower() == "private"
-
-                # Address bits
-                param_map = {p.get('key'): p.get('value') for p in item.get('parameters', []) if isinstance(p, dict)}
-
-                street_name_val = item.get('streetName') or _get_from_param(param_map, 'streetName')
-                city_name_val = item.get('cityName') or item.get('city')
-                basic['street_name'] = street_name_val
-                basic['city_name'] = city_name_val
-
-                # Fallback: parse from label like "Wrocław, dolnośląskie"
-                if not city_name_val:
-                    loc_label = item.get('locationLabel') or item.get('location_label')
-                    if isinstance(loc_label, str) and "," in loc_label:
-                        city_name_val = loc_label.split(",")[0].strip()
-
-                # Professional extras via alias helper
-                for field in [
-                    'floor',
-                    'total_floors',
-                    'year_built',
-                    'building_type',
-                    'condition',
-                    'parking_spaces',
-                    'balcony_area',
-                    'heating_type',
-                ]:
-                    basic[field] = _get_from_param(param_map, field)
-
-                # Geocoding (existing implementation)
-                if city_name_val: # Only attempt to geocode if we have a city
-                    addr_key = f"{street_name_val},{city_name_val}"
-                    cached_geo = geo_get_cached(addr_key)
-                    if cached_geo:
-                        geo_dict = json.loads(cached_geo)
-                        lat, lon = geo_dict.get("lat"), geo_dict.get("lon")
-                    else:
-                        lat, lon = get_coordinates_for_address(street_name_val, city_name_val)
-                        if lat and lon:
-                            geo_set_cached(addr_key, json.dumps({"lat": lat, "lon": lon}))
-                    basic['latitude'] = lat
-                    basic['longitude'] = lon
-
-                    # Save to database and optionally run visual analysis if analyzer_instance provided
+                parsed.append(_listing_from_search_item(item))
+            except Exception as e:
+                logging.warning(f"Error parsing a specific listing item (ID: {item.get('id', 'N/A')}): {e}")
+                continue # Skip to the next item if one fails
+        _geocode_listings([entry for entry in parsed if entry[2]])
+
+        basic_listings = []
+        scrape_rows: List[Dict] = []
+        for basic, street_name_val, city_name_val in parsed:
+            try:
+                if city_name_val:
+                    # Buffer for the bulk DB write and optionally run visual analysis if analyzer_instance provided
                     if analyzer_instance:
-                        try:
-                            analyzer_instance.save_listing_scrape_data(
-                                listing_id=basic.get('detail_url'),
-                                title=basic.get('title'),
-                                street_address=street_name_val,
-                                price=basic.get('price'),
-                                area=basic.get('area_sqm'),
-                                latitude=lat,
-                                longitude=lon
-                            )
-                        except Exception as db_save_e:
-                            logging.error(f"Error saving listing {basic.get('id')} to DB: {db_save_e}")
+                        scrape_rows.append(_scrape_row(basic, street_name_val))
+                        if len(scrape_rows) >= SCRAPE_DB_FLUSH_EVERY:
+                            _flush_scrape_rows(analyzer_instance, scrape_rows)
 
                         # ---- Visual analysis ----
-                        try:
-                            analysis_results = analyzer_instance.analyze_listing_rooms(listing_url=basic.get('detail_url'))
-                            basic['unique_rooms_detected'] = analysis_results.get('unique_rooms_detected')
-                            basic['habitable_rooms'] = analysis_results.get('habitable_rooms_unique_count')
-                        except Exception as vis_e:
-                            logging.error(f"Visual analysis failed for listing {basic.get('detail_url')}: {vis_e}")
+                        _analyze_listing_inline(analyzer_instance, basic)
                 else:
                     logging.warning(f"Skipping geocoding for listing ID {basic.get('id', 'N/A')} due to missing city name.")
 
-                # Try to validate; if fails, still include listing with best-effort fixes
-                try:
-                    _ = ListingSchema(**basic)
-                except Exception as val_e:
-                    # Make minimal fixes: cast id to str, ensure required keys exist
-                    basic["id"] = str(basic.get("id"))
-                    basic.setdefault("images", [])
-                    basic.setdefault("date_created", None)
-                    basic.setdefault("is_private_owner", None)
-                    logging.warning(
-                        f"Listing validation failed (ID {basic.get('id')}), will still keep: {val_e}"
-                    )
-                basic_listings.append(basic)
+                basic_listings.append(_validate_listing(basic))
             except Exception as e:
-                logging.warning(f"Error parsing a specific listing item (ID: {item.get('id', 'N/A')}): {e}")
-                continue # Skip to the next item if one fails
+                logging.warning(f"Error processing listing ID {basic.get('id', 'N/A')}: {e}")
+                continue
+        if analyzer_instance:
+            _flush_scrape_rows(analyzer_instance, scrape_rows)
         
         # ---------------- Enrich details concurrently ----------------
         if ENABLE_DETAIL_FETCH and DETAIL_MAX_WORKERS > 0:
@@ -616,18 +682,10 @@ def parse_listings_from_next_data(next_data_json, analyzer_instance: RoomAnalyze
             # No concurrency – maybe sequential enrichment
             listings = [ _enrich_listing_details(l) for l in basic_listings ] if ENABLE_DETAIL_FETCH else basic_listings
 
-        # Final normalization pass
-        listings = [_normalize_listing_fields(l) for l in listings]
-        SCRAPED_LISTINGS.inc(len(listings))
-
-        # Dispatch analysis tasks
-        for l in listings:
-            if l.get("images"):
-                try:
-                    analyze_images_task.delay(l["id"], l["images"])
-                except Exception:
-                    logging.debug("Celery dispatch failed for %s", l.get("id"))
-        return listings
+        listings = _finalize_listings(listings)
+        # Marked seen only once a sink has stored them (ListingChunk.commit)
+        pending = [(str(l.get("id")), item_hashes.get(str(l.get("id")))) for l in listings] if seen_index is not None else []
+        return ListingChunk(listings, seen_index, pending)
     except KeyError as e:
         logging.error(f"KeyError while accessing searchAds items: {e}. Check __NEXT_DATA__ structure.")
     except Exception as e:
@@ -635,90 +693,103 @@ def parse_listings_from_next_data(next_data_json, analyzer_instance: RoomAnalyze
         
     return listings
 
-def scrape_otodom_page(url, analyzer_instance: RoomAnalyzer = None):
+def fetch_search_next_data(url):
+    """Fetch one search results page (HTTP cache, revalidated when stale) and return its __NEXT_DATA__, or None."""
+    try:
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Gecko/20100101 Firefox/114.0'
+        }
+        # Raises for bad status codes (4xx or 5xx); a 304 on refresh reuses the cached page
+        html_content = FETCHER.get_text_cached(url, ttl=SEARCH_CACHE_TTL, headers=headers,
+                                               latency=REQUEST_LATENCY, timeout=15,
+                                               extract=_next_data_fragment if HTTP_CACHE_EXTRACT else None)
+    except requests.exceptions.RequestException as e:
+        SCRAPE_ERRORS.inc()
+        logging.error(f"Request failed for {url}: {e}")
+        return None
+
+    next_data_json = extract_next_data(html_content)
+    if not next_data_json:
+        debug_file_path = "debug_otodom_response.html"
+        try:
+            with open(debug_file_path, "w", encoding="utf-8") as f:
+                f.write(html_content)
+            logging.info(f"Raw HTML response saved to {debug_file_path} for inspection.")
+        except Exception as e_file:
+            logging.error(f"Failed to save debug HTML response to {debug_file_path}: {e_file}")
+    return next_data_json
+
+def scrape_otodom_page(url, analyzer_instance: RoomAnalyzer = None, seen_index=None):
     """Scrapes a single Otodom search results page."""
     logging.info(f"Scraping URL: {url}")
     try:
-        cached = http_get_cached(url)
-        if cached:
-            html_content = cached
-        else:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Gecko/20100101 Firefox/114.0'
-            }
-            with REQUEST_LATENCY.time():
-                response = FETCHER.get(url, headers=headers, timeout=15)
-            response.raise_for_status() # Raise an exception for bad status codes (4xx or 5xx)
-            html_content = response.text
-            http_set_cached(url, html_content)
-        
-        next_data_json = extract_next_data(html_content)
-        
+        next_data_json = fetch_search_next_data(url)
         if not next_data_json:
-            debug_file_path = "debug_otodom_response.html"
-            try:
-                with open(debug_file_path, "w", encoding="utf-8") as f:
-                    f.write(html_content)
-                logging.info(f"Raw HTML response saved to {debug_file_path} for inspection.")
-            except Exception as e_file:
-                logging.error(f"Failed to save debug HTML response to {debug_file_path}: {e_file}")
             return [] # Return empty list as __NEXT_DATA__ was not found or parsed
             
-        listings_data = parse_listings_from_next_data(next_data_json, analyzer_instance) # Pass analyzer_instance
+        listings_data = parse_listings_from_next_data(next_data_json, analyzer_instance, seen_index) # Pass analyzer_instance
         return listings_data
-        
-    except requests.exceptions.RequestException as e:
-        SCRAPE_ERRORS.inc()
-        logging.error(f"Request failed for {url}: {e}")
-        return []
     except Exception as e:
         logging.error(f"An error occurred during scraping {url}: {e}")
         return []
 
 # ----------------------------- Pagination Helper -----------------------------
 
-def scrape_otodom_search(max_pages: int = DEFAULT_MAX_PAGES, analyzer_instance: RoomAnalyzer = None):
-    """Scrape multiple pages of an Otodom search. Returns combined listing dicts list."""
-    all_listings = []
+def iter_otodom_search(max_pages: int = DEFAULT_MAX_PAGES, analyzer_instance: RoomAnalyzer = None,
+                       chunk_size: int = SCRAPE_DB_FLUSH_EVERY):
+    """Yield lists of finished listings as soon as they are enriched.
+
+    Feed the chunks to ``scrape_sinks.persist_stream`` to write each one as it
+    arrives. The async engine yields up to ``chunk_size`` listings at a time;
+    ``CRAWL_ENGINE=sequential`` yields one chunk per search page.
+    """
+    if CRAWL_ENGINE != "sequential":
+        from crawl_engine import iter_crawl_chunks
+        yield from iter_crawl_chunks(max_pages=max_pages, analyzer_instance=analyzer_instance,
+                                     scraper=sys.modules[__name__], chunk_size=chunk_size)
+        return
+
+    seen_index = SeenIndex() if os.getenv("CRAWL_INCREMENTAL", "true").lower() == "true" else None
     for page in range(1, max_pages + 1):
         url = BASE_OTODOM_SEARCH_URL_WROCLAW.format(page=page)
-        listings = scrape_otodom_page(url, analyzer_instance=analyzer_instance)
+        listings = scrape_otodom_page(url, analyzer_instance=analyzer_instance, seen_index=seen_index)
         if not listings:
             logging.info(f"No listings found on page {page}. Stopping pagination.")
             break
-        all_listings.extend(listings)
+        yield listings
         # polite delay
         time.sleep(1)
-    return all_listings
+
+
+def scrape_otodom_search(max_pages: int = DEFAULT_MAX_PAGES, analyzer_instance: RoomAnalyzer = None):
+    """Scrape multiple pages of an Otodom search. Returns combined listing dicts list.
+
+    Prefer ``iter_otodom_search`` for long crawls; this keeps every listing in memory.
+    """
+    if CRAWL_ENGINE != "sequential":
+        from crawl_engine import crawl_otodom_search
+        return crawl_otodom_search(max_pages=max_pages, analyzer_instance=analyzer_instance,
+                                   scraper=sys.modules[__name__])
+    listings = ListingChunk()
+    for chunk in iter_otodom_search(max_pages, analyzer_instance):
+        listings.absorb(chunk)
+    return listings
 
 # ------------------------ Persistence Helper ------------------------
 
 def _save_listings_csv(listings: List[dict], dedup: bool = True):
-    """Persist listings to a dated CSV under RAW_DATA_DIR.
+    """Persist listings to a dated CSV under RAW_DATA_DIR and upsert them to Postgres.
 
     Args:
         listings: list of dicts produced by scraper
         dedup: if True, drop duplicate ids within file
     """
-    
     if not listings:
         logging.info("No listings to persist, skipping CSV save.")
         return
+    from scrape_sinks import CsvSink, HistorySink, PostgresSink, persist_stream
 
-    date_str = datetime.utcnow().strftime("%Y-%m-%d")
-    out_dir = Path(RAW_DATA_DIR) / date_str
-    out_dir.mkdir(parents=True, exist_ok=True)
-    out_path = out_dir / "otodom_listings.csv"
-
-    df = pd.DataFrame(listings)
-    if dedup:
-        df.drop_duplicates(subset=["id"], inplace=True)
-
-    header = not out_path.exists()
-    df.to_csv(out_path, mode="a", index=False, header=header)
-    logging.info("Persisted %s listings to %s", len(df), out_path)
-    inserted = upsert_listings(listings)
-    logging.info("Inserted %s new rows to Postgres", inserted)
+    persist_stream([listings], [CsvSink(dedup=dedup), PostgresSink(), HistorySink()])
 
 # -------------------------- Utility: fill missing fields --------------------------
 def _derive_city_name(location_str: Optional[str]) -> Optional[str]:
@@ -767,17 +838,19 @@ if __name__ == '__main__':
     api_key = os.getenv("GEMINI_API_KEY")
     analyzer_for_script = None
     if api_key:
-        analyzer_for_script = RoomAnalyzer(gemini_api_key=api_key)
+        from migrations import migrate_analysis_db
+        migrate_analysis_db()
+        # Bulk crawl: render property summaries locally unless SUMMARY_MODE overrides it
+        analyzer_for_script = RoomAnalyzer(gemini_api_key=api_key, summary_mode=os.getenv("SUMMARY_MODE", "template"))
     else:
         logging.warning("GEMINI_API_KEY not set → listings will be scraped but images won’t be analyzed/saved to DB.")
     
-    listings = scrape_otodom_search(max_pages=DEFAULT_MAX_PAGES, analyzer_instance=analyzer_for_script)
-    
-    logging.info(f"Total listings scraped: {len(listings)}")
-    for i, listing in enumerate(listings[:5]):
-        logging.info(f"--- Listing {i+1} ---")
-        for k, v in listing.items():
-            logging.info(f"  {k}: {v}")
-
-    # Persist listings to CSV for later processing
-    _save_listings_csv(listings)
+    # Stream chunks straight into the CSV and Postgres sinks so a crash late
+    # in the crawl keeps everything persisted before it.
+    from scrape_sinks import CsvSink, HistorySink, PostgresSink, persist_stream
+
+    total = persist_stream(
+        iter_otodom_search(max_pages=DEFAULT_MAX_PAGES, analyzer_instance=analyzer_for_script),
+        [CsvSink(), PostgresSink(), HistorySink()],
+    )
+    logging.info(f"Total listings scraped: {total}")
@@ -5,7 +5,7 @@ from datetime import datetime
 import pandas as pd
 from sentence_transformers import SentenceTransformer
 import h3
-from back_end.datahub_emitter import emit_lineage
+from datahub_emitter import emit_lineage
 
 DATASET_CSV = Path(os.getenv("DATASET_CSV", "./back_end/data/dataset.csv"))
 OUTPUT_CSV = Path("../feature_repo/../back_end/data/features.csv").resolve()
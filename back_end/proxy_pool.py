@@ -0,0 +1,135 @@
+"""Health-scored proxy selection for ``ProFetcher``.
+
+* Every request through a proxy is reported back with its outcome: HTTP
+  status (``None`` for a connection error or timeout) and latency.
+* Per proxy, the pool tracks successes and failures, a latency EWMA and the
+  run of consecutive failures.
+* ``choose()`` picks among the proxies not in quarantine at random. The
+  weight is ``success_rate / latency``. The success rate is
+  Laplace-smoothed, so a new proxy starts at 0.5. Fast, healthy proxies get
+  most of the traffic, and slower ones still get enough to be re-measured.
+* 403/407/429 through a proxy (banned or rate-limited exit IP), or
+  ``failure_threshold`` consecutive errors, quarantine it. The cool-down
+  doubles with every strike, up to ``max_cooldown``. Each success removes
+  one strike.
+* If every proxy is in quarantine, the one released soonest is used rather
+  than failing the request.
+"""
+from __future__ import annotations
+
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlparse
+
+BAN_STATUSES = frozenset({403, 407, 429})
+
+
+def proxy_label(proxy_url: str) -> str:
+    """``host:port`` of a proxy URL, without credentials (safe for logs and metric labels)."""
+    parsed = urlparse(proxy_url if "://" in proxy_url else f"http://{proxy_url}")
+    host = parsed.hostname or proxy_url
+    return f"{host}:{parsed.port}" if parsed.port else host
+
+
+class ProxyStats:
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.label = proxy_label(url)
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency_ewma: Optional[float] = None
+        self.strikes = 0
+        self.quarantined_until = 0.0
+
+    @property
+    def success_rate(self) -> float:
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    def as_dict(self, now: float) -> Dict:
+        return {
+            "proxy": self.label,
+            "successes": self.successes,
+            "failures": self.failures,
+            "success_rate": round(self.success_rate, 3),
+            "latency_ewma": self.latency_ewma,
+            "strikes": self.strikes,
+            "quarantined_for": max(0.0, self.quarantined_until - now),
+        }
+
+
+class ProxyPool:
+    def __init__(self, proxies: Sequence[str], *, alpha: float = 0.3, failure_threshold: int = 3,
+                 base_cooldown: float = 30.0, max_cooldown: float = 1800.0,
+                 clock: Callable[[], float] = time.monotonic, rng: Optional[random.Random] = None,
+                 on_report: Optional[Callable[[ProxyStats, str], None]] = None) -> None:
+        self._stats: List[ProxyStats] = [ProxyStats(p.strip()) for p in dict.fromkeys(proxies) if p and p.strip()]
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self._on_report = on_report
+        self._lock = threading.Lock()
+        self._by_url = {s.url: s for s in self._stats}
+
+    def __len__(self) -> int:
+        return len(self._stats)
+
+    def _weight(self, stats: ProxyStats, default_latency: float) -> float:
+        latency = stats.latency_ewma if stats.latency_ewma is not None else default_latency
+        return stats.success_rate / max(latency, 1e-3)
+
+    def choose(self) -> Optional[str]:
+        """Proxy URL for the next request, or ``None`` when the pool is empty."""
+        if not self._stats:
+            return None
+        with self._lock:
+            now = self._clock()
+            available = [s for s in self._stats if s.quarantined_until <= now]
+            if not available:
+                return min(self._stats, key=lambda s: s.quarantined_until).url
+            # Unmeasured proxies are scored at the pool's median latency.
+            known = sorted(s.latency_ewma for s in self._stats if s.latency_ewma is not None)
+            default_latency = known[len(known) // 2] if known else 1.0
+            weights = [self._weight(s, default_latency) for s in available]
+            return self._rng.choices(available, weights=weights)[0].url
+
+    def report(self, proxy_url: str, status: Optional[int], latency: Optional[float] = None) -> None:
+        """Record one request through ``proxy_url``; ``status=None`` means it failed without a response."""
+        stats = self._by_url.get(proxy_url)
+        if stats is None:
+            return
+        with self._lock:
+            ok = status is not None and status not in BAN_STATUSES and status < 500
+            if latency is not None and status is not None:
+                stats.latency_ewma = latency if stats.latency_ewma is None else (
+                    self.alpha * latency + (1 - self.alpha) * stats.latency_ewma)
+            if ok:
+                stats.successes += 1
+                stats.consecutive_failures = 0
+                stats.strikes = max(0, stats.strikes - 1)
+                outcome = "success"
+            else:
+                stats.failures += 1
+                stats.consecutive_failures += 1
+                outcome = "banned" if status in BAN_STATUSES else "error"
+                if status in BAN_STATUSES or stats.consecutive_failures >= self.failure_threshold:
+                    stats.strikes += 1
+                    cooldown = min(self.max_cooldown, self.base_cooldown * 2 ** (stats.strikes - 1))
+                    stats.quarantined_until = self._clock() + cooldown
+                    stats.consecutive_failures = 0
+        if self._on_report:
+            self._on_report(stats, outcome)
+
+    def is_quarantined(self, proxy_url: str) -> bool:
+        stats = self._by_url.get(proxy_url)
+        return stats is not None and stats.quarantined_until > self._clock()
+
+    def snapshot(self) -> List[Dict]:
+        now = self._clock()
+        with self._lock:
+            return [s.as_dict(now) for s in self._stats]
@@ -0,0 +1,182 @@
+"""Thread-safe per-host rate and concurrency control for ``ProFetcher``.
+
+* ``TokenBucket`` – a locked token bucket. Callers reserve a token under the
+  lock and sleep outside it, so N threads sharing one bucket get exactly the
+  configured rate (the old ``_last_request_ts`` check raced and let every
+  worker through at once). ``pause()`` blocks new tokens until a
+  ``Retry-After`` deadline.
+* ``AdaptiveLimit`` – an AIMD (additive increase, multiplicative decrease)
+  cap on in-flight requests. Each success adds ``increase / limit`` (about +1
+  per window of ``limit`` successes). A throttle response (429/503)
+  multiplies the limit by ``decrease``, at most once per ``cooldown``, so a
+  burst of 429s from one window counts once.
+* ``HostThrottle`` – one bucket plus one limit per host. A back-off also
+  scales the bucket rate down by the same factor, and successes restore it
+  additively up to the configured ceiling.
+"""
+from __future__ import annotations
+
+import email.utils
+import threading
+import time
+from typing import Callable, Dict, Optional
+from urllib.parse import urlparse
+
+THROTTLE_STATUSES = frozenset({429, 503})
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Seconds to wait from a ``Retry-After`` header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float = 1.0, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep) -> None:
+        self.rate = max(rate, 1e-6)
+        self.burst = max(burst, 1.0)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = clock()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until it is available; return the time waited."""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._tokens -= 1  # reserve; a negative balance queues later callers behind us
+            wait = max(-self._tokens / self.rate, self._paused_until - now, 0.0)
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def set_rate(self, rate: float) -> None:
+        with self._lock:
+            self._refill(self._clock())
+            self.rate = max(rate, 1e-6)
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for ``seconds`` (e.g. a ``Retry-After``)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+
+class AdaptiveLimit:
+    def __init__(self, initial: float = 4, minimum: float = 1, maximum: float = 32,
+                 increase: float = 1.0, decrease: float = 0.5, cooldown: float = 1.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        self.minimum = max(1.0, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(float(initial), self.minimum), self.maximum)
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._clock = clock
+        self._last_decrease = float("-inf")
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: Optional[bool]) -> bool:
+        """End one request: ``True`` = throttled, ``False`` = success, ``None`` = neither (error).
+
+        Returns whether the limit was decreased.
+        """
+        backed_off = False
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                now = self._clock()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._last_decrease = now
+                    backed_off = True
+            elif throttled is False:
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            self._cond.notify_all()
+        return backed_off
+
+
+class HostThrottle:
+    def __init__(self, host: str, rate: float, burst: float = 1.0, concurrency: float = 4,
+                 max_concurrency: float = 32, min_rate_fraction: float = 0.125,
+                 on_change: Optional[Callable[["HostThrottle"], None]] = None) -> None:
+        self.host = host
+        self.max_rate = rate
+        self.min_rate = rate * min_rate_fraction
+        self.bucket = TokenBucket(rate, burst)
+        self.limit = AdaptiveLimit(initial=concurrency, maximum=max_concurrency)
+        self._on_change = on_change
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    def _changed(self) -> None:
+        if self._on_change:
+            self._on_change(self)
+
+    def acquire(self) -> None:
+        """Wait for a concurrency slot, then for a token."""
+        self.limit.acquire()
+        self._changed()
+        try:
+            self.bucket.acquire()
+        except BaseException:
+            self.limit.release(None)
+            raise
+
+    def release(self, status: Optional[int], retry_after: Optional[float] = None) -> None:
+        """Feed back the outcome; ``status=None`` means the request failed without a response."""
+        throttled = None if status is None else status in THROTTLE_STATUSES
+        if self.limit.release(throttled):
+            self.bucket.set_rate(max(self.min_rate, self.bucket.rate * self.limit.decrease))
+        if throttled and retry_after:
+            self.bucket.pause(retry_after)
+        elif throttled is False and self.bucket.rate < self.max_rate:
+            self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.max_rate * 0.05))
+        self._changed()
+
+
+class HostThrottles:
+    """Lazily created ``HostThrottle`` per host, all with the same settings."""
+
+    def __init__(self, **settings) -> None:
+        self._settings = settings
+        self._hosts: Dict[str, HostThrottle] = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url: str) -> HostThrottle:
+        host = urlparse(url).netloc or url
+        throttle = self._hosts.get(host)
+        if throttle is None:
+            with self._lock:
+                throttle = self._hosts.get(host)
+                if throttle is None:
+                    throttle = self._hosts[host] = HostThrottle(host, **self._settings)
+        return throttle
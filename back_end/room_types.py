@@ -0,0 +1,112 @@
+"""Process-wide registry for the room types defined in room_type_classes.json.
+
+The JSON is parsed once and indexed by id. The Gemini prompt section is
+rendered once as well. The file's mtime is re-checked at most every
+``check_interval`` seconds, so edits are picked up without a restart and
+without a file open per lookup.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ROOM_TYPES_PATH = os.path.join(os.path.dirname(__file__), "room_type_classes.json")
+_UNAVAILABLE_PROMPT = "Known room types are currently unavailable."
+
+
+class RoomTypeRegistry:
+    def __init__(self, path: str = ROOM_TYPES_PATH, check_interval: float = 5.0) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._room_types: List[Dict] = []
+        self._by_id: Dict[str, Dict] = {}
+        self._prompt_section = _UNAVAILABLE_PROMPT
+        self._habitable_ids: frozenset = frozenset()
+
+    # ----------------- Loading -----------------
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if self._mtime is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._mtime is not None and now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except FileNotFoundError:
+                if self._mtime != -1.0:
+                    logger.error("room_type_classes.json bulunamadı: %s", self.path)
+                self._set([], -1.0)
+                return
+            if mtime == self._mtime:
+                return
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except json.JSONDecodeError:
+                logger.error("room_type_classes.json geçersiz JSON içeriyor.")
+                data = []
+            self._set(data if isinstance(data, list) else [], mtime)
+            logger.debug("Loaded %d room types from %s", len(self._room_types), self.path)
+
+    def _set(self, room_types: List[Dict], mtime: float) -> None:
+        self._room_types = room_types
+        self._by_id = {rt["id"]: rt for rt in room_types if isinstance(rt, dict) and rt.get("id")}
+        self._habitable_ids = frozenset(rt_id for rt_id, rt in self._by_id.items() if rt.get("is_habitable"))
+        self._prompt_section = self._render_prompt(room_types)
+        self._mtime = mtime
+
+    @staticmethod
+    def _render_prompt(room_types: List[Dict]) -> str:
+        if not room_types:
+            return _UNAVAILABLE_PROMPT
+        lines = ["Here is the list of valid room_type_id values you MUST use in JSON responses:"]
+        for rt in room_types:
+            rt_id = rt.get("id") or rt.get("room_type_id") or rt.get("identified_room_type_id") or "unknown"
+            rt_name = rt.get("name") or rt_id.replace("_", " ").title()
+            lines.append(f"- {rt_id}: {rt_name}")
+        return "\n".join(lines)
+
+    # ----------------- Public API -----------------
+    @property
+    def room_types(self) -> List[Dict]:
+        self._refresh()
+        return self._room_types
+
+    @property
+    def prompt_section(self) -> str:
+        self._refresh()
+        return self._prompt_section
+
+    @property
+    def habitable_ids(self) -> frozenset:
+        self._refresh()
+        return self._habitable_ids
+
+    def get(self, room_id: Optional[str]) -> Optional[Dict]:
+        self._refresh()
+        return self._by_id.get(room_id) if room_id else None
+
+
+_registry: Optional[RoomTypeRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> RoomTypeRegistry:
+    """Return the shared registry for the default room_type_classes.json."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = RoomTypeRegistry()
+    return _registry
@@ -0,0 +1,234 @@
+"""Persistence sinks for streamed scrape output.
+
+``persist_stream(chunks, sinks)`` feeds every chunk yielded by
+``otodom_scraper.iter_otodom_search`` to each sink and flushes it before the
+next chunk is pulled. Only one chunk is held in memory at a time, and a crash
+on page 40 keeps pages 1–39 on disk and in the databases.
+
+Sinks:
+
+* ``CsvSink``      – appends to one CSV (default: dated file under RAW_DATA_DIR).
+* ``ParquetSink``  – one ``part-NNNNN.parquet`` file per chunk in a directory.
+* ``PostgresSink`` – ``db.upsert_listings`` (COPY + change-detecting upsert).
+* ``SqliteSink``   – ``store_listings.upsert_listings`` into a SQLAlchemy URL.
+* ``HistorySink``  – one price/status observation per listing in the analyzer
+  DB (``listing_price_history`` / ``listing_latest``), with no image analysis
+  involved. On close, active listings not seen for
+  ``LISTING_REMOVED_AFTER_DAYS`` are recorded as ``removed``.
+
+A sink failing on one chunk is logged and skipped for that chunk; the other
+sinks and later chunks still run. Only chunks every sink wrote are committed
+to the incremental-crawl seen index (``seen_index.ListingChunk.commit``), so a
+failed chunk is scraped again on the next run instead of being skipped as
+unchanged.
+"""
+from __future__ import annotations
+
+import csv
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+RAW_DATA_DIR = os.getenv(
+    "RAW_DATA_DIR",
+    str(Path(__file__).resolve().parent.parent / "data" / "raw"),
+)
+# Incremental crawls stop paging at known listings, so this must exceed the
+# interval between crawls that reach the end of the results.
+LISTING_REMOVED_AFTER_DAYS = float(os.getenv("LISTING_REMOVED_AFTER_DAYS", "14"))
+
+
+def _dated_path(name: str) -> Path:
+    return Path(RAW_DATA_DIR) / datetime.utcnow().strftime("%Y-%m-%d") / name
+
+
+class CsvSink:
+    """Append chunks to one CSV; the header (existing file or first chunk) fixes the columns."""
+
+    def __init__(self, path: Optional[str] = None, dedup: bool = True) -> None:
+        self.path = Path(path) if path else _dated_path("otodom_listings.csv")
+        self.dedup = dedup
+        self.columns: Optional[List[str]] = None
+        self._seen: set = set()
+        self.written = 0
+
+    def write(self, listings: List[Dict]) -> None:
+        df = pd.DataFrame(listings)
+        if self.dedup and "id" in df.columns:
+            df = df.drop_duplicates(subset=["id"])
+            df = df[~df["id"].astype(str).isin(self._seen)]
+            self._seen.update(df["id"].astype(str))
+        if df.empty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        header = not self.path.exists() or self.path.stat().st_size == 0
+        if self.columns is None:
+            if header:
+                self.columns = list(df.columns)
+            else:
+                with open(self.path, newline="", encoding="utf-8") as f:
+                    self.columns = next(csv.reader(f), list(df.columns))
+        dropped = [c for c in df.columns if c not in self.columns]
+        if dropped:
+            logger.debug("CSV %s: dropping columns not in header: %s", self.path, dropped)
+        df.reindex(columns=self.columns).to_csv(self.path, mode="a", index=False, header=header)
+        self.written += len(df)
+
+    def close(self) -> None:
+        logger.info("Persisted %s listings to %s", self.written, self.path)
+
+
+class ParquetSink:
+    """Write each chunk as its own Parquet file (a dataset directory readable as one table)."""
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.directory = Path(directory) if directory else _dated_path("otodom_listings.parquet")
+        self.parts = 0
+        self.written = 0
+
+    def write(self, listings: List[Dict]) -> None:
+        if not listings:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        while (self.directory / f"part-{self.parts:05d}.parquet").exists():
+            self.parts += 1  # resume after an earlier run on the same day
+        path = self.directory / f"part-{self.parts:05d}.parquet"
+        df = pd.DataFrame(listings)
+        # Mixed-type object columns (e.g. floor "3" vs 3) are stored as text.
+        for col in df.columns[df.dtypes == object]:
+            if not df[col].map(lambda v: isinstance(v, (list, dict))).any():
+                df[col] = df[col].map(lambda v: None if v is None else str(v))
+        df.to_parquet(path, index=False)
+        self.parts += 1
+        self.written += len(df)
+
+    def close(self) -> None:
+        logger.info("Persisted %s listings to %s (%s parts)", self.written, self.directory, self.parts)
+
+
+class PostgresSink:
+    """Upsert each chunk into the Postgres ``listings`` table (``db.upsert_listings``)."""
+
+    def __init__(self) -> None:
+        from db import upsert_listings
+
+        self._upsert = upsert_listings
+        self.counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    def write(self, listings: List[Dict]) -> None:
+        for key, value in self._upsert(listings).items():
+            self.counts[key] = self.counts.get(key, 0) + value
+
+    def close(self) -> None:
+        logger.info(
+            "Postgres upsert: %s inserted, %s updated, %s unchanged",
+            self.counts["inserted"], self.counts["updated"], self.counts["unchanged"],
+        )
+
+
+class SqliteSink:
+    """Upsert each chunk into ``models.Listing`` at a SQLAlchemy URL (see store_listings.py)."""
+
+    def __init__(self, db_url: str) -> None:
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+
+        from migrations import migrate_listings_db
+        from models import db
+        from store_listings import upsert_listings
+
+        engine = create_engine(db_url)
+        db.Model.metadata.create_all(engine)
+        migrate_listings_db(engine)
+        self._session = sessionmaker(bind=engine)()
+        self._upsert = upsert_listings
+        self.counts = {"inserted": 0, "updated": 0}
+
+    def write(self, listings: List[Dict]) -> None:
+        try:
+            for key, value in self._upsert(listings, self._session).items():
+                self.counts[key] += value
+        except Exception:
+            self._session.rollback()
+            raise
+
+    def close(self) -> None:
+        self._session.close()
+        logger.info("SQLite upsert: %s inserted, %s updated", self.counts["inserted"], self.counts["updated"])
+
+
+def _observed_price(value) -> Optional[float]:
+    try:
+        return float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        return None
+
+
+class HistorySink:
+    """Record each listing's price as an ``active`` observation (``AnalysisStore.record_observations``)."""
+
+    def __init__(self, store=None, removed_after_days: float = LISTING_REMOVED_AFTER_DAYS) -> None:
+        if store is None:
+            from analysis_store import get_store
+            from migrations import migrate_analysis_db
+
+            migrate_analysis_db()
+            store = get_store()
+        self._store = store
+        self.removed_after_days = removed_after_days
+        self.observed = 0
+        self.removed = 0
+
+    def write(self, listings: List[Dict]) -> None:
+        rows = [(str(l["id"]), _observed_price(l.get("price")), "active") for l in listings if l.get("id") is not None]
+        self._store.record_observations(rows)
+        self.observed += len(rows)
+
+    def close(self) -> None:
+        # A run that saw nothing (blocked, broken parser) must not delist everything.
+        if self.observed and self.removed_after_days > 0:
+            from analysis_store import utc_timestamp
+
+            cutoff = utc_timestamp(datetime.now(timezone.utc) - timedelta(days=self.removed_after_days))
+            self.removed = self._store.mark_removed(cutoff)
+        logger.info("Price history: %s observations, %s listings marked removed", self.observed, self.removed)
+
+
+def persist_stream(chunks: Iterable[List[Dict]], sinks: Sequence) -> int:
+    """Write every chunk to every sink as it arrives; return the number of listings seen."""
+    total = 0
+    try:
+        for chunk in chunks:
+            if not chunk:
+                continue
+            total += len(chunk)
+            failed = False
+            for sink in sinks:
+                try:
+                    sink.write(chunk)
+                except Exception as e:
+                    failed = True
+                    logger.error("%s failed on a chunk of %s listings: %s", type(sink).__name__, len(chunk), e)
+            commit = getattr(chunk, "commit", None)
+            if commit is None:
+                continue
+            if failed:
+                logger.warning("Chunk of %s listings not marked seen; it is re-scraped next run", len(chunk))
+                continue
+            try:
+                commit()
+            except Exception as e:
+                logger.error("Marking %s listings as seen failed: %s", len(chunk), e)
+    finally:
+        for sink in sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                logger.error("Closing %s failed: %s", type(sink).__name__, e)
+    return total
@@ -1,7 +1,21 @@
 import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, UnicodeDammit
 import json
 import re # For cleaning description
+from html_extract import loads as json_loads, script_text
+
+
+def _decode_html(response):
+    """Decode the page like BeautifulSoup(response.content) did.
+
+    requests falls back to ISO-8859-1 when Content-Type has no charset, which
+    garbles UTF-8 pages; then the bytes are decoded from the BOM / <meta charset>
+    and detection instead.
+    """
+    if 'charset' in response.headers.get('Content-Type', '').lower():
+        return response.text
+    return UnicodeDammit(response.content, is_html=True).unicode_markup
+
 
 def get_listing_details(url):
     """
@@ -15,13 +29,21 @@ def get_listing_details(url):
     try:
         response = requests.get(url, headers=headers, timeout=20)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
+        html = _decode_html(response)
+        # The DOM is only needed for the CSS-selector fallbacks: build it on first use.
+        soup = None
+
+        def page():
+            nonlocal soup
+            if soup is None:
+                soup = BeautifulSoup(html, 'html.parser')
+            return soup
 
         # --- Primary Method: Extracting data from __NEXT_DATA__ script tag ---
-        script_tag = soup.find('script', {'id': '__NEXT_DATA__'})
-        if script_tag:
+        next_data = script_text(html, id='__NEXT_DATA__')
+        if next_data is not None:
             try:
-                json_data = json.loads(script_tag.string)
+                json_data = json_loads(next_data)
                 ad_data = json_data.get('props', {}).get('pageProps', {}).get('ad', {})
 
                 if not ad_data: # Sometimes data is directly under pageProps
@@ -44,7 +66,7 @@ def get_listing_details(url):
                     scraped_data['price'] = target_data.get('Price')
                     scraped_data['currency'] = target_data.get('PriceCurrency', 'PLN') # Assume PLN if not found
                 else: # Fallback for price if not in JSON under expected keys
-                    price_element = soup.find('strong', {'data-cy': 'adPageHeaderPrice'})
+                    price_element = page().find('strong', {'data-cy': 'adPageHeaderPrice'})
                     if price_element:
                         scraped_data['price'] = price_element.get_text(strip=True)
                         # Currency might need separate extraction if not with price
@@ -59,7 +81,7 @@ def get_listing_details(url):
                             scraped_data['price_per_m2'] = char_item.get('localizedValue')
                             break
                     if not scraped_data.get('price_per_m2'):
-                        price_m2_el = soup.find('div', {'aria-label': 'Cena za metr kwadratowy'})
+                        price_m2_el = page().find('div', {'aria-label': 'Cena za metr kwadratowy'})
                         if price_m2_el:
                              scraped_data['price_per_m2'] = price_m2_el.get_text(strip=True)
 
@@ -93,7 +115,7 @@ def get_listing_details(url):
                             loc_parts.append(address_data['province']['name'])
                         scraped_data['location_string'] = ", ".join(filter(None, loc_parts))
                 else: # Fallback to map link text
-                    map_link = soup.find('a', {'href': '#map'})
+                    map_link = page().find('a', {'href': '#map'})
                     if map_link:
                         scraped_data['location_string'] = map_link.get_text(strip=True)
 
@@ -106,7 +128,7 @@ def get_listing_details(url):
                     desc_soup = BeautifulSoup(description_html, 'html.parser')
                     scraped_data['description'] = desc_soup.get_text(separator='\n', strip=True)
                 else: # Fallback for description
-                    desc_div = soup.find('div', {'data-cy': 'adPageAdDescription'})
+                    desc_div = page().find('div', {'data-cy': 'adPageAdDescription'})
                     if desc_div:
                         # Need to click "show more" usually, so this might be truncated
                         scraped_data['description'] = desc_div.get_text(separator='\n', strip=True)
@@ -185,11 +207,11 @@ def get_listing_details(url):
                     scraped_data['seller_name'] = owner_data.get('name')
                     scraped_data['seller_type'] = owner_data.get('type', 'private') # 'private' or 'business'
                 else: # Fallback for seller name
-                    seller_name_el = soup.find('p', {'data-sentry-element': 'SellerName'})
+                    seller_name_el = page().find('p', {'data-sentry-element': 'SellerName'})
                     if seller_name_el:
                         scraped_data['seller_name'] = seller_name_el.get_text(strip=True)
                     else: # Try another common pattern for agency name
-                        agency_name_el = soup.find('strong', {'aria-label': 'Nazwa agencji'})
+                        agency_name_el = page().find('strong', {'aria-label': 'Nazwa agencji'})
                         if agency_name_el:
                             scraped_data['seller_name'] = agency_name_el.get_text(strip=True)
 
@@ -198,7 +220,7 @@ def get_listing_details(url):
                 images_data = ad_data.get('images', [])
                 scraped_data['image_urls'] = [img.get('large') for img in images_data if img.get('large')]
                 if not scraped_data['image_urls']: # Fallback for main image
-                    og_image = soup.find('meta', property='og:image')
+                    og_image = page().find('meta', property='og:image')
                     if og_image and og_image.get('content'):
                         scraped_data['image_urls'] = [og_image['content']]
 
@@ -215,11 +237,11 @@ def get_listing_details(url):
         else:
             print("Could not find __NEXT_DATA__ script tag. This scraper relies heavily on it.")
             # Basic CSS selector fallbacks (less reliable for complex data)
-            scraped_data['title'] = soup.find('h1', {'data-cy': 'adPageAdTitle'}).get_text(strip=True) if soup.find('h1', {'data-cy': 'adPageAdTitle'}) else None
-            price_el = soup.find('strong', {'data-cy': 'adPageHeaderPrice'})
+            scraped_data['title'] = page().find('h1', {'data-cy': 'adPageAdTitle'}).get_text(strip=True) if page().find('h1', {'data-cy': 'adPageAdTitle'}) else None
+            price_el = page().find('strong', {'data-cy': 'adPageHeaderPrice'})
             if price_el: scraped_data['price'] = price_el.get_text(strip=True)
 
-            map_link = soup.find('a', {'href': '#map'})
+            map_link = page().find('a', {'href': '#map'})
             if map_link: scraped_data['location_string'] = map_link.get_text(strip=True)
             # ... and so on for other critical fields if __NEXT_DATA__ is missing.
 
@@ -0,0 +1,169 @@
+"""Index of listings the crawler has already seen, for incremental runs.
+
+Two Redis keys per namespace:
+
+* ``{ns}:last_seen`` – sorted set, member = listing id, score = last-seen
+  epoch seconds. One structure answers both "seen before?" and "when?", and
+  entries older than the retention window are pruned by score.
+* ``{ns}:fp`` – hash, listing id -> 16-hex-char content hash of the raw
+  search item (price, images, parameters, title; see ``search_item_hash``).
+  A matching hash means the listing is unchanged, so geocoding, detail
+  fetches, DB writes and analysis dispatch are skipped.
+
+Changed and new listings are only marked once they are stored: the crawler
+hands them out as ``ListingChunk`` lists carrying their pending entries, and
+``scrape_sinks.persist_stream`` calls ``commit()`` after every sink wrote
+the chunk. A chunk that failed anywhere stays unmarked and is scraped again
+on the next run.
+
+Lookups and updates are pipelined: one round-trip per search page. When
+Redis is unreachable (``cache.get_redis`` falls back to a dict without
+sorted sets), the index lives in process memory for the current run.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEEN_NAMESPACE = os.getenv("SEEN_INDEX_NAMESPACE", "seen")
+SEEN_RETENTION_DAYS = float(os.getenv("SEEN_RETENTION_DAYS", "60"))
+
+
+def _image_urls(images) -> list:
+    if not isinstance(images, list):
+        return []
+    return [img.get("large") or img.get("small") if isinstance(img, dict) else img for img in images]
+
+
+def search_item_hash(item: Dict) -> str:
+    """Canonical hash of the listing-level fields of one search payload item.
+
+    Covers price, image URLs, parameters (order-insensitive) and title; key
+    order and formatting of the payload do not affect it.
+    """
+    params = sorted(
+        (str(p.get("key")), json.dumps(p.get("value"), sort_keys=True, default=str, ensure_ascii=False))
+        for p in item.get("parameters") or [] if isinstance(p, dict)
+    )
+    payload = {
+        "price": item.get("price"),
+        "images": _image_urls(item.get("images")),
+        "parameters": params,
+        "title": item.get("name") or item.get("title"),
+    }
+    raw = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str, ensure_ascii=False)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def split_unchanged(index: "SeenIndex", items: Sequence[Dict]) -> Tuple[list, list]:
+    """Classify search items against ``index`` with one lookup.
+
+    Returns ``(entries, unchanged)``: ``entries`` is ``[(item, hash, state)]``
+    in input order with state ``new`` / ``changed`` / ``unchanged``;
+    ``unchanged`` is the ``(listing_id, hash)`` list to re-mark as seen.
+    """
+    hashes = [(item, str(item.get("id")), search_item_hash(item)) for item in items]
+    known = index.lookup([listing_id for _, listing_id, _ in hashes])
+    entries, unchanged = [], []
+    for item, listing_id, digest in hashes:
+        if listing_id not in known:
+            state = "new"
+        elif known[listing_id] == digest:
+            state = "unchanged"
+            unchanged.append((listing_id, digest))
+        else:
+            state = "changed"
+        entries.append((item, digest, state))
+    return entries, unchanged
+
+
+class SeenIndex:
+    def __init__(self, client=None, namespace: str = SEEN_NAMESPACE,
+                 retention_days: float = SEEN_RETENTION_DAYS) -> None:
+        if client is None:
+            from cache import get_redis
+
+            client = get_redis()
+        self._redis = client if hasattr(client, "zadd") else None
+        if self._redis is None:
+            logger.warning("Seen index: Redis unavailable → in-memory index for this process only")
+        self._local: Dict[str, Tuple[float, str]] = {}
+        self.seen_key = f"{namespace}:last_seen"
+        self.fp_key = f"{namespace}:fp"
+        self.retention_s = retention_days * 86400
+
+    def lookup(self, listing_ids: Sequence[str]) -> Dict[str, Optional[str]]:
+        """``{id: content hash}`` for the ids seen before; unseen ids are absent."""
+        ids = [str(i) for i in listing_ids]
+        if not ids:
+            return {}
+        if self._redis is None:
+            return {i: self._local[i][1] for i in ids if i in self._local}
+        pipe = self._redis.pipeline(transaction=False)
+        for i in ids:
+            pipe.zscore(self.seen_key, i)
+        pipe.hmget(self.fp_key, ids)
+        *scores, hashes = pipe.execute()
+        return {i: h for i, score, h in zip(ids, scores, hashes) if score is not None}
+
+    def mark(self, entries: Iterable[Tuple[str, str]], seen_at: Optional[float] = None) -> int:
+        """Record ``(listing_id, content hash)`` pairs as seen at ``seen_at`` (default: now)."""
+        seen_at = time.time() if seen_at is None else seen_at
+        mapping = {str(i): fp for i, fp in entries}
+        if not mapping:
+            return 0
+        if self._redis is None:
+            self._local.update({i: (seen_at, fp) for i, fp in mapping.items()})
+            return len(mapping)
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zadd(self.seen_key, {i: seen_at for i in mapping})
+        pipe.hset(self.fp_key, mapping=mapping)
+        pipe.execute()
+        return len(mapping)
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Forget listings not seen within the retention window."""
+        cutoff = (time.time() if now is None else now) - self.retention_s
+        if self._redis is None:
+            stale = [i for i, (ts, _) in self._local.items() if ts < cutoff]
+            for i in stale:
+                del self._local[i]
+            return len(stale)
+        stale = self._redis.zrangebyscore(self.seen_key, "-inf", f"({cutoff}")
+        if stale:
+            pipe = self._redis.pipeline(transaction=True)
+            pipe.hdel(self.fp_key, *stale)
+            pipe.zremrangebyscore(self.seen_key, "-inf", f"({cutoff}")
+            pipe.execute()
+        return len(stale)
+
+
+class ListingChunk(list):
+    """Finished listings plus the ``(listing_id, hash)`` entries to mark once they are persisted."""
+
+    def __init__(self, listings: Iterable[Dict] = (), index: Optional[SeenIndex] = None,
+                 entries: Iterable[Tuple[str, str]] = ()) -> None:
+        super().__init__(listings)
+        self.index = index
+        self.pending = list(entries)
+
+    def absorb(self, chunk: Iterable[Dict]) -> None:
+        """Append another chunk's listings and its pending entries."""
+        self.extend(chunk)
+        if isinstance(chunk, ListingChunk):
+            self.pending.extend(chunk.pending)
+            self.index = self.index or chunk.index
+
+    def commit(self) -> int:
+        """Mark the pending entries as seen (call only after the listings were written)."""
+        if self.index is None or not self.pending:
+            return 0
+        marked = self.index.mark(self.pending)
+        self.pending = []
+        return marked
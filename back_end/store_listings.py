@@ -12,62 +12,109 @@ import argparse
 from pathlib import Path
 from typing import List, Dict
 
-from otodom_scraper import scrape_otodom_search
-from models import db, Listing
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from models import Listing
 import pandas as pd
-from datetime import datetime
-from dateutil.parser import parse as dateutil_parse
+from datetime import datetime, timezone
 
 
 DEFAULT_DB_URL = "sqlite:///otodom.db"
 
-
-def upsert_listings(listings: List[Dict], session):
-    """Insert or update listings based on unique listing_id."""
-    for item in listings:
-        listing_obj = (
-            session.query(Listing).filter_by(listing_id=item["id"]).one_or_none()
+ROOMS_MAP = {"ONE": 1, "TWO": 2, "THREE": 3, "FOUR": 4, "FIVE": 5}
+UPSERT_CHUNK_SIZE = 500
+EXTRA_FIELDS = [
+    "floor", "total_floors", "year_built", "building_type", "condition",
+    "parking_spaces", "balcony_area", "heating_type",
+]
+
+
+def _numeric_text(series: pd.Series) -> pd.Series:
+    """Numbers as compact strings ("450000", "12.5"); other text ("450 000 zł") as scraped; missing -> None."""
+    num = pd.to_numeric(series, errors="coerce")
+    text = num.astype(str).str.replace(r"\.0$", "", regex=True)
+    raw = series.map(lambda v: v.strip() or None if isinstance(v, str) else None)
+    return text.where(num.notna(), raw)
+
+
+def prepare_listing_rows(listings: List[Dict]) -> List[Dict]:
+    """Coerce scraped items into ``Listing`` column mappings, column-wise.
+
+    Later duplicates of the same listing id win.
+    """
+    if not listings:
+        return []
+    df = pd.DataFrame(listings)
+    for col in ["id", "detail_url", "title", "price", "currency", "price_per_sqm", "area_sqm", "rooms",
+                "street_name", "city_name", "latitude", "longitude", "images", "is_private_owner",
+                "date_created", *EXTRA_FIELDS]:
+        if col not in df.columns:
+            df[col] = None
+
+    out = pd.DataFrame({
+        "listing_id": pd.to_numeric(df["id"], errors="coerce").astype("Int64"),
+        "url": df["detail_url"],
+        "title": df["title"],
+        "price": _numeric_text(df["price"]),
+        "currency": df["currency"],
+        "price_per_m2": _numeric_text(df["price_per_sqm"]),
+        "area_sqm": pd.to_numeric(df["area_sqm"], errors="coerce"),
+        # rooms come as enums ("TWO") or already as numbers
+        "rooms": df["rooms"].map(ROOMS_MAP).fillna(pd.to_numeric(df["rooms"], errors="coerce")).astype("Int64"),
+        "location_string": df["street_name"].fillna(df["city_name"]),
+        "latitude": pd.to_numeric(df["latitude"], errors="coerce"),
+        "longitude": pd.to_numeric(df["longitude"], errors="coerce"),
+        "image_count": df["images"].map(len, na_action="ignore").where(lambda n: n > 0).astype("Int64"),
+        "is_private_owner": df["is_private_owner"].map(bool, na_action="ignore"),
+        "date_created": pd.to_datetime(df["date_created"], errors="coerce", utc=True, format="mixed").dt.tz_localize(None),
+    })
+    for col in EXTRA_FIELDS:
+        out[col] = df[col]
+
+    out = out[out["listing_id"].notna()].drop_duplicates("listing_id", keep="last")
+    # object dtype so NaN/NA/NaT become plain None for the DB driver
+    out = out.astype(object).where(out.notna(), None)
+    rows = out.to_dict("records")
+    for row in rows:
+        # DB drivers want builtin types, not numpy/pandas scalars
+        for col in ("listing_id", "rooms", "image_count"):
+            if row[col] is not None:
+                row[col] = int(row[col])
+        if row["date_created"] is not None:
+            row["date_created"] = row["date_created"].to_pydatetime()
+    return rows
+
+
+def upsert_listings(listings: List[Dict], session, chunk_size: int = UPSERT_CHUNK_SIZE) -> Dict[str, int]:
+    """Insert or update listings based on unique listing_id.
+
+    Existing ids are looked up with one ``IN`` query per chunk; rows are then
+    written with bulk insert/update mappings instead of per-item ORM objects.
+    """
+    rows = prepare_listing_rows(listings)
+    now = datetime.now(timezone.utc)
+    inserted = updated = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        existing = dict(
+            session.query(Listing.listing_id, Listing.id)
+            .filter(Listing.listing_id.in_([r["listing_id"] for r in chunk]))
+            .all()
         )
-        if listing_obj is None:
-            listing_obj = Listing(listing_id=item["id"])
-            session.add(listing_obj)
-
-        # basic fields we store
-        listing_obj.url = item.get("detail_url")
-        listing_obj.title = item.get("title")
-        listing_obj.price = str(item.get("price"))
-        listing_obj.currency = item.get("currency")
-        listing_obj.price_per_m2 = str(item.get("price_per_sqm"))
-        listing_obj.area_sqm = item.get("area_sqm")
-        # rooms comes as enums; map to int if possible
-        rooms_map = {"ONE": 1, "TWO": 2, "THREE": 3, "FOUR": 4, "FIVE": 5}
-        listing_obj.rooms = rooms_map.get(item.get("rooms"), None)
-        listing_obj.location_string = item.get("street_name") or item.get("city_name")
-        listing_obj.latitude = item.get("latitude")
-        listing_obj.longitude = item.get("longitude")
-        listing_obj.image_count = len(item.get("images", [])) if item.get("images") else None
-        listing_obj.is_private_owner = bool(item.get("is_private_owner")) if item.get("is_private_owner") is not None else None
-        # date_created may come as ISO string; convert to datetime or None
-        raw_dt = item.get("date_created")
-        if isinstance(raw_dt, str):
-            try:
-                raw_dt = dateutil_parse(raw_dt)
-            except Exception:
-                raw_dt = None
-        listing_obj.date_created = raw_dt if isinstance(raw_dt, datetime) else None
-        # professional extras
-        listing_obj.floor = item.get("floor")
-        listing_obj.total_floors = item.get("total_floors")
-        listing_obj.year_built = item.get("year_built")
-        listing_obj.building_type = item.get("building_type")
-        listing_obj.condition = item.get("condition")
-        listing_obj.parking_spaces = item.get("parking_spaces")
-        listing_obj.balcony_area = item.get("balcony_area")
-        listing_obj.heating_type = item.get("heating_type")
+        new_rows, update_rows = [], []
+        for row in chunk:
+            pk = existing.get(row["listing_id"])
+            if pk is None:
+                new_rows.append({**row, "created_at": now, "updated_at": now})
+            else:
+                update_rows.append({**row, "id": pk, "updated_at": now})
+        if new_rows:
+            session.bulk_insert_mappings(Listing, new_rows)
+        if update_rows:
+            session.bulk_update_mappings(Listing, update_rows)
+        inserted += len(new_rows)
+        updated += len(update_rows)
 
     session.commit()
+    return {"inserted": inserted, "updated": updated}
 
 
 def main():
@@ -81,54 +128,23 @@ def main():
     )
     args = parser.parse_args()
 
-    print(f"Scraping {args.pages} pages from Otodom…")
-    data = scrape_otodom_search(max_pages=args.pages)
-    print(f"Fetched {len(data)} listings")
-
-    engine = create_engine(args.db)
-    db.Model.metadata.create_all(engine)
-
-    # --------- lightweight schema migration (SQLite) ---------
-    def ensure_listing_schema(_engine):
-        """Add missing columns for backward-compat databases (SQLite)."""
-        try:
-            with _engine.begin() as conn:
-                res = conn.execute(text("PRAGMA table_info(listings)"))
-                existing_cols = {row[1] for row in res}
-
-                required_cols = {
-                    "area_sqm": "REAL",
-                    "rooms": "INTEGER",
-                    "image_count": "INTEGER",
-                    "is_private_owner": "INTEGER",  # SQLite lacks BOOLEAN
-                    "date_created": "DATETIME",
-                    "floor": "INTEGER",
-                    "total_floors": "INTEGER",
-                    "year_built": "INTEGER",
-                    "building_type": "TEXT",
-                    "condition": "TEXT",
-                    "parking_spaces": "INTEGER",
-                    "balcony_area": "REAL",
-                    "heating_type": "TEXT",
-                }
-                for col, col_type in required_cols.items():
-                    if col not in existing_cols:
-                        print(f"Adding missing column '{col}' to listings table…")
-                        conn.execute(text(f"ALTER TABLE listings ADD COLUMN {col} {col_type}"))
-        except Exception as e:
-            print(f"Schema check failed: {e}")
-
-    ensure_listing_schema(engine)
-    Session = sessionmaker(bind=engine)
-    session = Session()
-
-    upsert_listings(data, session)
-    print("Database upsert completed.")
+    # The scraper stack (Celery, analyzer, metrics) is only needed for a crawl.
+    from otodom_scraper import iter_otodom_search
+    from scrape_sinks import CsvSink, HistorySink, SqliteSink, persist_stream
 
+    print(f"Scraping {args.pages} pages from Otodom…")
+    # Each chunk is upserted (and appended to the CSV) as soon as it is scraped.
+    db_sink = SqliteSink(args.db)
+    sinks = [db_sink, HistorySink()]
     if args.csv:
         csv_path = Path(args.csv)
-        csv_path.parent.mkdir(parents=True, exist_ok=True)
-        pd.DataFrame(data).to_csv(csv_path, index=False)
+        if csv_path.exists():
+            csv_path.unlink()  # fresh export per run
+        sinks.append(CsvSink(str(csv_path)))
+    total = persist_stream(iter_otodom_search(max_pages=args.pages), sinks)
+    print(f"Fetched {total} listings")
+    print(f"Database upsert completed ({db_sink.counts['inserted']} inserted, {db_sink.counts['updated']} updated).")
+    if args.csv:
         print(f"CSV saved to {csv_path}")
 
 
@@ -2,11 +2,13 @@
 import os
 import logging
 from celery import Celery
+from celery.signals import worker_init
 from typing import List
 
-from back_end.analyze_the_rooms import RoomAnalyzer
-from back_end.models import db, AnalysisResult
-from back_end.vault_client import get_secret
+from analyzer_factory import get_analyzer
+from models import db, AnalysisResult
+from vault_client import get_secret
+from migrations import migrate_analysis_db
 
 logging.basicConfig(level=logging.INFO)
 _logger = logging.getLogger(__name__)
@@ -15,7 +17,13 @@ CELERY_BROKER_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 app = Celery("tasks", broker=CELERY_BROKER_URL, backend=CELERY_BROKER_URL)
 
 _api_key = get_secret("GEMINI_API_KEY") or os.getenv("GEMINI_API_KEY")
-_analyzer = RoomAnalyzer(gemini_api_key=_api_key) if _api_key else None
+_analyzer = get_analyzer(_api_key) if _api_key else None
+
+
+@worker_init.connect
+def _run_migrations(**_kwargs):
+    """Apply pending schema migrations once when the worker boots."""
+    migrate_analysis_db()
 
 
 @app.task(bind=True, autoretry_for=(Exception,), retry_backoff=5, retry_kwargs={"max_retries": 3})
@@ -37,7 +45,8 @@ def analyze_images_task(self, listing_id: str, image_urls: List[str]):
 
 # ------------------ Scraping task ------------------
 
-from back_end.otodom_scraper import scrape_otodom_search  # noqa: E402 at end of file
+from otodom_scraper import iter_otodom_search  # noqa: E402 at end of file
+from scrape_sinks import CsvSink, HistorySink, PostgresSink, persist_stream  # noqa: E402
 
 
 @app.task(bind=True, autoretry_for=(Exception,), retry_backoff=10, retry_kwargs={"max_retries": 5})
@@ -45,9 +54,12 @@ def scrape_otodom_task(self, max_pages: int = 3):
     """Celery task to scrape Otodom listings and persist to DB/CSV."""
     _logger.info("Scrape task started (max_pages=%s)", max_pages)
     try:
-        listings = scrape_otodom_search(max_pages=max_pages)
-        _logger.info("Scrape task finished: %s listings scraped", len(listings))
-        return len(listings)
+        # Chunks are persisted as they arrive; a retry re-upserts unchanged rows as no-ops.
+        total = persist_stream(
+            iter_otodom_search(max_pages=max_pages), [CsvSink(), PostgresSink(), HistorySink()]
+        )
+        _logger.info("Scrape task finished: %s listings scraped", total)
+        return total
     except Exception as e:
         _logger.error("Scrape task failed: %s", e)
         raise
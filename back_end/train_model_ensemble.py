@@ -3,7 +3,7 @@ import os, joblib, mlflow, shap, lightgbm as lgb, pandas as pd, xgboost as xgb
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error
 from sklearn.ensemble import StackingRegressor
-from back_end.datahub_emitter import emit_lineage
+from datahub_emitter import emit_lineage
 
 DATA_PATH = os.getenv("DATASET_CSV", "./back_end/data/dataset.csv")
 FEATURES = [
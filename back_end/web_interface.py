@@ -8,19 +8,25 @@ from flask import Flask, render_template, request, jsonify, send_from_directory,
 import os
 import json
 import time
-from analyze_the_rooms import RoomAnalyzer
+from analyzer_factory import get_analyzer
 import threading
 from models import db, Listing, ListingDetail, Image, RoomClassification, SameRoomRelation, AnalysisResult
+from analysis_store import sqlalchemy_uri, get_store, MAX_PAGE_SIZE
+from migrations import migrate_analysis_db
+from map_tiles import get_tile, valid_tile
 from otodom_scraper import scrape_otodom_page, OTODOM_SEARCH_URL_WROCLAW
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)  # Nécessaire pour les sessions
 
 # Configuration de la base de données
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:////Users/kadirhan/Desktop/ev/real_estate_agent_v2/back_end/real_estate_analysis.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = sqlalchemy_uri()  # ANALYSIS_DB_PATH, same file as RoomAnalyzer
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 
+# Schema migrations run once per process at start-up, not per request
+migrate_analysis_db()
+
 # Configuration
 BATCH_MODE = True  # Changez à False pour utiliser le mode individuel
 UPLOAD_FOLDER = 'static/results'
@@ -148,14 +154,22 @@ def get_status(analysis_id):
         }
         
         # Eğer sonuçlar varsa ekle
-        if analysis.room_summary:
-            try:
-                result['results'] = json.loads(analysis.room_summary)
-            except:
-                result['results'] = {}
+        if analysis.status == 'completed':
+            result['results'] = _load_results(analysis)
         
         return jsonify(result)
 
+def _load_results(analysis):
+    """Results dict of a finished analysis (compressed payload, or legacy inline column)."""
+    raw = analysis.room_summary or get_store().get_payload(analysis.analysis_id, 'room_summary')
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except Exception as e:
+        app.logger.error(f"Failed to parse room summary: {e}")
+        return {}
+
 @app.route('/results/<analysis_id>')
 def get_results(analysis_id):
     """Récupère les résultats complets d'une analyse."""
@@ -181,15 +195,8 @@ def get_results(analysis_id):
                 'execution_time': analysis.execution_time
             }
             
-            # Eğer sonuçlar varsa ekle
-            if analysis.room_summary:
-                try:
-                    result_json = json.loads(analysis.room_summary)
-                    print(f"[DEBUG] Room summary loaded from DB: {result_json.keys() if result_json else 'None'}")
-                    result['results'] = result_json
-                except Exception as e:
-                    print(f"[ERROR] Failed to parse room summary: {e}")
-                    result['results'] = {}
+            # Sonuçları (sıkıştırılmış payload) yükle
+            result['results'] = _load_results(analysis)
         
     return jsonify(result)
 
@@ -213,9 +220,9 @@ def run_analysis(analysis_id, url, api_key, lang=DEFAULT_LANGUAGE):
                 'message': translations[lang].get('status_starting', 'Démarrage de l\'analyse...')
             })
         
-        # Créer l'analyseur
-        analyzer = RoomAnalyzer(
-            gemini_api_key=api_key,
+        # Analyseur partagé par processus (voir analyzer_factory.py)
+        analyzer = get_analyzer(
+            api_key,
             enable_duplicate_detection=True,
             api_delay=1.0 if BATCH_MODE else 2.0,
             batch_mode=BATCH_MODE
@@ -271,6 +278,11 @@ def run_analysis(analysis_id, url, api_key, lang=DEFAULT_LANGUAGE):
         with open(output_file, 'w', encoding='utf-8') as f:
             json.dump(results, f, indent=2, ensure_ascii=False)
         
+        # Full results dict is stored compressed outside analysis_results. Written
+        # before the row turns 'completed' so pollers never see a completed analysis
+        # without results; if it fails, the handler below marks the analysis 'error'.
+        get_store().put_payloads(analysis_id, {'room_summary': json.dumps(results)})
+
         # Veritabanında tamamlanma durumunu güncelle
         with app.app_context():
             analysis = AnalysisResult.query.filter_by(analysis_id=analysis_id).first()
@@ -279,7 +291,6 @@ def run_analysis(analysis_id, url, api_key, lang=DEFAULT_LANGUAGE):
                 analysis.progress = 100
                 analysis.message = translations[lang].get('status_complete', 'Analyse terminée avec succès!')
                 analysis.execution_time = execution_time
-                analysis.room_summary = json.dumps(results)
                 db.session.commit()
         
         # Geriye dönük uyumluluk için global değişkeni de güncelle
@@ -336,31 +347,84 @@ def get_translations(lang):
 
 @app.route('/map')
 def show_map():
-    """Route to display a map with listings fetched from the database."""
+    """Route to display the map; markers are loaded per viewport from /tiles/<z>/<x>/<y>.json."""
+    return render_template('map_view.html', listings_json=json.dumps([]))
+
+def _listing_query_args():
+    """Common pagination/projection arguments for the spatial listing endpoints."""
+    fields = request.args.get('fields')
+    return {
+        'limit': request.args.get('limit', 500, type=int),
+        'offset': request.args.get('offset', 0, type=int),
+        'fields': [f.strip() for f in fields.split(',') if f.strip()] if fields else None,
+    }
+
+def _listing_page(items, limit, offset):
+    return jsonify({
+        'items': items,
+        'limit': limit,
+        'offset': offset,
+        'next_offset': offset + len(items) if len(items) == limit else None,
+    })
+
+@app.route('/api/listings/bbox')
+def listings_in_bbox():
+    """Listings inside ?south=&west=&north=&east= (R*Tree indexed), paginated."""
     try:
-        api_key = os.getenv('GEMINI_API_KEY')
-        if not api_key:
-            # API anahtarı yoksa RoomAnalyzer'ı başlatamayız, bu bir sorun.
-            # Ya da RoomAnalyzer'ı API anahtarı olmadan da veritabanı işlemleri için kullanılabilecek şekilde tasarlamalıyız.
-            # Şimdilik, API anahtarı yoksa hata döndürelim veya boş liste gösterelim.
-            app.logger.error("GEMINI_API_KEY is not set. Cannot initialize RoomAnalyzer for map view.")
-            return render_template('map_view.html', listings_json=json.dumps([]), error_message="GEMINI_API_KEY not set.")
+        south, west, north, east = (float(request.args[k]) for k in ('south', 'west', 'north', 'east'))
+        args = _listing_query_args()
+        items = get_store().fetch_listings_in_bbox(south, west, north, east, **args)
+    except (KeyError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f'Invalid query: {e}'}), 400
+    return _listing_page(items, min(max(args['limit'], 1), MAX_PAGE_SIZE), max(args['offset'], 0))
 
-        analyzer = RoomAnalyzer(gemini_api_key=api_key)
-        app.logger.info("Map route: Fetching listings from database for map display...")
-        map_listings = analyzer.get_all_listings_for_map() # This method should return a list of dicts
-        app.logger.info(f"Map route: Found {len(map_listings)} listings with coordinates in DB.")
-        
-        # The format from get_all_listings_for_map should already be suitable for map_view.html
-        # It expects 'latitude', 'longitude', 'title', 'price', 'area_sqm', 'detail_url'
-        # We need to ensure 'currency' and 'rooms' are handled if map_view.html expects them.
-        # For now, let's assume the new DB fields cover the essentials.
+@app.route('/api/listings/nearby')
+def listings_nearby():
+    """Listings within ?radius_m= of ?lat=&lon=, nearest first, paginated."""
+    try:
+        lat, lon = float(request.args['lat']), float(request.args['lon'])
+        radius_m = float(request.args.get('radius_m', 1000))
+        args = _listing_query_args()
+        args['limit'] = request.args.get('limit', 100, type=int)
+        items = get_store().fetch_listings_nearby(lat, lon, radius_m, **args)
+    except (KeyError, ValueError) as e:
+        return jsonify({'status': 'error', 'message': f'Invalid query: {e}'}), 400
+    return _listing_page(items, min(max(args['limit'], 1), MAX_PAGE_SIZE), max(args['offset'], 0))
 
-        return render_template('map_view.html', listings_json=json.dumps(map_listings))
-    
-    except Exception as e:
-        app.logger.error(f"Error in /map route: {e}", exc_info=True)
-        return render_template('map_view.html', listings_json=json.dumps([]), error_message=str(e))
+@app.route('/api/listings/price-drops')
+def listing_price_drops():
+    """Listings whose price dropped within ?days= (default 7), newest first, paginated."""
+    try:
+        days = float(request.args.get('days', 7))
+        limit = request.args.get('limit', 500, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        items = get_store().fetch_price_drops(days, limit, offset)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'Invalid query: {e}'}), 400
+    return _listing_page(items, min(max(limit, 1), MAX_PAGE_SIZE), max(offset, 0))
+
+@app.route('/api/listings/history')
+def listing_price_history():
+    """Price/status history and latest state for ?id=<Otodom id or detail URL>."""
+    listing_id = request.args.get('id')
+    if not listing_id:
+        return jsonify({'status': 'error', 'message': 'Missing id'}), 400
+    store = get_store()
+    listing_id = store.history_id(listing_id)
+    latest = store.fetch_latest([listing_id])
+    return jsonify({
+        'latest': latest[0] if latest else None,
+        'history': store.fetch_price_history(listing_id),
+    })
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.json')
+def listing_tile(z, x, y):
+    """Pre-clustered listings for one map tile (GeoJSON, cached in Redis)."""
+    if not valid_tile(z, x, y):
+        return jsonify({'status': 'error', 'message': 'Invalid tile'}), 404
+    response = app.response_class(get_tile(get_store(), z, x, y), mimetype='application/geo+json')
+    response.headers['Cache-Control'] = 'public, max-age=60'
+    return response
 
 @app.route('/scrape_otodom')
 def trigger_otodom_scrape():
@@ -370,7 +434,7 @@ def trigger_otodom_scrape():
         return jsonify({'status': 'error', 'message': 'GEMINI_API_KEY not set. Cannot initialize RoomAnalyzer for scraping.'}), 500
 
     try:
-        analyzer = RoomAnalyzer(gemini_api_key=api_key)
+        analyzer = get_analyzer(api_key)
         app.logger.info("Scrape route: Starting Otodom scrape...")
         # scrape_otodom_page now expects an analyzer_instance
         # We can scrape a fixed number of pages or make it configurable later
@@ -0,0 +1,111 @@
+"""Benchmark JSON-LD / __NEXT_DATA__ extraction: BeautifulSoup vs. html_extract.
+
+Runs both paths over recorded Otodom pages (``*.html`` files, e.g. saved with
+the browser or dumped from the HTTP cache). For each path it reports pages/s
+and MB/s, and it fails when any page gives a different result.
+
+    python scripts/bench_html_extract.py data/pages/ --repeat 5
+"""
+from pathlib import Path
+import sys
+import argparse
+import json
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+from html_extract import loads, script_text, script_texts  # noqa: E402
+
+
+def _merge_jsonld(texts):
+    """Merge rule of otodom_scraper._parse_jsonld_scripts (shared by both paths)."""
+    data = {}
+    for txt, decode in texts:
+        try:
+            if not txt:
+                continue
+            j = decode(txt)
+            if isinstance(j, list):
+                for o in j:
+                    if isinstance(o, dict):
+                        data.update(o)
+            elif isinstance(j, dict):
+                data.update(j)
+        except Exception:
+            continue
+    return data
+
+
+def soup_extract(html: str):
+    """The previous path: one html.parser tree per page, then the stdlib decoder."""
+    soup = BeautifulSoup(html, "html.parser")
+    jsonld = _merge_jsonld(
+        (s.get_text(strip=True), json.loads)
+        for s in soup.find_all("script", {"type": "application/ld+json"})
+    )
+    tag = soup.find("script", {"id": "__NEXT_DATA__"})
+    try:
+        next_data = json.loads(tag.string) if tag else None
+    except (TypeError, ValueError):
+        next_data = None
+    return jsonld, next_data
+
+
+def fast_extract(html: str):
+    jsonld = _merge_jsonld((t.strip(), loads) for t in script_texts(html, type="application/ld+json"))
+    body = script_text(html, id="__NEXT_DATA__")
+    try:
+        next_data = loads(body) if body is not None else None
+    except ValueError:
+        next_data = None
+    return jsonld, next_data
+
+
+def _collect(paths):
+    files = []
+    for p in map(Path, paths):
+        files.extend(sorted(p.rglob("*.html")) if p.is_dir() else [p])
+    return files
+
+
+def _time(fn, pages, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for html in pages:
+            fn(html)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare HTML payload extraction speed and output")
+    parser.add_argument("paths", nargs="+", help="HTML files or directories (searched recursively)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes per path (best is reported)")
+    args = parser.parse_args()
+
+    files = _collect(args.paths)
+    if not files:
+        print("No HTML pages found in", ", ".join(args.paths))
+        return 1
+    pages = [f.read_text(encoding="utf-8", errors="replace") for f in files]
+    megabytes = sum(len(p.encode("utf-8")) for p in pages) / 1e6
+
+    mismatches = [f for f, html in zip(files, pages) if soup_extract(html) != fast_extract(html)]
+    for f in mismatches:
+        print("MISMATCH", f)
+
+    print(f"{len(pages)} pages, {megabytes:.1f} MB, best of {args.repeat}")
+    baseline = None
+    for name, fn in (("beautifulsoup", soup_extract), ("html_extract", fast_extract)):
+        elapsed = _time(fn, pages, args.repeat)
+        baseline = baseline or elapsed
+        print(f"{name:>14}: {len(pages) / elapsed:9.1f} pages/s  {megabytes / elapsed:8.1f} MB/s"
+              f"  x{baseline / elapsed:.1f}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
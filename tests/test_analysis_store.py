@@ -0,0 +1,240 @@
+import json
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+from analysis_store import ANALYSIS_RESULT_COLUMNS, STALE_ACTIVE_SQL, AnalysisStore, iter_payloads, utc_timestamp
+from migrations import CREATE_ANALYSIS_RESULTS, CREATE_PROPERTY_ANALYSES, migrate_analysis_db
+
+
+def test_wal_and_connection_reuse(tmp_path):
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    conn = store.connection()
+    assert conn is store.connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(store.connection()))
+    t.start()
+    t.join()
+    assert other[0] is not conn
+
+
+def test_upsert_and_map_listings(tmp_path):
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    store.upsert_listing_scrape("https://x/1", "A", "Street", 100.0, 50.0, 51.1, 17.0)
+    store.upsert_listing_scrape("https://x/1", "B", "Street", 90.0, 50.0, 51.1, 17.0)
+    store.upsert_listing_scrape("https://x/2", "C", None, None, None, None, None)
+
+    listings = store.fetch_map_listings()
+    assert [(l["id"], l["title"], l["price"]) for l in listings] == [("https://x/1", "B", 90.0)]
+
+    row = [None] * len(ANALYSIS_RESULT_COLUMNS)
+    row[0], row[1] = "a1", "https://x/1"
+    store.save_analysis(row)
+    assert store.connection().execute("SELECT COUNT(*) FROM analysis_results").fetchone()[0] == 1
+
+
+def test_bulk_upsert_single_transaction(tmp_path):
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    rows = [(f"https://x/{i}", f"T{i}", None, float(i), 40.0, 51.0, 17.0) for i in range(36)]
+    assert store.upsert_listing_scrapes(rows) == 36
+    assert store.connection().execute("SELECT COUNT(*) FROM property_geo").fetchone()[0] == 36
+    assert store.upsert_listing_scrapes([]) == 0
+    assert len(store.fetch_map_listings()) == 36
+
+
+def test_spatial_queries_follow_upserts(tmp_path):
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    store.upsert_listing_scrapes([(f"u{i}", None, None, None, None, 51.0 + i * 0.001, 17.0) for i in range(20)])
+
+    page = store.fetch_listings_in_bbox(51.0, 16.9, 51.0095, 17.1, limit=5, offset=5, fields=["id"])
+    assert [row["id"] for row in page] == ["u5", "u6", "u7", "u8", "u9"]
+
+    store.upsert_listing_scrape("u0", None, None, None, None, 60.0, 20.0)  # moved away
+    nearby = store.fetch_listings_nearby(51.0, 17.0, 250, fields=["id"])
+    assert [row["id"] for row in nearby] == ["u1", "u2"]
+    assert nearby[0]["distance_m"] < nearby[1]["distance_m"]
+
+
+def test_payloads_are_compressed_and_loaded_lazily(tmp_path):
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    row = [None] * len(ANALYSIS_RESULT_COLUMNS)
+    row[0] = "a1"
+    raw = json.dumps([{"room_type": "kitchen", "notes": "x" * 5000}])
+    store.save_analysis(row, {"raw_gemini_response": raw, "room_summary": None})
+
+    conn = store.connection()
+    assert conn.execute("SELECT raw_gemini_response FROM analysis_results").fetchone() == (None,)
+    stored_size = conn.execute("SELECT length(data) FROM analysis_payloads").fetchone()[0]
+    assert stored_size < len(raw) / 10
+    assert store.get_payload("a1", "raw_gemini_response") == raw
+    assert store.get_payload("a1", "room_summary") is None
+    assert list(iter_payloads(conn, "raw_gemini_response")) == [("a1", raw)]
+
+
+def test_rewrite_and_delete_keep_payloads_in_sync(tmp_path):
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    row = [None] * len(ANALYSIS_RESULT_COLUMNS)
+    row[0] = "a1"
+    store.save_analysis(row, {"raw_gemini_response": "[1]", "room_summary": "{}", "key_features_text": "[]"})
+    store.save_analysis(row, {"raw_gemini_response": "[2]", "room_summary": None})
+    assert store.get_payload("a1", "raw_gemini_response") == "[2]"
+    assert store.get_payload("a1", "room_summary") is None
+    assert store.get_payload("a1", "key_features_text") is None
+
+    store.put_payloads("a1", {"room_summary": "{}"})
+    store.put_payloads("a1", {"raw_gemini_response": None})
+    conn = store.connection()
+    assert conn.execute("SELECT kind FROM analysis_payloads").fetchall() == [("room_summary",)]
+
+    row[0] = "a2"
+    store.save_analysis(row, {"raw_gemini_response": "[3]"})
+    with store.transaction() as conn:
+        conn.execute("DELETE FROM analysis_results WHERE analysis_id = 'a1'")
+    assert conn.execute("SELECT analysis_id, kind FROM analysis_payloads").fetchall() == [("a2", "raw_gemini_response")]
+
+
+def test_migration_moves_inline_payloads(tmp_path, monkeypatch):
+    import migrations
+
+    monkeypatch.setattr(migrations, "PAYLOAD_BACKFILL_BATCH", 2)  # several batches
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(CREATE_PROPERTY_ANALYSES + ";" + CREATE_ANALYSIS_RESULTS)
+    conn.execute("INSERT INTO analysis_results (analysis_id, raw_gemini_response) VALUES ('old', '{\"a\": 1}')")
+    conn.executemany("INSERT INTO analysis_results (analysis_id, room_summary) VALUES (?, ?)",
+                     [(f"r{i}", f'{{"n": {i}}}') for i in range(5)] + [(None, '{"unkeyed": 1}')])
+    conn.commit()
+    conn.close()
+
+    migrate_analysis_db(path)
+    store = AnalysisStore(path)
+    assert store.get_payload("old", "raw_gemini_response") == '{"a": 1}'
+    assert [store.get_payload(f"r{i}", "room_summary") for i in range(5)] == [f'{{"n": {i}}}' for i in range(5)]
+    conn = store.connection()
+    assert conn.execute("SELECT raw_gemini_response FROM analysis_results").fetchone() == (None,)
+    assert conn.execute("SELECT room_summary FROM analysis_results WHERE room_summary IS NOT NULL").fetchall() == [
+        ('{"unkeyed": 1}',)]
+
+
+def test_price_history_appends_only_on_change(tmp_path):
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    now = datetime.now(timezone.utc)
+    t1, t2, t3 = (utc_timestamp(now - timedelta(days=d)) for d in (10, 3, 1))
+
+    store.record_observations([("a", 500.0, "active"), ("b", 300.0, "active")], t1)
+    store.record_observations([("a", 500.0, "active"), ("b", 320.0, "active")], t2)
+    store.record_observations([("a", 450.0, "active")], t3)
+
+    assert [h["price"] for h in store.fetch_price_history("a")] == [500.0, 450.0]
+    latest = {r["listing_id"]: r for r in store.fetch_latest(["a", "b"])}
+    assert latest["a"]["previous_price"] == 500.0
+    assert (latest["a"]["first_seen"], latest["a"]["last_seen"]) == (t1, t3)
+    assert [d["listing_id"] for d in store.fetch_price_drops(days=7)] == ["a"]
+
+    store.record_observations([("a", 450.0, "removed")], utc_timestamp(now))
+    latest = store.fetch_latest(["a"])[0]
+    assert (latest["status"], latest["previous_price"]) == ("removed", 500.0)
+
+
+def test_observations_without_price_and_removed_listings(tmp_path):
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    now = datetime.now(timezone.utc)
+    t1, t2 = (utc_timestamp(now - timedelta(days=d)) for d in (20, 10))
+
+    store.record_observations([("a", 500.0, "active"), ("b", 300.0, "active"), ("c", None, "active")], t1)
+    store.record_observations([("a", None, "active"), ("b", 300.0, "active")], t2)
+    assert [h["price"] for h in store.fetch_price_history("a")] == [500.0]  # no NULL-price row
+    assert store.fetch_price_history("c") == []
+
+    assert store.mark_removed(utc_timestamp(now - timedelta(days=14))) == 0
+    store.record_observations([("b", 300.0, "active")], utc_timestamp(now))
+    assert store.mark_removed(utc_timestamp(now - timedelta(days=5))) == 1
+    latest = {r["listing_id"]: r for r in store.fetch_latest(["a", "b"])}
+    assert (latest["a"]["status"], latest["a"]["price"], latest["a"]["last_seen"]) == ("removed", 500.0, t2)
+    assert latest["b"]["status"] == "active"
+
+
+def test_history_sink_records_scheduled_crawls(tmp_path):
+    pytest.importorskip("pandas")
+    from scrape_sinks import HistorySink
+
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    store.record_observations([("old", 100.0, "active")], utc_timestamp(datetime.now(timezone.utc) - timedelta(days=30)))
+
+    sink = HistorySink(store, removed_after_days=14)
+    sink.write([{"id": 1, "price": 450000}, {"id": 2, "price": None}, {"title": "no id"}])
+    sink.close()
+
+    assert [h["price"] for h in store.fetch_price_history("1")] == [450000.0]
+    assert sink.removed == 1 and store.fetch_latest(["old"])[0]["status"] == "removed"
+
+
+def test_sink_and_scrape_rows_share_one_history_key(tmp_path):
+    pytest.importorskip("pandas")
+    from scrape_sinks import HistorySink
+
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    url = "https://www.otodom.pl/pl/oferta/mieszkanie-ID4abcd"
+    old = utc_timestamp(datetime.now(timezone.utc) - timedelta(days=30))
+
+    HistorySink(store, removed_after_days=0).write([{"id": 123, "price": 500000}])
+    store.upsert_listing_scrapes([(url, "2 pokoje", None, 500000.0, 50.0, 51.1, 17.0, "123")])
+    conn = store.connection()
+    assert conn.execute("SELECT listing_id FROM listing_latest").fetchall() == [("123",)]
+    assert store.history_id(url) == "123"
+
+    # Backdate the sighting, re-see it unchanged, then run the removal sweep.
+    conn.execute("UPDATE listing_latest SET last_seen = ?", (old,))
+    conn.commit()
+    store.touch_listings(["123"])
+    assert store.mark_removed(utc_timestamp(datetime.now(timezone.utc) - timedelta(days=14))) == 0
+    assert store.fetch_latest(["123"])[0]["status"] == "active"
+
+
+def test_url_keyed_history_is_folded_into_otodom_id(tmp_path):
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    url = "https://www.otodom.pl/pl/oferta/mieszkanie-ID4abcd"
+    now = datetime.now(timezone.utc)
+    t1, t2 = (utc_timestamp(now - timedelta(days=d)) for d in (40, 30))
+    store.record_observations([(url, 520000.0, "active")], t1)  # written before migration 9
+    store.record_observations([("123", 510000.0, "active")], t2)
+    stale = store.connection().execute(STALE_ACTIVE_SQL, (utc_timestamp(now),)).fetchall()
+    assert [row[0] for row in stale] == ["123"]  # URL-keyed rows are never marked removed
+
+    store.upsert_listing_scrapes([(url, None, None, 500000.0, None, None, None, 123)])
+    assert store.connection().execute("SELECT DISTINCT listing_id FROM listing_price_history").fetchall() == [("123",)]
+    assert [h["price"] for h in store.fetch_price_history("123")][0] == 520000.0
+    latest = store.fetch_latest(["123"])[0]
+    assert (latest["first_seen"], latest["price"], latest["status"]) == (t1, 500000.0, "active")
+    assert store.fetch_latest([url]) == []
+
+
+def test_touch_listings_bumps_last_seen_only(tmp_path):
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    store.record_observations([("a", 500.0, "active")], "2026-01-01 00:00:00")
+
+    assert store.touch_listings(["a", "unknown"], "2026-02-01 00:00:00") == 1
+    assert store.touch_listings(["a"], "2026-01-15 00:00:00") == 1  # never moves backwards
+    latest = store.fetch_latest(["a"])[0]
+    assert (latest["last_seen"], latest["changed_at"]) == ("2026-02-01 00:00:00", "2026-01-01 00:00:00")
+    assert len(store.fetch_price_history("a")) == 1
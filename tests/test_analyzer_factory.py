@@ -0,0 +1,99 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+for _module in ("requests", "PIL", "bs4", "redis"):
+    pytest.importorskip(_module)
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import analyzer_factory
+from migrations import migrate_analysis_db
+
+
+class _SlowAnalyzer:
+    built = []
+
+    def __init__(self, gemini_api_key, **options):
+        time.sleep(0.05)  # widen the window in which racing callers could each build one
+        self.options = options
+        self.closed = False
+        _SlowAnalyzer.built.append(self)
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_analyzer(monkeypatch):
+    _SlowAnalyzer.built = []
+    monkeypatch.setattr(analyzer_factory, "RoomAnalyzer", _SlowAnalyzer)
+    monkeypatch.setattr(analyzer_factory, "_instances", {})
+    return _SlowAnalyzer
+
+
+def test_concurrent_callers_share_one_instance(fake_analyzer):
+    barrier = threading.Barrier(8)
+    results = []
+
+    def call():
+        barrier.wait()
+        results.append(analyzer_factory.get_analyzer("key", batch_mode=True, summary_mode="template"))
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(fake_analyzer.built) == 1
+    assert all(r is results[0] for r in results)
+    # Keyword order is not part of the key.
+    assert analyzer_factory.get_analyzer("key", summary_mode="template", batch_mode=True) is results[0]
+
+
+def test_options_and_keys_get_their_own_instance(fake_analyzer, monkeypatch):
+    default = analyzer_factory.get_analyzer("key")
+    assert analyzer_factory.get_analyzer("key", batch_mode=False) is not default
+    assert analyzer_factory.get_analyzer("other-key") is not default
+    monkeypatch.setenv("GEMINI_API_KEY", "key")
+    assert analyzer_factory.get_analyzer() is default
+    monkeypatch.delenv("GEMINI_API_KEY")
+    with pytest.raises(RuntimeError):
+        analyzer_factory.get_analyzer()
+
+    analyzer_factory.reset_analyzers()
+    assert all(a.closed for a in fake_analyzer.built)
+    assert analyzer_factory.get_analyzer("key") is not default
+
+
+def test_close_releases_session_and_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(analyzer_factory, "_instances", {})
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    analyzer = analyzer_factory.get_analyzer("AIza" + "x" * 35, db_path=str(tmp_path / "analysis.db"))
+    analyzer.store.connection()
+    closed = []
+    monkeypatch.setattr(analyzer.http, "close", lambda: closed.append("http"))
+
+    analyzer_factory.reset_analyzers()
+    assert closed == ["http"]
+    assert analyzer.store._local.conn is None
+    assert analyzer_factory._instances == {}
+
+
+def test_package_and_bare_imports_share_the_cache(fake_analyzer):
+    # Routes import "analyzer_factory", Celery loads "back_end.tasks"; both must
+    # reach the same module so the analyzer cache is not built twice.
+    import analysis_store
+    import back_end.analysis_store
+    import back_end.analyzer_factory
+
+    assert back_end.analyzer_factory is analyzer_factory
+    assert back_end.analyzer_factory.get_analyzer is analyzer_factory.get_analyzer
+    assert back_end.analysis_store.get_store is analysis_store.get_store
+    first = back_end.analyzer_factory.get_analyzer("key")
+    assert analyzer_factory.get_analyzer("key") is first
+    assert len(fake_analyzer.built) == 1
@@ -0,0 +1,29 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+from analyzer_logging import CappedJson, CappedText, PayloadSize
+
+
+def test_capped_json_hides_image_data_and_truncates():
+    payload = {"contents": [{"parts": [
+        {"text": "x" * 5000},
+        {"inline_data": {"mime_type": "image/jpeg", "data": "A" * 100_000}},
+    ]}]}
+    rendered = str(CappedJson(payload, cap=300))
+    assert "AAAA" not in rendered
+    assert len(rendered) < 400
+    assert "image/jpeg 100000 b64 chars" in str(CappedJson(payload["contents"][0]["parts"][1], cap=300))
+
+
+def test_lazy_wrappers_do_no_work_until_formatted():
+    class Boom:
+        def __str__(self):
+            raise AssertionError("formatted eagerly")
+
+    CappedText(Boom())
+    CappedJson(Boom())
+    assert str(PayloadSize({"data": "A" * 4096})) == "4"
+    assert json.loads(str(CappedJson({"a": 1}))) == {"a": 1}
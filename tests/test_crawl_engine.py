@@ -0,0 +1,130 @@
+import asyncio
+import sys
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+from crawl_engine import CrawlConfig, CrawlEngine, HostLimiter, iter_crawl_chunks
+from seen_index import SeenIndex
+
+
+def _fake_scraper(pages, events):
+    lock = threading.Lock()
+
+    def log(event):
+        with lock:
+            events.append(event)
+
+    def fetch(url):
+        page = int(url.rsplit("=", 1)[1])
+        log(("fetch", page))
+        return {"page": page} if page <= pages else None
+
+    def enrich(listing):
+        time.sleep(0.05)
+        log(("enriched", listing["page"]))
+        return listing
+
+    return SimpleNamespace(
+        DEFAULT_MAX_PAGES=10,
+        BASE_OTODOM_SEARCH_URL_WROCLAW="https://www.otodom.pl/search?page={page}",
+        ENABLE_DETAIL_FETCH=True,
+        SCRAPE_DB_FLUSH_EVERY=50,
+        fetch_search_next_data=fetch,
+        _search_items=lambda data: [{"id": f"{data['page']}-{i}", "page": data["page"]} for i in range(3)],
+        _listing_from_search_item=lambda item: (dict(item), None, None),
+        _validate_listing=lambda listing: listing,
+        _enrich_listing_details=enrich,
+        _finalize_listings=lambda listings: listings,
+        _record_listing_states=lambda counts: None,
+        _touch_listings=lambda ids: log(("touched", tuple(ids))),
+    )
+
+
+def test_pages_are_fetched_while_previous_page_enriches():
+    events = []
+    config = CrawlConfig(enrich_workers=1, host_interval={"www.otodom.pl": 0})
+    engine = CrawlEngine(_fake_scraper(3, events), max_pages=5, config=config)
+    listings = asyncio.run(engine.run())
+
+    assert sorted(l["id"] for l in listings) == sorted(f"{p}-{i}" for p in (1, 2, 3) for i in range(3))
+    # Page 2 was requested before the last listing of page 1 finished enriching.
+    assert events.index(("fetch", 2)) < max(i for i, e in enumerate(events) if e == ("enriched", 1))
+    assert ("fetch", 5) not in events  # pagination stops at the first empty page
+
+
+def test_host_limiter_caps_concurrency_and_spaces_starts():
+    limiter = HostLimiter({"a.example": 2}, {"b.example": 0.05})
+    active, peak, starts = [0], [0], []
+
+    async def hit(host):
+        async with limiter.slot(f"https://{host}/x"):
+            starts.append((host, asyncio.get_running_loop().time()))
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            await asyncio.sleep(0.01)
+            active[0] -= 1
+
+    async def main():
+        await asyncio.gather(*(hit("a.example") for _ in range(6)))
+        peak_a = peak[0]
+        await asyncio.gather(*(hit("b.example") for _ in range(3)))
+        return peak_a
+
+    assert asyncio.run(main()) == 2
+    b_starts = [t for host, t in starts if host == "b.example"]
+    assert all(later - earlier >= 0.045 for earlier, later in zip(b_starts, b_starts[1:]))
+
+
+def test_chunks_stream_before_crawl_finishes_and_stop_on_close():
+    events = []
+    config = CrawlConfig(enrich_workers=1, host_interval={"www.otodom.pl": 0})
+    stream = iter_crawl_chunks(max_pages=5, config=config, scraper=_fake_scraper(4, events), chunk_size=2)
+
+    first = next(stream)
+    assert len(first) == 2
+    assert ("enriched", 4) not in events  # yielded long before the last page was done
+    stream.close()
+    assert sum(1 for e in events if e[0] == "enriched") < 12  # the crawl stopped early
+
+
+def test_incremental_crawl_skips_unchanged_and_stops_at_known():
+    seen = SeenIndex(client=SimpleNamespace())  # no sorted sets -> in-process index
+    config = CrawlConfig(enrich_workers=1, host_interval={"www.otodom.pl": 0}, stop_after_known=3, page_queue_size=1)
+
+    first = asyncio.run(CrawlEngine(_fake_scraper(4, []), max_pages=4, config=config, seen_index=seen).run())
+    assert len(first) == 12
+    assert seen.lookup(["1-0"]) == {}  # nothing is marked before the listings are stored
+    assert first.commit() == 12
+
+    events = []
+    scraper = _fake_scraper(4, events)
+    search_items = scraper._search_items
+    scraper._search_items = lambda data: [
+        {**item, "price": 1} if item["id"] == "1-0" else item for item in search_items(data)
+    ]
+    # Page 1 is changed, unchanged, unchanged: the changed listing resets the
+    # streak, so the two unchanged ones after it must be enough to stop.
+    config.stop_after_known = 2
+    engine = CrawlEngine(scraper, max_pages=4, config=config, seen_index=seen)
+    second = asyncio.run(engine.run())
+
+    assert [l["id"] for l in second] == ["1-0"]  # only the changed listing is re-enriched
+    assert engine.stats["changed"] == 1 and engine.stats["new"] == 0
+    assert ("fetch", 4) not in events  # stopped paging after the known run
+    assert ("touched", ("1-1", "1-2")) in events  # unchanged listings still bump last_seen
+
+
+def test_changed_listings_reset_the_known_streak():
+    engine = CrawlEngine(_fake_scraper(1, []), config=CrawlConfig(stop_after_known=3),
+                         seen_index=SeenIndex(client=SimpleNamespace()))
+    engine._count_states([(None, None, "unchanged"), (None, None, "unchanged")])
+    assert engine._known_streak == 2
+    engine._count_states([(None, None, "changed"), (None, None, "unchanged")])
+    assert engine._known_streak == 1
+    engine._count_states([(None, None, "new")])
+    assert engine._known_streak == 0
+    assert engine.stats == {"new": 1, "changed": 1, "unchanged": 3}
@@ -0,0 +1,66 @@
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+
+import db
+
+
+def _listings(prefix):
+    return [
+        {"id": f"{prefix}1", "title": "2 pokoje", "price": 500000.0, "area_sqm": 50.0,
+         "images": ["a.jpg"], "floor": "3"},
+        {"id": f"{prefix}2", "title": "3 pokoje", "price": 700000.0, "area_sqm": 70.0, "images": []},
+    ]
+
+
+def _assert_upsert_counts(prefix):
+    listings = _listings(prefix)
+    assert db.upsert_listings(listings) == {"inserted": 2, "updated": 0, "unchanged": 0}
+    assert db.upsert_listings(listings) == {"inserted": 0, "updated": 0, "unchanged": 2}
+
+    listings[1]["price"] = 690000.0
+    assert db.upsert_listings(listings) == {"inserted": 0, "updated": 1, "unchanged": 1}
+    with db.engine.connect() as conn:
+        price = conn.execute(
+            sqlalchemy.text("SELECT price FROM listings WHERE id = :id"), {"id": f"{prefix}2"}
+        ).scalar_one()
+    assert price == 690000.0
+    assert db.upsert_listings([]) == {"inserted": 0, "updated": 0, "unchanged": 0}
+
+
+@pytest.fixture
+def use_engine(monkeypatch):
+    def use(engine):
+        monkeypatch.setattr(db, "engine", engine)
+        monkeypatch.setattr(db, "_engine_available", True)
+        monkeypatch.setattr(db, "_schema_ready", False)
+    return use
+
+
+def test_upsert_counts_sqlite_fallback(tmp_path, use_engine):
+    use_engine(sqlalchemy.create_engine(f"sqlite:///{tmp_path / 'listings.db'}"))
+    _assert_upsert_counts("t")
+
+
+@pytest.mark.skipif(not os.getenv("DATABASE_URL", "").startswith("postgresql"),
+                    reason="DATABASE_URL does not point at Postgres")
+def test_upsert_counts_postgres_copy_merge(use_engine):
+    try:
+        engine = sqlalchemy.create_engine(os.environ["DATABASE_URL"])
+        engine.connect().close()
+    except (ImportError, sqlalchemy.exc.OperationalError) as e:
+        pytest.skip(f"Postgres unavailable: {e}")
+    use_engine(engine)
+    prefix = f"test-{uuid.uuid4().hex[:8]}-"
+    try:
+        _assert_upsert_counts(prefix)
+    finally:
+        with engine.begin() as conn:
+            conn.execute(sqlalchemy.text("DELETE FROM listings WHERE id LIKE :p"), {"p": prefix + "%"})
@@ -0,0 +1,70 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+from analysis_store import AnalysisStore
+from geocoding import BatchGeocoder, Gazetteer, NominatimGeocoder, address_key, address_query
+from migrations import ANALYSIS_MIGRATIONS, migrate
+
+
+class FakeNominatim:
+    def __init__(self, known):
+        self.known = known
+        self.queries = []
+
+    def geocode(self, query, **kwargs):
+        self.queries.append(query)
+        coords = self.known.get(query)
+        return SimpleNamespace(latitude=coords[0], longitude=coords[1]) if coords else None
+
+
+def _stage(known):
+    store = AnalysisStore(":memory:")
+    migrate(store.connection(), ANALYSIS_MIGRATIONS)
+    cache = {}
+    client = FakeNominatim(known)
+    stage = BatchGeocoder(
+        geocoder=NominatimGeocoder(min_interval=0, client=client),
+        gazetteer=Gazetteer(store),
+        cache_get=cache.get,
+        cache_set=lambda key, value, ttl: cache.__setitem__(key, value),
+    )
+    return stage, client, store
+
+
+def test_page_is_deduplicated_and_source_coordinates_are_kept():
+    stage, client, store = _stage({"Legnicka 5, Wrocław": (51.12, 16.99)})
+    sourced = {"latitude": 51.1, "longitude": 17.03}
+    page = [({}, "ul. Legnicka 5", "Wrocław"), ({}, "Legnicka  5", "Wrocław"), ({}, "al. Legnicka 5", "Wrocław"),
+            (sourced, "Rynek", "Wrocław")]
+
+    stats = stage.geocode_listings(page)
+
+    assert client.queries == ["Legnicka 5, Wrocław"]
+    assert all((l["latitude"], l["longitude"]) == (51.12, 16.99) for l, _, _ in page[:3])
+    assert (sourced["latitude"], sourced["longitude"]) == (51.1, 17.03)
+    assert stats["source"] == 1 and stats["nominatim"] == 1
+    assert set(store.lookup_gazetteer([address_key("Rynek, Wrocław"), address_key("Legnicka 5, Wrocław")])) == {
+        "rynek, wrocław", "legnicka 5, wrocław"}
+
+
+def test_misses_are_negative_cached_and_fall_back_to_the_city():
+    stage, client, _ = _stage({"Wrocław": (51.11, 17.03)})
+    listing = {}
+    stage.geocode_listings([(listing, "Nieznana 1", "Wrocław")])
+    assert client.queries == ["Nieznana 1, Wrocław", "Wrocław"]
+    assert (listing["latitude"], listing["longitude"]) == (51.11, 17.03)
+
+    again = {}
+    stats = stage.geocode_listings([(again, "Nieznana 1", "Wrocław")])
+    assert len(client.queries) == 2  # the miss is cached, the city comes from the gazetteer
+    assert stats["negative"] == 1 and stats["gazetteer"] == 1 and stats["city_fallback"] == 1
+    assert (again["latitude"], again["longitude"]) == (51.11, 17.03)
+
+
+def test_address_normalization():
+    assert address_query("ul. Jana/Pawła  II", " Wrocław") == "Jana Pawła II, Wrocław"
+    assert address_query("ul. ", "Wrocław") == "Wrocław"
+    assert address_key("Jana Pawła II,  WROCŁAW") == "jana pawła ii, wrocław"
@@ -0,0 +1,66 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+from html_extract import iter_scripts, loads, script_text, script_texts
+
+PAGE = (
+    "<html><head>"
+    '<!-- <script type="application/ld+json">{"commented": true}</script> -->'
+    "<script>if (a < b && c > d) { x = '</div>'; }</script>"
+    '<SCRIPT Type="application/ld+json" data-note="a &amp; b > c">\n  {"geo": {"latitude": 51.1}}\n</SCRIPT>'
+    '<script type="application/ld+json"/>'
+    "<script type='application/ld+json'>[{\"floorLevel\": 3}, 7]</script>"
+    "</head><body><div>&amp;</div>"
+    '<script id="__NEXT_DATA__" type="application/json">{"props": {"pageProps": {"ad": {"id": 1}}}}</script>'
+    "</body></html>"
+)
+
+
+def test_scanner_matches_html_parser_rules():
+    scripts = list(iter_scripts(PAGE))
+    assert len(scripts) == 5  # the commented-out element is not one
+    attrs, body = scripts[1]
+    assert attrs == {"type": "application/ld+json", "data-note": "a & b > c"}
+    assert body.strip() == '{"geo": {"latitude": 51.1}}'
+    assert scripts[2] == ({"type": "application/ld+json"}, "")  # <script .../> is empty
+    assert [t.strip() for t in script_texts(PAGE, type="application/ld+json")] == [
+        '{"geo": {"latitude": 51.1}}', "", '[{"floorLevel": 3}, 7]']
+    assert loads(script_text(PAGE, id="__NEXT_DATA__"))["props"]["pageProps"]["ad"] == {"id": 1}
+    assert script_text(PAGE, id="missing") is None
+
+
+def test_loads_matches_stdlib():
+    for text in ('{"a": [1, 2.5, "ż", null]}', '{"big": 1180591620717411303424}', "[NaN]"):
+        assert json.dumps(loads(text)) == json.dumps(json.loads(text))
+    with pytest.raises(json.JSONDecodeError):
+        loads("{bad json")
+
+
+def test_same_script_bodies_as_beautifulsoup():
+    bs4 = pytest.importorskip("bs4")
+    soup = bs4.BeautifulSoup(PAGE, "html.parser")
+    expected = [s.get_text(strip=True) for s in soup.find_all("script", {"type": "application/ld+json"})]
+    assert [t.strip() for t in script_texts(PAGE, type="application/ld+json")] == expected
+    assert script_text(PAGE, id="__NEXT_DATA__") == soup.find("script", {"id": "__NEXT_DATA__"}).string
+
+
+@pytest.mark.parametrize("content_type, body", [
+    ("text/html", '<meta charset="utf-8"><script id="__NEXT_DATA__">{"t": "Mieszkanie, Śródmieście"}</script>'.encode("utf-8")),
+    ("text/html", '<meta charset="windows-1250"><script id="__NEXT_DATA__">{"t": "Mieszkanie, Śródmieście"}</script>'.encode("cp1250")),
+    ("text/html; charset=utf-8", '<script id="__NEXT_DATA__">{"t": "Mieszkanie, Śródmieście"}</script>'.encode("utf-8")),
+])
+def test_listing_page_is_decoded_like_beautifulsoup(content_type, body):
+    requests = pytest.importorskip("requests")
+    pytest.importorskip("bs4")
+    from scraper_otodom import _decode_html
+
+    response = requests.Response()
+    response._content = body
+    response.headers["Content-Type"] = content_type
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)  # ISO-8859-1 without charset
+    assert loads(script_text(_decode_html(response), id="__NEXT_DATA__")) == {"t": "Mieszkanie, Śródmieście"}
@@ -0,0 +1,94 @@
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+pytest.importorskip("redis")
+pytest.importorskip("requests")
+pytest.importorskip("prometheus_client")
+pytest.importorskip("hvac")
+
+import cache
+from fetch_pro_helpers import ProFetcher
+
+
+class _Origin(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            return
+        body = b"<html>listing</html>"
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Last-Modified", "Wed, 21 Oct 2026 07:28:00 GMT")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _in_memory_redis(monkeypatch):
+    dummy = cache._DummyCache()
+    monkeypatch.setattr(cache, "_redis_client", dummy)
+    monkeypatch.setattr(cache, "_redis_binary_client", dummy)
+    return dummy
+
+
+@pytest.fixture
+def origin(monkeypatch):
+    _in_memory_redis(monkeypatch)
+    _Origin.requests_seen = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Origin)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/offer"
+    server.shutdown()
+
+
+def test_stale_entry_is_revalidated_and_renewed_on_304(origin):
+    fetcher = ProFetcher(rate_limit=0, proxies=[])
+
+    assert fetcher.get_text_cached(origin, ttl=60) == "<html>listing</html>"
+    assert fetcher.get_text_cached(origin, ttl=60) == "<html>listing</html>"
+    assert len(_Origin.requests_seen) == 1  # fresh hit, no request
+    assert "gzip" in _Origin.requests_seen[0]["Accept-Encoding"]
+
+    entry = cache.http_get_entry(origin)
+    cache.http_put_entry(origin, entry["body"], -1, entry["etag"], entry["last_modified"])  # expire it
+    assert cache.http_get_cached(origin) is None
+
+    assert fetcher.get_text_cached(origin, ttl=60) == "<html>listing</html>"
+    revalidation = _Origin.requests_seen[-1]
+    assert revalidation["If-None-Match"] == '"v1"'
+    assert revalidation["If-Modified-Since"] == "Wed, 21 Oct 2026 07:28:00 GMT"
+    assert cache.http_get_cached(origin) == "<html>listing</html>"  # renewed by the 304
+
+
+def test_extracted_fragment_is_cached_compressed(origin):
+    fetcher = ProFetcher(rate_limit=0, proxies=[])
+
+    def _title_only(html):
+        return html[len("<html>"):-len("</html>")]
+
+    assert fetcher.get_text_cached(origin, ttl=60, extract=_title_only) == "listing"
+    assert fetcher.get_text_cached(origin, ttl=60, extract=_title_only) == "listing"
+    assert len(_Origin.requests_seen) == 1
+    stored = cache.get_redis_binary().get(cache._http_key(origin, "title_only"))
+    assert stored[:1] in (cache._ZLIB_TAG, cache._ZSTD_TAG)
+    assert cache.http_get_entry(origin) is None  # the full document is not cached
+
+
+def test_legacy_raw_entries_still_read(monkeypatch):
+    _in_memory_redis(monkeypatch)
+    cache.set_cached("http", "https://example.com/a", "<html>old</html>", 60)
+    assert cache.http_get_cached("https://example.com/a") == "<html>old</html>"
@@ -0,0 +1,78 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+pytest.importorskip("redis")
+
+import map_tiles
+from analysis_store import AnalysisStore
+from migrations import migrate_analysis_db
+
+
+def test_tile_math_roundtrip():
+    x, y = map_tiles.tile_for(51.1079, 17.0385, 13)
+    south, west, north, east = map_tiles.tile_bounds(13, x, y)
+    assert south <= 51.1079 < north and west <= 17.0385 < east
+
+
+def test_cluster_tile_and_incremental_invalidation(tmp_path, monkeypatch):
+    cache = {}
+    monkeypatch.setattr(map_tiles, "get_cached", lambda ns, raw: cache.get((ns, raw)))
+    monkeypatch.setattr(map_tiles, "set_cached", lambda ns, raw, value, ttl=0: cache.__setitem__((ns, raw), value))
+    monkeypatch.setattr(map_tiles, "delete_cached", lambda ns, *raws: sum(cache.pop((ns, r), None) is not None for r in raws))
+
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    store.upsert_listing_scrapes([
+        ("a", None, None, 500000.0, 50.0, 51.1000, 17.0300),
+        ("b", None, None, 700000.0, 50.0, 51.1001, 17.0301),
+    ])
+    z = 10
+    x, y = map_tiles.tile_for(51.1, 17.03, z)
+    tile = json.loads(map_tiles.get_tile(store, z, x, y))
+    assert len(tile["features"]) == 1
+    assert tile["features"][0]["properties"] == {"count": 2, "median_price_per_m2": 12000}
+
+    other = map_tiles.tile_for(40.0, -3.7, z)
+    map_tiles.get_tile(store, z, *other)
+    map_tiles.invalidate_points([(51.1002, 17.0302)])
+    assert ("tile", f"{z}/{x}/{y}") not in cache
+    assert ("tile", f"{z}/{other[0]}/{other[1]}") in cache
+
+
+def test_get_tile_renders_uncached_when_redis_is_down(tmp_path, monkeypatch):
+    from redis.exceptions import ConnectionError as RedisConnectionError
+
+    def down(*args, **kwargs):
+        raise RedisConnectionError("redis down")
+
+    monkeypatch.setattr(map_tiles, "get_cached", down)
+    monkeypatch.setattr(map_tiles, "set_cached", down)
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    store = AnalysisStore(str(tmp_path / "analysis.db"))
+    store.upsert_listing_scrapes([("a", None, None, 500000.0, 50.0, 51.1000, 17.0300)])
+    x, y = map_tiles.tile_for(51.1, 17.03, 10)
+    assert json.loads(map_tiles.get_tile(store, 10, x, y))["features"][0]["properties"]["count"] == 1
+
+
+def test_moved_listing_invalidates_its_old_tile(tmp_path, monkeypatch):
+    for module in ("requests", "PIL", "bs4"):
+        pytest.importorskip(module)
+    sys.path.append(str(Path(__file__).resolve().parents[1]))
+    import analyze_the_rooms
+
+    invalidated = []
+    monkeypatch.setattr(analyze_the_rooms, "invalidate_points", lambda points: invalidated.extend(points))
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    analyzer = analyze_the_rooms.RoomAnalyzer("AIza" + "x" * 35, db_path=str(tmp_path / "analysis.db"))
+
+    analyzer.save_listing_scrape_data("a", None, None, 500000, 50, 51.10, 17.03)
+    invalidated.clear()
+    analyzer.save_listings_scrape_data_bulk([
+        {"listing_id": "a", "price": 500000, "area": 50, "latitude": 51.12, "longitude": 17.05},
+    ])
+    assert sorted(invalidated) == [(51.10, 17.03), (51.12, 17.05)]
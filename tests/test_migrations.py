@@ -0,0 +1,45 @@
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+from migrations import ANALYSIS_MIGRATIONS, migrate
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def test_fresh_db_reaches_latest_version_once():
+    conn = sqlite3.connect(":memory:")
+    latest = ANALYSIS_MIGRATIONS[-1][0]
+    assert migrate(conn, ANALYSIS_MIGRATIONS) == latest
+    assert "total_unique_rooms" in _columns(conn, "analysis_results")
+    assert migrate(conn, ANALYSIS_MIGRATIONS) == latest
+    assert conn.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == len(ANALYSIS_MIGRATIONS)
+
+
+def test_legacy_db_is_patched_in_place():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE analysis_results (id INTEGER PRIMARY KEY, listing_id TEXT, analysis_id TEXT UNIQUE)")
+    conn.execute("INSERT INTO analysis_results (listing_id, analysis_id) VALUES ('u', 'a')")
+    conn.commit()
+    migrate(conn, ANALYSIS_MIGRATIONS)
+    assert {"numeric_visual_features_json", "duplicate_ratio"} <= _columns(conn, "analysis_results")
+    assert conn.execute("SELECT analysis_id FROM analysis_results").fetchall() == [("a",)]
+
+
+def test_failed_step_rolls_back_and_is_retried():
+    def boom(conn):
+        conn.execute("CREATE TABLE half_done (x INTEGER)")
+        raise RuntimeError("boom")
+
+    conn = sqlite3.connect(":memory:")
+    steps = ANALYSIS_MIGRATIONS + [(99, "broken", boom)]
+    try:
+        migrate(conn, steps)
+    except RuntimeError:
+        pass
+    assert not _columns(conn, "half_done")
+    assert conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] == ANALYSIS_MIGRATIONS[-1][0]
@@ -0,0 +1,79 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+for _module in ("requests", "PIL", "bs4", "redis"):
+    pytest.importorskip(_module)
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+
+import analyze_the_rooms
+from migrations import migrate_analysis_db
+
+RESULTS = [
+    {"room_type": "kitchen", "condition": "Good", "style": "Modern", "lighting": "Good",
+     "features": ["Balcony access", "Radiator"],
+     "visible_issues": [{"issue": "Worn floor", "severity": "Minor"}]},
+    {"room_type": "bedroom", "condition": "Fair", "style": "Classic", "lighting": "Dim",
+     "features": ["Radiator", "Built-in wardrobe"],
+     "visible_issues": [{"severity": "Major", "issue": "Damp wall"}, {"issue": "Cracked tile", "severity": "Minor"}]},
+    {"room_type": "bedroom", "features": ["Parquet"]},
+]
+
+
+@pytest.fixture
+def analyzer(tmp_path, monkeypatch):
+    cache = {}
+    monkeypatch.setattr(analyze_the_rooms, "get_cached", lambda ns, raw: cache.get((ns, raw)))
+    monkeypatch.setattr(analyze_the_rooms, "set_cached",
+                        lambda ns, raw, value, ttl=None: cache.__setitem__((ns, raw), value))
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    analyzer = analyze_the_rooms.RoomAnalyzer("AIza" + "x" * 35, db_path=str(tmp_path / "analysis.db"))
+    analyzer.gemini_calls = []
+
+    def fake_request(payload, retry_count=0, max_retries=3):
+        analyzer.gemini_calls.append(payload)
+        return {"candidates": [{"content": {"parts": [{"text": "- Bright kitchen\n- Damp wall"}]}}]}
+
+    analyzer._make_gemini_request = fake_request
+    analyzer.cache = cache
+    analyzer.fingerprinted = []
+    fingerprint = analyze_the_rooms.RoomAnalyzer._summary_fingerprint
+    monkeypatch.setattr(analyze_the_rooms.RoomAnalyzer, "_summary_fingerprint", staticmethod(
+        lambda data: analyzer.fingerprinted.append(data) or fingerprint(data)))
+    return analyzer
+
+
+def test_fingerprint_ignores_image_and_key_order(analyzer):
+    reordered = [
+        {**RESULTS[2]},
+        {k: RESULTS[1][k] for k in reversed(list(RESULTS[1]))} | {"visible_issues": RESULTS[1]["visible_issues"][::-1]},
+        {**RESULTS[0], "features": RESULTS[0]["features"][::-1]},
+    ]
+    analyzer._generate_property_summary(RESULTS)
+    analyzer._generate_property_summary(reordered)
+    first, second = analyzer.fingerprinted
+    assert first == second
+    assert len(analyzer.gemini_calls) == 1
+    fingerprint = analyze_the_rooms.RoomAnalyzer._summary_fingerprint
+    assert fingerprint(first) == fingerprint(dict(reversed(list(second.items()))))
+    assert fingerprint(first) != fingerprint({**first, "overall_condition": "Poor"})
+
+
+def test_second_identical_summary_is_a_cache_hit(analyzer):
+    first = analyzer._generate_property_summary(RESULTS)
+    second = analyzer._generate_property_summary(list(reversed(RESULTS)))
+    assert len(analyzer.gemini_calls) == 1
+    assert first["property_summary_text"] == second["property_summary_text"] == "- Bright kitchen\n- Damp wall"
+    assert len(analyzer.cache) == 1
+
+
+def test_template_mode_makes_no_api_call(analyzer):
+    analyzer.summary_mode = "template"
+    text = analyzer._generate_property_summary(RESULTS)["property_summary_text"]
+    assert analyzer.gemini_calls == [] and analyzer.cache == {}
+    lines = text.splitlines()
+    assert lines and all(line.startswith("- ") for line in lines)
+    assert "- Note: Damp wall (Major)" in lines
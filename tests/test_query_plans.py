@@ -0,0 +1,115 @@
+"""EXPLAIN QUERY PLAN guards: every hot query must use an index, never a full table scan."""
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+import analysis_store as store
+from migrations import ANALYSIS_MIGRATIONS, LISTINGS_MIGRATIONS, migrate
+
+_MAP_COLUMNS = ", ".join(store.LISTING_FIELDS[f] for f in store.MAP_FIELDS)
+
+ANALYSIS_HOT_QUERIES = {
+    "status by analysis_id": "SELECT * FROM analysis_results WHERE analysis_id = ?",
+    "results by listing": "SELECT * FROM analysis_results WHERE listing_id = ?",
+    "incremental ETL": "SELECT analysis_id FROM analysis_results WHERE created_at > ? ORDER BY created_at",
+    "payload": store.GET_PAYLOAD_SQL,
+    "bbox": store.BBOX_SQL.format(columns=_MAP_COLUMNS),
+    "nearby": store.NEARBY_SQL.format(columns=_MAP_COLUMNS),
+    "tile points": store.TILE_POINTS_SQL,
+    "record observation": store.RECORD_OBSERVATION_SQL,
+    "touch latest": store.TOUCH_LATEST_SQL,
+    "price drops": store.PRICE_DROPS_SQL,
+    "price history": store.PRICE_HISTORY_SQL,
+    "gazetteer lookup": "SELECT address_key, latitude, longitude FROM geo_gazetteer WHERE address_key IN (?, ?)",
+    "gazetteer learn": store.LEARN_GAZETTEER_SQL,
+}
+
+LISTINGS_HOT_QUERIES = {
+    "listing by listing_id": "SELECT * FROM listings WHERE listing_id = ?",
+    "listings by coordinates": "SELECT * FROM listings WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?",
+}
+
+
+def _full_scans(conn, sql):
+    numbered = [int(n) for n in re.findall(r"\?(\d+)", sql)]
+    params = [0] * (max(numbered) if numbered else sql.count("?"))
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    # R*Tree lookups report as SCAN ... VIRTUAL TABLE; those are index probes.
+    return [
+        step for step in plan
+        if step.startswith("SCAN ") and "VIRTUAL TABLE" not in step and step != "SCAN CONSTANT ROW"
+    ]
+
+
+@pytest.fixture(scope="module")
+def analysis_conn():
+    conn = sqlite3.connect(":memory:")
+    conn.create_function("haversine_m", 4, store.haversine_m)
+    migrate(conn, ANALYSIS_MIGRATIONS)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture(scope="module")
+def listings_conn():
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        "CREATE TABLE listings (id INTEGER PRIMARY KEY, listing_id INTEGER UNIQUE, latitude REAL, longitude REAL)"
+    )
+    migrate(conn, LISTINGS_MIGRATIONS)
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize("name", sorted(ANALYSIS_HOT_QUERIES))
+def test_analysis_queries_use_indexes(analysis_conn, name):
+    assert _full_scans(analysis_conn, ANALYSIS_HOT_QUERIES[name]) == []
+
+
+@pytest.mark.parametrize("name", sorted(LISTINGS_HOT_QUERIES))
+def test_listings_queries_use_indexes(listings_conn, name):
+    assert _full_scans(listings_conn, LISTINGS_HOT_QUERIES[name]) == []
+
+
+# --- Schema as the web app builds it (db.create_all), not the migration DDL ---
+
+MODEL_INDEX_QUERIES = {
+    "idx_listings_lat_lon": lambda m: m.db.select(m.Listing).where(
+        m.Listing.latitude.between(51.0, 51.2), m.Listing.longitude.between(16.9, 17.1)
+    ),
+    "idx_analysis_results_listing_id": lambda m: m.db.select(m.AnalysisResult).where(
+        m.AnalysisResult.listing_id == 1
+    ),
+    "idx_analysis_results_created_at": lambda m: m.db.select(m.AnalysisResult.analysis_id).where(
+        m.AnalysisResult.created_at > "2024-01-01"
+    ).order_by(m.AnalysisResult.created_at),
+}
+
+
+@pytest.fixture(scope="module")
+def models_app():
+    pytest.importorskip("flask_sqlalchemy")
+    from flask import Flask
+
+    import models
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
+    models.db.init_app(app)
+    with app.app_context():
+        models.db.create_all()
+        yield models
+
+
+@pytest.mark.parametrize("index", sorted(MODEL_INDEX_QUERIES))
+def test_model_queries_use_declared_indexes(models_app, index):
+    db = models_app.db
+    stmt = MODEL_INDEX_QUERIES[index](models_app)
+    sql = str(stmt.compile(db.engine, compile_kwargs={"literal_binds": True}))
+    plan = [row[3] for row in db.session.execute(db.text("EXPLAIN QUERY PLAN " + sql))]
+    assert any(index in step for step in plan), plan
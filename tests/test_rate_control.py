@@ -0,0 +1,54 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+from rate_control import AdaptiveLimit, HostThrottle, TokenBucket, parse_retry_after
+
+
+def test_token_bucket_holds_rate_across_threads():
+    bucket = TokenBucket(rate=100, burst=1)
+    start = time.monotonic()
+    threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(3)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # 24 tokens at 100/s with a burst of one: at least 0.23 s, however many threads share it.
+    assert time.monotonic() - start >= 0.22
+
+
+def test_aimd_backs_off_once_per_window_and_grows_additively():
+    now = [0.0]
+    limit = AdaptiveLimit(initial=8, maximum=16, cooldown=1.0, clock=lambda: now[0])
+    for _ in range(3):
+        limit.acquire()
+    assert limit.release(True) is True
+    assert limit.release(True) is False  # same burst of 429s counts once
+    assert limit.limit == 4
+    limit.release(False)
+    assert limit.limit == 4.25
+    now[0] = 2.0
+    limit.acquire()
+    limit.release(True)
+    assert limit.limit == 2.125 and limit.in_flight == 0
+
+
+def test_throttle_honours_retry_after_and_recovers_rate():
+    throttle = HostThrottle("www.otodom.pl", rate=10, burst=1)
+    throttle.acquire()
+    throttle.release(429, retry_after=0.2)
+    assert throttle.rate == 5
+    start = time.monotonic()
+    throttle.acquire()
+    assert time.monotonic() - start >= 0.19
+    throttle.release(200)
+    assert throttle.rate == 5.5
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480.0) == 10.0
+    assert parse_retry_after("soon") is None
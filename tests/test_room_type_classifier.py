@@ -0,0 +1,199 @@
+import base64
+import json
+import sys
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from analysis_store import ANALYSIS_RESULT_COLUMNS, AnalysisStore
+from migrations import migrate_analysis_db
+from ml.room_type_classifier import (
+    LocalRoomClassifier, collect_labels, extract_image_features, features_from_bytes,
+)
+
+
+def _jpeg(colour, seed=0, size=(64, 48)):
+    rng = np.random.default_rng(seed)
+    pixels = np.clip(np.array(colour) + rng.normal(0, 20, size[::-1] + (3,)), 0, 255).astype(np.uint8)
+    buf = BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def test_features_have_a_fixed_length_for_any_image():
+    rgb = extract_image_features(Image.open(BytesIO(_jpeg((200, 40, 40)))))
+    assert rgb.dtype == np.float32 and np.isfinite(rgb).all()
+    for image in (Image.new("L", (300, 20), 128), Image.new("RGBA", (1, 1)), Image.new("RGB", (5, 400))):
+        assert extract_image_features(image).shape == rgb.shape
+    assert np.array_equal(features_from_bytes(_jpeg((200, 40, 40))), rgb)
+
+
+def test_train_save_load_and_predict(tmp_path):
+    pytest.importorskip("sklearn")
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    X = [features_from_bytes(_jpeg((210, 60, 50), seed=i)) for i in range(8)]
+    X += [features_from_bytes(_jpeg((40, 70, 200), seed=i)) for i in range(8)]
+    y = ["kitchen"] * 8 + ["hallway"] * 8
+    pipeline = Pipeline([("scale", StandardScaler()), ("clf", LogisticRegression(max_iter=2000))])
+    pipeline.fit(np.stack(X), y)
+    LocalRoomClassifier(pipeline, list(pipeline.classes_)).save(str(tmp_path / "clf.joblib"))
+
+    clf = LocalRoomClassifier.load(str(tmp_path / "clf.joblib"))
+    assert sorted(clf.classes) == ["hallway", "kitchen"]
+    room_type, confidence = clf.predict_base64(base64.b64encode(_jpeg((40, 70, 200), seed=99)).decode())
+    assert room_type == "hallway" and 0.5 < confidence <= 1.0
+
+    import joblib
+    joblib.dump({"model": pipeline, "classes": clf.classes, "feature_version": 0}, tmp_path / "old.joblib")
+    with pytest.raises(ValueError):
+        LocalRoomClassifier.load(str(tmp_path / "old.joblib"))
+
+
+def _save(store, analysis_id, listing_url, raw):
+    row = [None] * len(ANALYSIS_RESULT_COLUMNS)
+    row[0], row[1] = analysis_id, listing_url
+    store.save_analysis(row, {"raw_gemini_response": json.dumps(raw)})
+
+
+def test_collect_labels_maps_image_index_to_listing_images(tmp_path):
+    db = str(tmp_path / "analysis.db")
+    migrate_analysis_db(db)
+    store = AnalysisStore(db)
+    # A batch response stored before image_url was recorded, and an individual-mode envelope.
+    _save(store, "a1", "https://otodom/1", [
+        {"image_index": 0, "room_type": "hallway", "gemini_seconds_per_image": 2.0},
+        {"image_index": 1, "room_type": "bathroom", "gemini_seconds_per_image": 2.0},
+        {"image_index": 5, "room_type": "garden"},
+    ])
+    _save(store, "a2", "https://otodom/2", {
+        "candidates": [{"content": {"parts": [{"text": json.dumps(
+            {"identified_room_type_id": "kitchen", "image_url": "https://img/k.jpg"})}]}}],
+        "gemini_seconds": 5.0,
+    })
+
+    fetched = []
+
+    def image_urls_for(listing_url):
+        fetched.append(listing_url)
+        return ["https://img/h.jpg", "https://img/b.jpg"]
+
+    labels, latency = collect_labels(db, image_urls_for)
+    assert labels == [("https://img/b.jpg", "bathroom"), ("https://img/h.jpg", "hallway"),
+                      ("https://img/k.jpg", "kitchen")]
+    assert fetched == ["https://otodom/1"]  # once per listing, only when an index needs resolving
+    assert latency == 2.0
+
+
+class _StubClassifier:
+    classes = ["hallway", "bathroom", "bedroom", "spaceship"]
+
+    def __init__(self, predictions):
+        self.predictions = predictions
+
+    def predict_base64(self, image_base64):
+        if image_base64 not in self.predictions:
+            raise OSError("cannot identify image file")
+        return self.predictions[image_base64]
+
+
+def test_classify_locally_keeps_only_confident_non_habitable_labels(tmp_path):
+    for module in ("requests", "bs4"):
+        pytest.importorskip(module)
+    sys.path.append(str(Path(__file__).resolve().parents[1]))
+    import analyze_the_rooms
+
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    analyzer = analyze_the_rooms.RoomAnalyzer("AIza" + "x" * 35, db_path=str(tmp_path / "analysis.db"),
+                                              local_confidence_threshold=0.85)
+    images = [(0, "u0", "hall"), (1, "u1", "bath"), (2, "u2", "bed"), (3, "u3", "broken"), (4, "u4", "ufo")]
+    assert analyzer._classify_locally(images) == ([], images)  # no model configured
+
+    analyzer.local_classifier = _StubClassifier({
+        "hall": ("hallway", 0.97),
+        "bath": ("bathroom", 0.6),  # below the threshold
+        "bed": ("bedroom", 0.99),  # habitable: Gemini assesses its condition
+        "ufo": ("spaceship", 0.99),  # not in the registry
+    })
+    local, remaining = analyzer._classify_locally(images)
+    assert [(e["image_index"], e["room_type_id"], e["confidence_score"]) for e in local] == [(0, "hallway", 0.97)]
+    assert local[0]["classified_locally"] and local[0]["is_habitable"] is False
+    assert remaining == images[1:]
+
+
+def test_gemini_response_records_call_time(tmp_path):
+    for module in ("requests", "bs4"):
+        pytest.importorskip(module)
+    sys.path.append(str(Path(__file__).resolve().parents[1]))
+    import analyze_the_rooms
+
+    class Response:
+        status_code = 200
+
+        def json(self):
+            return {"candidates": []}
+
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    analyzer = analyze_the_rooms.RoomAnalyzer("AIza" + "x" * 35, db_path=str(tmp_path / "analysis.db"))
+    analyzer.http.post = lambda *args, **kwargs: Response()
+    response = analyzer._make_gemini_request({"contents": [{"parts": [{"text": "hi"}]}]})
+    assert response["candidates"] == [] and 0 <= response["gemini_seconds"] < 5
+
+
+def _listing_analyzer(tmp_path, monkeypatch, predictions):
+    for module in ("requests", "bs4"):
+        pytest.importorskip(module)
+    sys.path.append(str(Path(__file__).resolve().parents[1]))
+    import analyze_the_rooms
+
+    urls = [f"https://img/{name}.jpg" for name in predictions]
+    monkeypatch.setattr(analyze_the_rooms, "get_listing_details", lambda url: {"image_urls": urls})
+    migrate_analysis_db(str(tmp_path / "analysis.db"))
+    analyzer = analyze_the_rooms.RoomAnalyzer("AIza" + "x" * 35, db_path=str(tmp_path / "analysis.db"),
+                                              enable_duplicate_detection=False, summary_mode="template")
+    analyzer._download_and_encode_image = lambda url: url.rsplit("/", 1)[1][:-4]
+    analyzer.local_classifier = _StubClassifier(predictions)
+    return analyzer
+
+
+def _stored(analyzer):
+    (analysis_id,) = analyzer.store.connection().execute("SELECT analysis_id FROM analysis_results").fetchall()[0]
+    return (json.loads(analyzer.store.get_payload(analysis_id, "room_summary")),
+            analyzer.store.get_payload(analysis_id, "raw_gemini_response"))
+
+
+def test_all_local_listing_is_saved_without_gemini(tmp_path, monkeypatch):
+    analyzer = _listing_analyzer(tmp_path, monkeypatch, {"hall": ("hallway", 0.97), "bath": ("bathroom", 0.95)})
+    analyzer._analyze_all_images_batch = lambda batch: pytest.fail("Gemini called")
+
+    results = analyzer.analyze_listing_rooms("https://otodom/1")
+    assert results["locally_classified_images"] == 2
+    room_summary, raw = _stored(analyzer)
+    assert room_summary == {"bathroom": 1, "hallway": 1}
+    assert raw is None
+
+
+def test_mixed_listing_summary_counts_local_rooms(tmp_path, monkeypatch):
+    analyzer = _listing_analyzer(tmp_path, monkeypatch, {"hall": ("hallway", 0.97), "bed": ("bedroom", 0.99)})
+    gemini_entry = {"image_index": 1, "room_type": "bedroom", "condition": "Good", "image_url": "https://img/bed.jpg"}
+
+    def batch(images):
+        assert [index for index, _, _ in images] == [1]
+        return [{"image_index": 1, "image_url": "https://img/bed.jpg", "room_type_id": "bedroom",
+                 "room_type_details": None, "is_habitable": True, "same_room_as": [], "is_duplicate": False}], \
+            [gemini_entry]
+
+    analyzer._analyze_all_images_batch = batch
+    results = analyzer.analyze_listing_rooms("https://otodom/1")
+    assert results["property_summary"]["room_counts"] == {"bedroom": 1, "hallway": 1}
+    room_summary, raw = _stored(analyzer)
+    assert room_summary == {"bedroom": 1, "hallway": 1}
+    assert json.loads(raw) == [gemini_entry]  # local labels stay out of the training corpus
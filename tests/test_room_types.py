@@ -0,0 +1,44 @@
+import json
+import os
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+from room_types import RoomTypeRegistry
+
+
+def _write(path, room_types, mtime):
+    path.write_text(json.dumps(room_types), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_registry_index_and_prompt(tmp_path):
+    path = tmp_path / "room_types.json"
+    _write(path, [
+        {"id": "kitchen", "name": "Mutfak", "is_habitable": False},
+        {"id": "bedroom", "name": "Yatak Odası", "is_habitable": True},
+    ], 1_000_000)
+    registry = RoomTypeRegistry(str(path), check_interval=0)
+
+    assert registry.get("bedroom")["name"] == "Yatak Odası"
+    assert registry.get("missing") is None
+    assert registry.habitable_ids == {"bedroom"}
+    assert "- kitchen: Mutfak" in registry.prompt_section
+
+
+def test_registry_reloads_on_mtime_change(tmp_path):
+    path = tmp_path / "room_types.json"
+    _write(path, [{"id": "kitchen", "name": "Mutfak"}], 1_000_000)
+    registry = RoomTypeRegistry(str(path), check_interval=0)
+    assert registry.get("balcony") is None
+
+    _write(path, [{"id": "balcony", "name": "Balkon"}], 1_000_100)
+    assert registry.get("balcony")["name"] == "Balkon"
+    assert registry.get("kitchen") is None
+
+
+def test_registry_missing_file(tmp_path):
+    registry = RoomTypeRegistry(str(tmp_path / "nope.json"), check_interval=0)
+    assert registry.room_types == []
+    assert registry.prompt_section == "Known room types are currently unavailable."
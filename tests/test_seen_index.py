@@ -0,0 +1,70 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+from seen_index import ListingChunk, SeenIndex, search_item_hash, split_unchanged
+
+ITEM = {
+    "id": 1,
+    "name": "2 pokoje",
+    "price": {"value": 500000, "currency": "PLN"},
+    "images": [{"large": "a.jpg"}, {"small": "b.jpg"}],
+    "parameters": [{"key": "floor", "value": "3"}, {"key": "rooms", "value": "TWO"}],
+    "slug": "ignored-field",
+}
+
+
+def test_hash_is_canonical_and_tracks_listing_fields():
+    reordered = {**ITEM, "parameters": list(reversed(ITEM["parameters"])), "slug": "other"}
+    assert search_item_hash(reordered) == search_item_hash(ITEM)
+    assert search_item_hash({**ITEM, "price": {"value": 490000, "currency": "PLN"}}) != search_item_hash(ITEM)
+    assert search_item_hash({**ITEM, "images": ITEM["images"][:1]}) != search_item_hash(ITEM)
+
+
+def test_split_unchanged_against_index():
+    index = SeenIndex(client=SimpleNamespace())  # in-process fallback
+    index.mark([("1", search_item_hash(ITEM)), ("2", "stale")], seen_at=0)
+
+    entries, unchanged = split_unchanged(index, [ITEM, {**ITEM, "id": 2}, {**ITEM, "id": 3}])
+    assert [state for _, _, state in entries] == ["unchanged", "changed", "new"]
+    assert unchanged == [("1", search_item_hash(ITEM))]
+
+    assert index.prune(now=index.retention_s + 1) == 2
+    assert index.lookup(["1", "2"]) == {}
+
+
+def test_listing_chunk_marks_only_on_commit():
+    index = SeenIndex(client=SimpleNamespace())
+    combined = ListingChunk()
+    combined.absorb(ListingChunk([{"id": "1"}], index, [("1", "h1")]))
+    combined.absorb([{"id": "2"}])  # plain lists carry nothing to mark
+    assert len(combined) == 2 and index.lookup(["1"]) == {}
+
+    assert combined.commit() == 1
+    assert index.lookup(["1", "2"]) == {"1": "h1"}
+    assert combined.commit() == 0
+
+
+def test_failed_sink_leaves_chunk_unmarked():
+    pytest.importorskip("pandas")
+    from scrape_sinks import persist_stream
+
+    class Sink:
+        def __init__(self, fail):
+            self.fail = fail
+
+        def write(self, listings):
+            if self.fail and listings[0]["id"] == "2":
+                raise RuntimeError("db down")
+
+        def close(self):
+            pass
+
+    index = SeenIndex(client=SimpleNamespace())
+    chunks = [ListingChunk([{"id": "1"}], index, [("1", "a")]), ListingChunk([{"id": "2"}], index, [("2", "b")])]
+    assert persist_stream(chunks, [Sink(False), Sink(True)]) == 2
+    assert index.lookup(["1", "2"]) == {"1": "a"}  # "2" is scraped again next run
@@ -0,0 +1,59 @@
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).resolve().parents[1] / "back_end"))
+
+pytest.importorskip("pandas")
+pytest.importorskip("flask_sqlalchemy")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Listing, db
+from store_listings import prepare_listing_rows, upsert_listings
+
+
+def test_prepare_listing_rows_coerces_columns():
+    rows = prepare_listing_rows([
+        {"id": "101", "price": "450 000 zł", "price_per_sqm": 9000.0, "rooms": "TWO", "images": ["a", "b"],
+         "date_created": "2026-03-01T10:00:00Z", "is_private_owner": 1, "street_name": None, "city_name": "Wrocław"},
+        {"id": 102, "price": 512000, "rooms": 3, "images": [], "date_created": "2026-03-02 08:30:00",
+         "is_private_owner": False},
+        {"id": "not-a-number", "price": 1},
+        {"id": "101", "price": "440 000 zł", "rooms": "TWO", "date_created": "garbage"},  # later duplicate wins
+    ])
+    by_id = {r["listing_id"]: r for r in rows}
+    assert set(by_id) == {101, 102}
+
+    assert (by_id[101]["price"], by_id[102]["price"]) == ("440 000 zł", "512000")
+    assert by_id[101]["price_per_m2"] is None
+    assert (by_id[101]["rooms"], by_id[102]["rooms"]) == (2, 3)
+    assert by_id[101]["date_created"] is None
+    assert by_id[102]["date_created"] == datetime(2026, 3, 2, 8, 30)
+    assert by_id[102]["image_count"] is None
+    assert (by_id[101]["is_private_owner"], by_id[102]["is_private_owner"]) == (None, False)
+
+    first = prepare_listing_rows([{"id": "101", "price": "450000.0", "price_per_sqm": 9000.5, "rooms": "FIVE",
+                                   "images": ["a"], "date_created": "2026-03-01T10:00:00Z", "is_private_owner": 1,
+                                   "city_name": "Wrocław"}])[0]
+    assert (first["price"], first["price_per_m2"], first["rooms"]) == ("450000", "9000.5", 5)
+    assert first["date_created"] == datetime(2026, 3, 1, 10, 0)  # UTC, stored naive
+    assert (first["image_count"], first["is_private_owner"], first["location_string"]) == (1, True, "Wrocław")
+    assert all(type(first[c]) is int for c in ("listing_id", "rooms", "image_count"))
+
+
+def test_upsert_splits_existing_ids_across_chunks(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'otodom.db'}")
+    db.Model.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    assert upsert_listings([{"id": i, "price": 100 * i} for i in (1, 3, 5)], session) == {"inserted": 3, "updated": 0}
+    counts = upsert_listings([{"id": i, "price": 200 * i, "rooms": "ONE"} for i in range(1, 7)], session, chunk_size=2)
+    assert counts == {"inserted": 3, "updated": 3}
+
+    stored = {l.listing_id: (l.price, l.rooms) for l in session.query(Listing)}
+    assert stored == {i: (str(200 * i), 1) for i in range(1, 7)}
+    assert session.query(Listing).count() == 6